@@ -0,0 +1,210 @@
+"""
+An :mod:`asyncio` front-end that batches concurrent queries.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any
+
+from .exceptions import RTreeError
+from .index import Index
+
+__all__ = ["AsyncIndex"]
+
+
+class _Batch:
+    """Queries waiting to be sent to the index together."""
+
+    __slots__ = ("mins", "maxs", "futures", "timer")
+
+    def __init__(self) -> None:
+        self.mins: list[list[float]] = []
+        self.maxs: list[list[float]] = []
+        self.futures: list[asyncio.Future] = []
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class AsyncIndex:
+    """Awaitable queries against an :class:`~rtree.index.Index`.
+
+    Calling :meth:`rtree.index.Index.intersection` from a coroutine blocks
+    the event loop for the duration of the query.  Queries awaited on an
+    :class:`AsyncIndex` are instead collected for up to ``max_delay``
+    seconds, or until ``max_batch`` of them are waiting, and answered by a
+    single :meth:`~rtree.index.Index.intersection_v` or
+    :meth:`~rtree.index.Index.nearest_v` call on a worker thread.  Each
+    caller receives its own slice of the batch result.
+
+    Only ids are returned, as the batch query methods do not return stored
+    objects.
+
+    ::
+
+        >>> import asyncio
+        >>> from rtree import index
+        >>> from rtree.aio import AsyncIndex
+        >>> idx = index.Index()
+        >>> idx.insert(1, (0, 0, 1, 1))
+        >>> idx.insert(2, (5, 5, 6, 6))
+        >>> async def main():
+        ...     async with AsyncIndex(idx) as aidx:
+        ...         return await asyncio.gather(
+        ...             aidx.intersection((0, 0, 2, 2)),
+        ...             aidx.nearest((6, 6), 1),
+        ...         )
+        >>> asyncio.run(main())
+        [[1], [2]]
+    """
+
+    def __init__(
+        self,
+        index: Index,
+        *,
+        max_batch: int = 256,
+        max_delay: float = 0.001,
+        executor: Executor | None = None,
+    ) -> None:
+        """
+        :param index: The index to query.
+
+        :param max_batch: The number of waiting queries that triggers a batch
+            immediately.
+
+        :param max_delay: The longest time in seconds a query waits for
+            others to join its batch.
+
+        :param executor: The executor batches run on.  Defaults to a
+            dedicated single-thread executor, so that the index is never
+            queried from two threads at once.
+        """
+        if max_batch < 1:
+            raise ValueError("max_batch must be >= 1")
+        self.index = index
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self._batches: dict[tuple[Any, ...], _Batch] = {}
+        self._closed = False
+
+    async def __aenter__(self) -> AsyncIndex:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Send the waiting queries, and shut down the worker thread if it
+        is owned by this object.
+
+        Outside of a running event loop, waiting queries cannot be sent and
+        fail with :class:`~rtree.exceptions.RTreeError` instead.
+        """
+        self._closed = True
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            for batch in self._batches.values():
+                if batch.timer is not None:
+                    batch.timer.cancel()
+                for future in batch.futures:
+                    if not future.done():
+                        future.set_exception(RTreeError("AsyncIndex is closed"))
+            self._batches.clear()
+        else:
+            for key in list(self._batches):
+                self._flush(key)
+        if self._own_executor:
+            # Batches already sent still run
+            self.executor.shutdown(wait=False)
+
+    def _split(self, coordinates: Any) -> tuple[list[float], list[float]]:
+        dimension = self.index.properties.dimension
+        p, q = self.index._split_coordinates(coordinates)
+        if len(p) != dimension or len(q) != dimension:
+            raise RTreeError(
+                f"Coordinates must have {dimension} or {2 * dimension} values"
+            )
+        if not p <= q:
+            raise RTreeError("Coordinates must not have minimums more than maximums")
+        return p, q
+
+    def _submit(self, key: tuple[Any, ...], coordinates: Any) -> asyncio.Future:
+        if self._closed:
+            raise RTreeError("AsyncIndex is closed")
+        loop = asyncio.get_running_loop()
+        p, q = self._split(coordinates)
+
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch()
+            batch.timer = loop.call_later(self.max_delay, self._flush, key)
+        future = loop.create_future()
+        batch.mins.append(p)
+        batch.maxs.append(q)
+        batch.futures.append(future)
+        if len(batch.futures) >= self.max_batch:
+            self._flush(key)
+        return future
+
+    def _flush(self, key: tuple[Any, ...]) -> None:
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(self.executor, self._run, key, batch)
+        task.add_done_callback(lambda task: self._deliver(batch, task))
+
+    def _run(self, key: tuple[Any, ...], batch: _Batch) -> list[list[int]]:
+        import numpy as np
+
+        mins = np.array(batch.mins, dtype=np.float64)
+        maxs = np.array(batch.maxs, dtype=np.float64)
+        kind = key[0]
+        if kind == "intersection":
+            ids, counts = self.index.intersection_v(mins, maxs)
+        else:
+            ids, counts = self.index.nearest_v(mins, maxs, num_results=key[1])
+        offsets = np.cumsum(counts.astype(np.int64))
+        return [part.tolist() for part in np.split(ids, offsets[:-1])]
+
+    @staticmethod
+    def _deliver(batch: _Batch, task: asyncio.Future) -> None:
+        if task.cancelled():
+            for future in batch.futures:
+                future.cancel()
+            return
+        error = task.exception()
+        if error is not None:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for future, result in zip(batch.futures, task.result()):
+            if not future.done():
+                future.set_result(result)
+
+    async def intersection(self, coordinates: Any) -> list[int]:
+        """Return the ids of entries that intersect the given coordinates.
+        See :meth:`rtree.index.Index.intersection`.
+
+        :param coordinates: A point or bounding box in the ordering given by
+            the index's :attr:`~rtree.index.Index.interleaved` attribute.
+        """
+        return await self._submit(("intersection",), coordinates)
+
+    async def nearest(self, coordinates: Any, num_results: int = 1) -> list[int]:
+        """Return the ids of the ``k``-nearest entries to the given
+        coordinates.  See :meth:`rtree.index.Index.nearest`.
+
+        :param coordinates: A point or bounding box in the ordering given by
+            the index's :attr:`~rtree.index.Index.interleaved` attribute.
+
+        :param num_results: The number of results to return.  Equidistant
+            entries are all returned.
+        """
+        return await self._submit(("nearest", num_results), coordinates)
@@ -0,0 +1,213 @@
+"""
+Many named indexes in one storage.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import json
+from collections.abc import Iterator
+from typing import Any
+
+from . import core
+from .exceptions import RTreeError
+from .index import CustomStorage, Index, Property
+from .storage import CachedStorage, MmapStorage
+
+__all__ = ["IndexCatalog"]
+
+# The catalog page starts with this magic, followed by the JSON encoded
+# mapping of index names to index ids.
+_CATALOG_MAGIC = b"RTREECAT"
+
+
+class _CatalogStorage(CustomStorage):
+    """The view of the shared storage given to one index of a catalog."""
+
+    def __init__(self, shared: CachedStorage, exists: bool) -> None:
+        self.shared = shared
+        self.exists = exists
+
+    def create(self, returnError):
+        pass
+
+    def destroy(self, returnError):
+        pass
+
+    def flush(self, returnError):
+        self.shared.flush(returnError)
+
+    def loadByteArray(self, page, returnError):
+        return self.shared.loadByteArray(page, returnError)
+
+    def storeByteArray(self, page, data, returnError):
+        return self.shared.storeByteArray(page, data, returnError)
+
+    def deleteByteArray(self, page, returnError):
+        self.shared.deleteByteArray(page, returnError)
+
+    @property
+    def hasData(self):
+        return self.exists
+
+
+class IndexCatalog:
+    """Named :class:`~rtree.index.Index` objects that share one storage and
+    one page cache.
+
+    libspatialindex can keep several trees in one storage, each identified
+    by the page id of its header.  The catalog records the id of every index
+    under its name in a page of the storage, opens indexes when they are
+    first used, and places a single :class:`~rtree.storage.CachedStorage` of
+    ``max_bytes`` in front of the storage for all of them.  Many small
+    indexes then need neither a pair of files each nor a page cache each.
+    Each index still keeps its own buffer of ``buffering_capacity`` pages in
+    libspatialindex.
+
+    The storage must be empty or hold a catalog, and must assign the id 0
+    to the first page stored in it, which holds the catalog.  All storages
+    in :mod:`rtree.storage` do.
+
+    ::
+
+        >>> import os, tempfile
+        >>> from rtree.catalog import IndexCatalog
+        >>> filename = os.path.join(tempfile.mkdtemp(), "layers.rtm")
+        >>> with IndexCatalog(filename) as catalog:
+        ...     roads = catalog.create("roads")
+        ...     roads.insert(1, (0, 0, 1, 1))
+        ...     rivers = catalog.create("rivers")
+        ...     rivers.insert(2, (5, 5, 6, 6))
+        >>> with IndexCatalog(filename) as catalog:
+        ...     sorted(catalog), catalog["rivers"].count((0, 0, 10, 10))
+        (['rivers', 'roads'], 1)
+    """
+
+    def __init__(
+        self, storage: CustomStorage | str, max_bytes: int = 16 * 2**20
+    ) -> None:
+        """
+        :param storage: The storage that holds the indexes, or the filename
+            of an :class:`~rtree.storage.MmapStorage` to open for them.
+
+        :param max_bytes: The size of the page cache shared by all indexes.
+        """
+        self._owned: MmapStorage | None = None
+        if isinstance(storage, str):
+            storage = self._owned = MmapStorage(storage)
+        self.storage = storage
+        self.cache = CachedStorage(storage, max_bytes=max_bytes)
+        self._ids: dict[str, int] = {}
+        self._indexes: dict[str, Index] = {}
+        try:
+            if storage.hasData:
+                self._read_catalog()
+            else:
+                self._write_catalog(CustomStorage.NewPage)
+        except Exception:
+            self._close_storage()
+            raise
+
+    def _call(self, method: Any, *args: Any) -> Any:
+        error = ctypes.pointer(ctypes.c_int(0))
+        result = method(*args, error)
+        if error.contents.value != CustomStorage.NoError:
+            raise RTreeError(f"Catalog storage error {error.contents.value}")
+        return result
+
+    def _read_catalog(self) -> None:
+        data = self._call(self.cache.loadByteArray, 0)
+        if bytes(data[: len(_CATALOG_MAGIC)]) != _CATALOG_MAGIC:
+            raise RTreeError("Storage does not hold an index catalog")
+        self._ids = json.loads(bytes(data[len(_CATALOG_MAGIC) :]))
+
+    def _write_catalog(self, page: int = 0) -> None:
+        data = _CATALOG_MAGIC + json.dumps(self._ids).encode()
+        page = self._call(self.cache.storeByteArray, page, data)
+        if page != 0:
+            raise RTreeError("The catalog must be the first page of the storage")
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ids)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._ids
+
+    def __getitem__(self, name: str) -> Index:
+        return self.open(name)
+
+    def open(self, name: str, **kwargs: Any) -> Index:
+        """Return the index of the given name, opening it on first use.
+
+        :param name: The name of the index.
+
+        :param kwargs: Keyword arguments for :class:`~rtree.index.Index`,
+            such as ``interleaved``, used when the index is opened.  The
+            properties of the index are read from the storage.
+        """
+        index = self._indexes.get(name)
+        if index is not None:
+            return index
+        if name not in self._ids:
+            raise KeyError(name)
+        properties = kwargs.pop("properties", None) or Property()
+        properties.index_id = self._ids[name]
+        index = Index(
+            _CatalogStorage(self.cache, True), properties=properties, **kwargs
+        )
+        # The dimension and capacities are those stored with the tree
+        index.properties = Property(
+            core.rt.Index_GetProperties(index.handle), owned=True
+        )
+        self._indexes[name] = index
+        return index
+
+    def create(self, name: str, **kwargs: Any) -> Index:
+        """Create a new, empty index of the given name and return it.
+
+        :param name: The name of the index.
+
+        :param kwargs: Keyword arguments for :class:`~rtree.index.Index`,
+            such as ``properties`` or ``interleaved``.
+        """
+        if name in self._ids:
+            raise ValueError(f"index {name!r} already exists")
+        index = Index(_CatalogStorage(self.cache, False), **kwargs)
+        handle = core.rt.Index_GetProperties(index.handle)
+        self._ids[name] = Property(handle, owned=True).index_id
+        self._indexes[name] = index
+        self._write_catalog()
+        return index
+
+    def stats(self) -> dict[str, Any]:
+        """Return the statistics of the shared page cache.  See
+        :meth:`rtree.storage.CachedStorage.stats`."""
+        return self.cache.stats()
+
+    def flush(self) -> None:
+        """Write the open indexes and the cached pages to the storage."""
+        for index in self._indexes.values():
+            index.flush()
+        self._call(self.cache.flush)
+
+    def close(self) -> None:
+        """Close the open indexes and write the cached pages to the
+        storage, which is closed if it was opened by the catalog."""
+        for index in self._indexes.values():
+            index.close()
+        self._indexes.clear()
+        self._call(self.cache.flush)
+        self._close_storage()
+
+    def _close_storage(self) -> None:
+        if self._owned is not None:
+            self._owned.close()
+
+    def __enter__(self) -> IndexCatalog:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
@@ -0,0 +1,304 @@
+"""
+A bulk-loaded index with a small mutable overlay for updates.
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+from collections.abc import Iterator
+from concurrent.futures import Executor, Future
+from typing import Any
+
+from .index import Index, Property
+from .parallel import _box_distance, _prepare_entries
+
+__all__ = ["DeltaIndex"]
+
+
+class DeltaIndex:
+    """An index kept fast under continuous updates by bulk loading.
+
+    Entries live in three tiers: a large base index bulk loaded from
+    arrays, a small in-memory delta index that takes new inserts, and a set
+    of tombstones that hide deleted entries of the base.  Queries merge the
+    results of the tiers.  When the delta and the tombstones together reach
+    ``max_delta`` entries, the index is compacted: the base is bulk loaded
+    again with the deleted entries left out and the delta entries added.
+    Compactions run on ``executor`` if one is given, and updates and
+    queries continue meanwhile against the delta being compacted, which is
+    kept until the new base replaces the old one.
+
+    Entry ids must be unique, as deletes hide entries of the base by id.
+    Only ids are returned, and coordinates are in interleaved order.
+
+    ::
+
+        >>> import numpy as np
+        >>> from rtree.delta import DeltaIndex
+        >>> mins = np.array([[0.0, 0.0], [5.0, 5.0]])
+        >>> idx = DeltaIndex(np.arange(2), mins, mins + 1, max_delta=2)
+        >>> idx.insert(2, (0.5, 0.5, 1.5, 1.5))
+        >>> idx.delete(0, (0, 0, 1, 1))
+        >>> sorted(idx.intersection((0, 0, 2, 2)))
+        [2]
+        >>> idx.delta_size
+        0
+    """
+
+    def __init__(
+        self,
+        ids=None,
+        mins=None,
+        maxs=None,
+        *,
+        max_delta: int = 10000,
+        properties: Property | None = None,
+        executor: Executor | None = None,
+    ) -> None:
+        """
+        :param ids: A NumPy array of shape `(n,)` of the ids of the initial
+            entries, if any.
+
+        :param mins: A NumPy array of shape `(n, d)` of entry minima.
+
+        :param maxs: A NumPy array of shape `(n, d)` of entry maxima.
+
+        :param max_delta: The number of inserted and deleted entries that
+            triggers a compaction.
+
+        :param properties: An :class:`~rtree.index.Property` object used for
+            the tiers.  Its dimension is set from the input arrays.
+
+        :param executor: An executor that compactions run on.  By default,
+            they run in the call to :meth:`insert` or :meth:`delete` that
+            triggers them.
+        """
+        import numpy as np
+
+        if max_delta < 1:
+            raise ValueError("max_delta must be >= 1")
+        self.properties = (
+            copy.deepcopy(properties) if properties is not None else Property()
+        )
+        if ids is None:
+            dimension = self.properties.dimension
+            ids = np.empty(0, dtype=np.int64)
+            mins = maxs = np.empty((0, dimension), dtype=np.float64)
+        else:
+            ids, mins, maxs = _prepare_entries(ids, mins, maxs)
+            self.properties.dimension = mins.shape[1]
+        self.max_delta = max_delta
+        self.executor = executor
+
+        self._lock = threading.Lock()
+        self._base = (ids, mins, maxs)
+        self._base_index = self._build(ids, mins, maxs)
+        # The delta being compacted into a new base, and the tombstones of
+        # the old base that the new one leaves out.
+        self._frozen: dict[int, tuple[list, list]] = {}
+        self._frozen_index: Index | None = None
+        self._dead_base: set[int] = set()
+        self._delta: dict[int, tuple[list, list]] = {}
+        self._delta_index = Index(properties=copy.deepcopy(self.properties))
+        self._dead: set[int] = set()
+        self._compacting = False
+        self._compaction: Future | None = None
+
+    def _build(self, ids, mins, maxs) -> Index:
+        properties = copy.deepcopy(self.properties)
+        if not len(ids):
+            return Index(properties=properties)
+        return Index((ids, mins, maxs), properties=properties)
+
+    def _split(self, coordinates: Any) -> tuple[list, list]:
+        dimension = self.properties.dimension
+        coordinates = [float(c) for c in coordinates]
+        if len(coordinates) == dimension:
+            return coordinates, coordinates
+        return coordinates[:dimension], coordinates[dimension:]
+
+    def _tiers(self) -> list[tuple[Index, tuple[set[int], ...]]]:
+        # The tiers with the tombstones that apply to each of them
+        with self._lock:
+            tiers: list[tuple[Index, tuple[set[int], ...]]] = [
+                (self._base_index, (self._dead_base, self._dead))
+            ]
+            if self._frozen_index is not None:
+                tiers.append((self._frozen_index, (self._dead,)))
+            tiers.append((self._delta_index, ()))
+            return tiers
+
+    @property
+    def delta_size(self) -> int:
+        """The number of inserted and deleted entries since the last
+        compaction"""
+        return len(self._delta) + len(self._dead)
+
+    def __len__(self) -> int:
+        import numpy as np
+
+        with self._lock:
+            ids = self._base[0]
+            dead = np.fromiter(self._dead_base | self._dead, dtype=np.int64)
+            frozen = sum(1 for id in self._frozen if id not in self._dead)
+            return int((~np.isin(ids, dead)).sum()) + frozen + len(self._delta)
+
+    def __repr__(self) -> str:
+        return f"rtree.delta.DeltaIndex(size={len(self)}, delta={self.delta_size})"
+
+    def insert(self, id: int, coordinates: Any) -> None:
+        """Insert an entry into the delta.
+
+        :param id: The id of the entry.
+
+        :param coordinates: The point or box of the entry.
+        """
+        mins, maxs = self._split(coordinates)
+        with self._lock:
+            self._delta_index.insert(id, mins + maxs)
+            self._delta[id] = (mins, maxs)
+        self._maybe_compact()
+
+    def delete(self, id: int, coordinates: Any) -> None:
+        """Delete an entry, from the delta if it was inserted since the last
+        compaction, and otherwise by a tombstone.
+
+        :param id: The id of the entry.
+
+        :param coordinates: The point or box of the entry.
+        """
+        with self._lock:
+            if id in self._delta:
+                mins, maxs = self._delta.pop(id)
+                self._delta_index.delete(id, mins + maxs)
+            else:
+                self._dead.add(id)
+        self._maybe_compact()
+
+    def intersection(self, coordinates: Any) -> Iterator[int]:
+        """Return the ids of entries intersecting the given coordinates, see
+        :meth:`rtree.index.Index.intersection`."""
+        for index, dead in self._tiers():
+            for id in index.intersection(coordinates):
+                if not any(id in tombstones for tombstones in dead):
+                    yield id
+
+    def count(self, coordinates: Any) -> int:
+        """Return the number of entries intersecting the given coordinates,
+        see :meth:`rtree.index.Index.count`."""
+        total = 0
+        for index, dead in self._tiers():
+            if any(dead):
+                total += sum(
+                    1
+                    for id in index.intersection(coordinates)
+                    if not any(id in tombstones for tombstones in dead)
+                )
+            else:
+                total += index.count(coordinates)
+        return total
+
+    def nearest(self, coordinates: Any, num_results: int = 1) -> list[int]:
+        """Return the ids of the ``num_results`` entries nearest to the
+        given coordinates, closest first, see
+        :meth:`rtree.index.Index.nearest`.  Unlike there, equidistant
+        entries beyond ``num_results`` are not returned."""
+        import numpy as np
+
+        ids = []
+        boxes = []
+        for index, dead in self._tiers():
+            hidden = sum(len(tombstones) for tombstones in dead)
+            for item in index.nearest(coordinates, num_results + hidden, True):
+                if not any(item.id in tombstones for tombstones in dead):
+                    ids.append(item.id)
+                    boxes.append(item.bbox)
+        if not ids:
+            return []
+        dimension = self.properties.dimension
+        qmins, qmaxs = (np.array(c) for c in self._split(coordinates))
+        bounds = np.array(boxes, dtype=np.float64)
+        distances = _box_distance(
+            qmins, qmaxs, bounds[:, :dimension], bounds[:, dimension:]
+        )
+        order = np.argsort(distances, kind="stable")[:num_results]
+        return [ids[i] for i in order]
+
+    def _maybe_compact(self) -> None:
+        if not self._compacting and self.delta_size >= self.max_delta:
+            self.compact()
+
+    def compact(self) -> Future | None:
+        """Bulk load a new base from the current base and delta.
+
+        :return: The future of the compaction if it runs on the executor.
+        """
+        with self._lock:
+            if self._compacting:
+                return self._compaction
+            if not self._delta and not self._dead:
+                return None
+            self._compacting = True
+            self._frozen, self._delta = self._delta, {}
+            self._frozen_index = self._delta_index
+            self._delta_index = Index(properties=copy.deepcopy(self.properties))
+            self._dead_base, self._dead = self._dead, set()
+            args = (self._base, dict(self._frozen), set(self._dead_base))
+            if self.executor is not None:
+                self._compaction = self.executor.submit(self._rebuild, *args)
+                return self._compaction
+        self._rebuild(*args)
+        return None
+
+    def _rebuild(self, base, frozen, dead) -> None:
+        import numpy as np
+
+        try:
+            ids, mins, maxs = base
+            keep = ~np.isin(ids, np.fromiter(dead, dtype=np.int64))
+            dimension = self.properties.dimension
+            boxes = np.array(list(frozen.values()), dtype=np.float64)
+            boxes = boxes.reshape(len(frozen), 2, dimension)
+            ids = np.concatenate(
+                [ids[keep], np.fromiter(frozen, dtype=np.int64, count=len(frozen))]
+            )
+            mins = np.concatenate([mins[keep], boxes[:, 0]])
+            maxs = np.concatenate([maxs[keep], boxes[:, 1]])
+            index = self._build(ids, mins, maxs)
+        except BaseException:
+            self._thaw()
+            raise
+        with self._lock:
+            self._base = (ids, mins, maxs)
+            self._base_index = index
+            self._frozen = {}
+            self._frozen_index = None
+            self._dead_base = set()
+            self._compacting = False
+
+    def _thaw(self) -> None:
+        # Return the entries of a failed compaction to the delta
+        with self._lock:
+            for id, (mins, maxs) in self._frozen.items():
+                if id not in self._dead and id not in self._delta:
+                    self._delta_index.insert(id, mins + maxs)
+                    self._delta[id] = (mins, maxs)
+            self._dead |= self._dead_base
+            self._frozen = {}
+            self._frozen_index = None
+            self._dead_base = set()
+            self._compacting = False
+
+    def close(self) -> None:
+        """Wait for a running compaction and close the tiers."""
+        if self._compaction is not None:
+            self._compaction.exception()
+        for index, _ in self._tiers():
+            index.close()
+
+    def __enter__(self) -> DeltaIndex:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
@@ -1,12 +1,26 @@
 from __future__ import annotations
 
+import contextlib
+import copyreg
 import ctypes
+import glob
+import itertools
+import json
+import math
 import os
 import os.path
 import pickle
 import pprint
+import queue
+import struct
+import sys
+import tempfile
+import threading
+import time
 import warnings
+from collections import OrderedDict
 from collections.abc import Iterator, Sequence
+from concurrent.futures import Executor, Future
 from typing import Any, Literal, overload
 
 from . import core
@@ -35,6 +49,21 @@ if (major_version, minor_version, patch_version) < (1, 8, 5):
 
 __all__ = ["Rtree", "Index", "Property"]
 
+# Snapshots written by Index.to_bytes start with this magic and a header of
+# the format version and the length of the pickled metadata that follows.
+_SNAPSHOT_MAGIC = b"RTREESNP"
+_SNAPSHOT_HEADER = struct.Struct("<8sIQ")
+_SNAPSHOT_VERSION = 1
+# Properties tied to the storage of the snapshotted index are not restored.
+_SNAPSHOT_STORAGE_KEYS = (
+    "custom_storage_callbacks",
+    "custom_storage_callbacks_size",
+    "filename",
+    "index_id",
+    "overwrite",
+    "storage",
+)
+
 
 def _get_bounds(handle, bounds_fn, interleaved):
     pp_mins = ctypes.pointer(ctypes.c_double())
@@ -75,9 +104,99 @@ def _get_data(handle):
     return s
 
 
+def _prefetch(iterable, depth=1):
+    """Iterate over ``iterable`` on a background thread that keeps up to
+    ``depth`` items ready ahead of the consumer.  Exceptions raised while
+    producing items are re-raised in the consumer."""
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as exc:
+            put((done, exc))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, exc = items.get()
+            if item is done:
+                if exc is not None:
+                    raise exc
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _read_ahead(filename, max_bytes=None):
+    """Read a file in order so that it is in the operating system's page
+    cache, and return the number of bytes read."""
+    size = os.path.getsize(filename)
+    if max_bytes is not None:
+        size = min(size, max_bytes)
+    buffer = bytearray(min(size, 2**20))
+    read = 0
+    with open(filename, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, size, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(f.fileno(), 0, size, os.POSIX_FADV_WILLNEED)
+        with memoryview(buffer) as view:
+            while read < size:
+                n = f.readinto(view[: size - read])
+                if not n:
+                    break
+                read += n
+    return read
+
+
+class _Repack:
+    """The changes made to an index while it is being repacked."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.log: list | None = []
+
+    @contextlib.contextmanager
+    def capture(self, method, args):
+        # Apply the change under the lock, so that it is not lost when the
+        # repacked handle replaces the old one, and record it for replay.
+        with self.lock:
+            yield
+            if self.log is not None:
+                self.log.append((method, args))
+
+
+_NO_REPACK = contextlib.nullcontext()
+
+
 class Index:
     """An R-Tree, MVR-Tree, or TPR-Tree indexing object"""
 
+    cache: QueryCache | None = None
+    _pending: list | None = None
+    _repack: _Repack | None = None
+    # The number of entries, or None until it is counted
+    _size: int | None = None
+    _size_saved = False
+    _size_stamp: list[list[int]] | None = None
+
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         """Creates a new index
 
@@ -128,6 +247,10 @@ class Index:
             to ensure compatibility with previous versions of the library.  All
             other properties must be set on the object.
 
+        :param cache: An optional :class:`QueryCache` that keeps the results
+            of repeated :meth:`intersection`, :meth:`nearest` and
+            :meth:`count` queries until the index is modified.
+
         .. warning::
             The coordinate ordering for all functions are sensitive the
             index's :attr:`interleaved` data member.  If :attr:`interleaved`
@@ -205,11 +328,13 @@ class Index:
 
         # interleaved True gives 'bbox' order.
         self.interleaved = bool(kwargs.get("interleaved", True))
+        self.cache = kwargs.get("cache", None)
 
         stream = None
         arrays = None
         basename = None
         storage = None
+        existing = False
         if args:
             if isinstance(args[0], str) or isinstance(args[0], bytes):
                 # they sent in a filename
@@ -246,6 +371,7 @@ class Index:
                 # assume we're fetching the first index_id.  If the user
                 # set it, we'll fetch that one.
                 if not self.properties.overwrite:
+                    existing = True
                     try:
                         self.properties.index_id
                     except RTreeError:
@@ -260,6 +386,7 @@ class Index:
             if storage.hasData:
                 self.properties.overwrite = bool(kwargs.get("overwrite", False))
                 if not self.properties.overwrite:
+                    existing = True
                     try:
                         self.properties.index_id
                     except RTreeError:
@@ -300,6 +427,19 @@ class Index:
             elif arrays:
                 raise NotImplementedError("Bulk insert only supported for RTrees")
 
+        if stream or arrays:
+            self._size = len(arrays[0]) if arrays and not existing else None
+        elif existing:
+            self._size = self._read_size() if basename else None
+        else:
+            self._size = 0
+
+        if basename:
+            # The files just written by this index may differ in time
+            self._generation = self._disk_generation(complete=False)
+            if existing and not (stream or arrays):
+                self._size_stamp = self._disk_stamp()
+
     def get_size(self) -> int:
         warnings.warn(
             "index.get_size() is deprecated, use len(index) instead", DeprecationWarning
@@ -309,12 +449,26 @@ class Index:
     def __len__(self) -> int:
         """The number of entries in the index.
 
+        The entries are counted when needed, and the count is then kept up
+        to date by :meth:`insert` and :meth:`delete`, which counts the
+        entries in the box it deletes from to tell whether it found one.
+        Disk indexes save the count when they are flushed or closed, and
+        read it back when they are opened if their files have not changed
+        since.
+
         :return: number of entries
         """
-        try:
-            return self.count(self.bounds)
-        except RTreeError:
-            return 0
+        if self._size is None:
+            try:
+                self._size = self.count(self.bounds)
+            except RTreeError:
+                # The bounds of an empty index are inverted
+                self._size = 0
+        return self._size
+
+    def _track_size(self, change: int) -> None:
+        if self._size is not None:
+            self._size += change
 
     def __repr__(self) -> str:
         return f"rtree.index.Index(bounds={self.bounds}, size={len(self)})"
@@ -325,8 +479,314 @@ class Index:
         return state
 
     def __setstate__(self, state: dict[str, Any]) -> None:
+        snapshot = state.pop("_snapshot", None)
         self.__dict__.update(state)
-        self.handle = IndexHandle(self.properties.handle)
+        if snapshot is None:
+            self.handle = IndexHandle(self.properties.handle)
+            self._size = None
+        else:
+            self.handle = self._load_snapshot(*self._read_snapshot(snapshot)[1:])
+
+    def __reduce__(self):
+        # In-memory indexes carry their entries along, other storages are
+        # reopened from their properties.
+        state = self.__getstate__()
+        if (
+            self.handle
+            and self.properties.storage == RT_Memory
+            and self.properties.type != RT_TPRTree
+        ):
+            state["_snapshot"] = self.to_bytes()
+        return copyreg.__newobj__, (type(self),), state
+
+    def scan(self, chunk_size: int = 65536, payloads: bool = False):
+        """Iterate over all entries of the index in chunks of NumPy arrays.
+
+        The entries are read in a single traversal of the tree, leaf by
+        leaf, so entries that are close in space are close in the output.
+        Each chunk is a tuple ``(ids, bounds)`` of the ids of shape `(n,)`
+        and the bounds of shape `(n, 2 * d)` of up to ``chunk_size``
+        entries, with the minima of each entry before its maxima.  If
+        ``payloads`` is True, the chunk also holds ``(offsets, data)``,
+        where the stored data of entry ``i`` is
+        ``data[offsets[i]:offsets[i + 1]]``, as pickled by :meth:`dumps`.
+
+        The traversal copies all entries before the first chunk is
+        returned, so changes made to the index while iterating are not
+        seen.  This copy is held by libspatialindex until the iteration
+        ends, and includes the stored data of every entry even if
+        ``payloads`` is False.  Memory use is therefore proportional to the
+        whole index, and ``chunk_size`` only bounds the size of the arrays
+        of each chunk.
+
+        :param chunk_size: The maximum number of entries in a chunk.
+
+        :param payloads: If True, also return the stored data.
+
+        ::
+
+            >>> from rtree import index
+            >>> idx = index.Index()
+            >>> idx.insert(1, (0, 0, 1, 1), obj="a")
+            >>> idx.insert(2, (5, 5, 6, 6))
+            >>> for ids, bounds in idx.scan(chunk_size=1):
+            ...     print(ids, bounds)
+            [1] [[0. 0. 1. 1.]]
+            [2] [[5. 5. 6. 6.]]
+        """
+        if self.properties.type == RT_TPRTree:
+            raise NotImplementedError("Scans of TPR-Trees are not supported")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be >= 1")
+        return self._scan(chunk_size, payloads)
+
+    def to_arrays(self, payloads: bool = False):
+        """Return all entries of the index as NumPy arrays, in the layout of
+        a single chunk of :meth:`scan`.
+
+        As with :meth:`scan`, all entries are copied by libspatialindex
+        before the arrays are filled, so this needs memory for the index
+        twice over.
+
+        :param payloads: If True, also return the stored data.
+
+        ::
+
+            >>> from rtree import index
+            >>> idx = index.Index()
+            >>> idx.insert(1, (0, 0, 1, 1), obj="a")
+            >>> ids, bounds, offsets, data = idx.to_arrays(payloads=True)
+            >>> ids, idx.loads(data[offsets[0] : offsets[1]])
+            (array([1]), 'a')
+        """
+        import numpy as np
+
+        if self.properties.type == RT_TPRTree:
+            raise NotImplementedError("Scans of TPR-Trees are not supported")
+        for chunk in self._scan(None, payloads):
+            return chunk
+        ids = np.empty(0, dtype=np.int64)
+        bounds = np.empty((0, 2 * self.properties.dimension), dtype=np.float64)
+        if payloads:
+            return ids, bounds, np.zeros(1, dtype=np.int64), b""
+        return ids, bounds
+
+    def _scan(self, chunk_size, payloads):
+        import numpy as np
+
+        if not len(self):
+            return
+        dimension = self.properties.dimension
+        p_mins, p_maxs = self.get_coordinate_pointers(self.bounds)
+        p_num_results = ctypes.c_uint64(0)
+        it = ctypes.pointer(ctypes.c_void_p())
+        core.rt.Index_Intersects_obj(
+            self.handle,
+            p_mins,
+            p_maxs,
+            dimension,
+            ctypes.byref(it),
+            ctypes.byref(p_num_results),
+        )
+        num_results = p_num_results.value
+
+        # Reuse the output pointers of every item, with aliases of the type
+        # needed to free what they point to.
+        pp_mins = ctypes.pointer(ctypes.c_double())
+        pp_maxs = ctypes.pointer(ctypes.c_double())
+        p_data = ctypes.pointer(ctypes.c_ubyte())
+        voidp = ctypes.POINTER(ctypes.c_void_p)
+        pv_mins = voidp.from_buffer(pp_mins)
+        pv_maxs = voidp.from_buffer(pp_maxs)
+        pv_data = voidp.from_buffer(p_data)
+        p_dimension = ctypes.c_uint32(0)
+        length = ctypes.c_uint64(0)
+        size = 8 * dimension
+        # Look up the functions and pass the arguments by reference once
+        get_id = core.rt.IndexItem_GetID
+        get_bounds = core.rt.IndexItem_GetBounds
+        get_data = core.rt.IndexItem_GetData
+        free = core.rt.Index_Free
+        memmove = ctypes.memmove
+        bounds_args = (
+            ctypes.byref(pp_mins),
+            ctypes.byref(pp_maxs),
+            ctypes.byref(p_dimension),
+        )
+        data_args = (ctypes.byref(p_data), ctypes.byref(length))
+        try:
+            step = chunk_size or max(num_results, 1)
+            for start in range(0, num_results, step):
+                count = min(step, num_results - start)
+                ids = []
+                bounds = np.empty((count, 2 * dimension), dtype=np.float64)
+                data = []
+                row = bounds.ctypes.data
+                for item in it[start : start + count]:
+                    ids.append(get_id(item))
+                    get_bounds(item, *bounds_args)
+                    memmove(row, pp_mins, size)
+                    memmove(row + size, pp_maxs, size)
+                    row += 2 * size
+                    free(pv_mins)
+                    free(pv_maxs)
+                    if payloads:
+                        get_data(item, *data_args)
+                        data.append(ctypes.string_at(p_data, length.value))
+                        free(pv_data)
+                if payloads:
+                    offsets = np.zeros(count + 1, dtype=np.int64)
+                    np.cumsum([len(d) for d in data], out=offsets[1:])
+                    yield np.array(ids, dtype=np.int64), bounds, offsets, b"".join(data)
+                else:
+                    yield np.array(ids, dtype=np.int64), bounds
+        finally:
+            core.rt.Index_DestroyObjResults(
+                ctypes.cast(it, ctypes.POINTER(voidp)), num_results
+            )
+
+    def to_bytes(self) -> bytes:
+        """Return a snapshot of the entries of the index.
+
+        The ids, bounds and stored objects of all entries are written as
+        contiguous arrays together with the index properties, and can be
+        restored with :meth:`from_bytes` by bulk loading.  This is also how
+        in-memory indexes are pickled.
+
+        ::
+
+            >>> from rtree import index
+            >>> idx = index.Index()
+            >>> idx.insert(1, (0, 0, 1, 1), obj="a")
+            >>> copy = index.Index.from_bytes(idx.to_bytes())
+            >>> [(item.id, item.object) for item in copy.intersection((0, 0, 1, 1),
+            ...                                                       objects=True)]
+            [(1, 'a')]
+        """
+        if self.properties.type == RT_TPRTree:
+            raise NotImplementedError("Snapshots of TPR-Trees are not supported")
+
+        dimension = self.properties.dimension
+        ids, bounds, offsets, payloads = self.to_arrays(payloads=True)
+
+        properties = self.properties.as_dict()
+        for key in _SNAPSHOT_STORAGE_KEYS:
+            properties[key] = None
+        meta = pickle.dumps(
+            {
+                "properties": properties,
+                "interleaved": self.interleaved,
+                "count": len(ids),
+            }
+        )
+        return b"".join(
+            [
+                _SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, len(meta)),
+                meta,
+                ids.astype("<i8").tobytes(),
+                bounds[:, :dimension].astype("<f8").tobytes(),
+                bounds[:, dimension:].astype("<f8").tobytes(),
+                offsets.astype("<i8").tobytes(),
+                payloads,
+            ]
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes, **kwargs: Any) -> Index:
+        """Create an in-memory index from a snapshot written by
+        :meth:`to_bytes`.
+
+        :param data: The snapshot.  It is unpickled, so it must come from a
+            trusted source.
+
+        :param kwargs: Further arguments for the index constructor.  The
+            properties and :attr:`interleaved` ordering of the snapshotted
+            index are used unless given.
+        """
+        meta, *arrays = cls._read_snapshot(data)
+        if "properties" not in kwargs:
+            kwargs["properties"] = Property()
+            kwargs["properties"].initialize_from_dict(meta["properties"])
+        kwargs.setdefault("interleaved", meta["interleaved"])
+        idx = cls(**kwargs)
+        if len(arrays[0]):
+            idx.handle.destroy()
+            idx.handle = idx._load_snapshot(*arrays)
+            idx._size = len(arrays[0])
+        return idx
+
+    @staticmethod
+    def _read_snapshot(data):
+        import numpy as np
+
+        data = memoryview(data)
+        magic = bytes(data[: len(_SNAPSHOT_MAGIC)])
+        if magic != _SNAPSHOT_MAGIC:
+            raise RTreeError("Data is not an index snapshot")
+        try:
+            _, version, meta_size = _SNAPSHOT_HEADER.unpack_from(data)
+            if version != _SNAPSHOT_VERSION:
+                raise RTreeError(f"Unsupported index snapshot version {version}")
+            start = _SNAPSHOT_HEADER.size
+            meta = pickle.loads(data[start : start + meta_size])
+            start += meta_size
+
+            n = meta["count"]
+            dimension = meta["properties"]["dimension"]
+            ids = np.frombuffer(data, dtype="<i8", count=n, offset=start)
+            start += ids.nbytes
+            mins = np.frombuffer(data, dtype="<f8", count=n * dimension, offset=start)
+            start += mins.nbytes
+            maxs = np.frombuffer(data, dtype="<f8", count=n * dimension, offset=start)
+            start += maxs.nbytes
+            offsets = np.frombuffer(data, dtype="<i8", count=n + 1, offset=start)
+            start += offsets.nbytes
+        except (struct.error, pickle.UnpicklingError, EOFError, ValueError):
+            raise RTreeError("Index snapshot is truncated")
+        payloads = data[start:]
+        if len(payloads) != offsets[-1]:
+            raise RTreeError("Index snapshot is truncated")
+        return (
+            meta,
+            ids,
+            mins.reshape(n, dimension),
+            maxs.reshape(n, dimension),
+            offsets,
+            payloads,
+        )
+
+    def _load_snapshot(self, ids, mins, maxs, offsets, payloads):
+        # Bulk load the entries of a snapshot into a new handle, passing the
+        # stored objects through as serialized.
+        if not len(ids):
+            return IndexHandle(self.properties.handle)
+        if self.properties.type == RT_RTree:
+            if not offsets[-1] and hasattr(core.rt, "Index_CreateWithArray"):
+                return self._create_idx_from_array(ids, mins, maxs)
+            entries = (
+                (ids[i], mins[i], maxs[i], payloads[offsets[i] : offsets[i + 1]])
+                for i in range(len(ids))
+            )
+            self._exception = None
+            handle = self._create_idx_from_stream(entries, raw=True)
+            if self._exception:
+                raise self._exception
+            return handle
+
+        handle = IndexHandle(self.properties.handle)
+        dimension = self.properties.dimension
+        for i in range(len(ids)):
+            data = bytes(payloads[offsets[i] : offsets[i + 1]])
+            core.rt.Index_InsertData(
+                handle,
+                int(ids[i]),
+                mins[i].ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+                maxs[i].ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+                dimension,
+                ctypes.cast(ctypes.c_char_p(data), ctypes.POINTER(ctypes.c_uint8)),
+                len(data),
+            )
+        return handle
 
     def dumps(self, obj: object) -> bytes:
         return pickle.dumps(obj)
@@ -337,44 +797,571 @@ class Index:
     def close(self) -> None:
         """Force a flush of the index to storage. Renders index
         inaccessible."""
+        if self.cache is not None:
+            self.cache.clear()
         if self.handle:
+            disk = self.properties.storage == RT_Disk
+            current = disk and self._size_current()
             self.handle.destroy()
             self.handle = None
+            if disk:
+                self._update_size(current)
         else:
             raise OSError("Unclosable index")
 
     def flush(self) -> None:
         """Force a flush of the index to storage."""
         if self.handle:
+            disk = self.properties.storage == RT_Disk
+            current = disk and self._size_current()
             self.handle.flush()
+            if disk:
+                self._update_size(current)
+
+    @classmethod
+    def rebuild(cls, filename: str, data: Any, **kwargs: Any) -> None:
+        """Replace the disk index ``filename`` by a new index built from
+        ``data``, without ever leaving a partly built index in its place.
+
+        The new index is built in temporary files next to the old ones,
+        which are then renamed over them.  Both new files are given the same
+        modification time, so that :meth:`reopen_if_changed` can tell a
+        complete pair of files from one that is still being renamed.
+        Indexes that have the old files open continue to read them until
+        they are reopened.  On Windows, files that are open cannot be
+        replaced, so the old index must be closed first.
+
+        :param filename: The base name of the disk index.
+
+        :param data: The entries of the new index, as a stream or a tuple of
+            ``(ids, mins, maxs)`` arrays, as given to :class:`Index`.
+
+        :param kwargs: Other keyword arguments for :class:`Index`, such as
+            ``properties`` or ``interleaved``.
+
+        ::
+
+            >>> import os, tempfile
+            >>> from rtree import index
+            >>> filename = os.path.join(tempfile.mkdtemp(), "roads")
+            >>> idx = index.Index(filename)
+            >>> idx.insert(1, (0, 0, 1, 1))
+            >>> idx.flush()
+            >>> index.Index.rebuild(filename, [(2, (0, 0, 1, 1), None)])
+            >>> idx.reopen_if_changed()
+            True
+            >>> list(idx.intersection((0, 0, 1, 1)))
+            [2]
+            >>> idx.close()
+        """
+        directory, name = os.path.split(os.path.abspath(os.fsdecode(filename)))
+        # The empty file reserves a unique name for the files of the new index
+        fd, temporary = tempfile.mkstemp(
+            prefix=f".{name}.", suffix=".rebuild", dir=directory
+        )
+        os.close(fd)
+        kwargs["overwrite"] = True
+        if "properties" in kwargs:
+            # The index sets the file names on its properties, so it is
+            # given a copy to leave those of the caller unchanged
+            properties = Property()
+            properties.initialize_from_dict(kwargs["properties"].as_dict())
+            kwargs["properties"] = properties
+        try:
+            index = cls(temporary, data, **kwargs)
+            sources = index._disk_files()
+            index.close()
+            index.properties.filename = filename
+            targets = index._disk_files()
+            stamp = time.time_ns()
+            for source in sources:
+                os.utime(source, ns=(stamp, stamp))
+            # The index file is replaced last, as it refers to the data file
+            os.replace(sources[1], targets[1])
+            os.replace(sources[0], targets[0])
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(f"{sources[0]}.size")
+            index._write_size()
+        except BaseException:
+            for leftover in glob.glob(glob.escape(temporary) + ".*"):
+                os.remove(leftover)
+            raise
+        finally:
+            os.remove(temporary)
+
+    def _disk_files(self) -> tuple[str, str]:
+        """Return the index and data file names of a disk index."""
+        basename = self.properties.filename
+        return (
+            f"{basename}.{self.properties.idx_extension}",
+            f"{basename}.{self.properties.dat_extension}",
+        )
+
+    def _disk_generation(self, complete: bool = True) -> tuple[int, ...] | None:
+        """Identify the files of a disk index, or return None if they do not
+        exist or, if ``complete`` is True, are being replaced by
+        :meth:`rebuild`."""
+        try:
+            idx, dat = (os.stat(name) for name in self._disk_files())
+        except FileNotFoundError:
+            return None
+        if complete and idx.st_mtime_ns != dat.st_mtime_ns:
+            return None
+        # Not the modification time, which writes of the index also change
+        return (idx.st_ino, dat.st_ino)
+
+    def _disk_stamp(self) -> list[list[int]]:
+        """Return the inode, size and modification time of the files of a
+        disk index."""
+        return [
+            [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+            for stat in map(os.stat, self._disk_files())
+        ]
+
+    def _write_size(self) -> None:
+        """Save the number of entries of a disk index next to its files,
+        together with their stamps."""
+        if self._size is None:
+            return
+        filename = f"{self._disk_files()[0]}.size"
+        temporary = f"{filename}.{os.getpid()}"
+        try:
+            with open(temporary, "w") as f:
+                json.dump({"size": self._size, "files": self._disk_stamp()}, f)
+            os.replace(temporary, filename)
+            self._size_saved = True
+        except OSError:
+            # The count is only an optimization
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
+
+    def _size_current(self) -> bool:
+        """Tell whether the number of entries is known for the files of a
+        disk index as they are before this index flushes them: the files
+        must be those it opened, and unchanged by others since it last
+        flushed them unless it changed them itself."""
+        if self._size is None:
+            return False
+        try:
+            stamp = self._disk_stamp()
+        except OSError:
+            return False
+        if tuple(ino for ino, *_ in stamp) != self._generation:
+            return False
+        return self._size_stamp is None or stamp == self._size_stamp
+
+    def _update_size(self, current: bool) -> None:
+        """Save the number of entries of a disk index after it was flushed
+        if it is ``current``, or forget it otherwise."""
+        if current:
+            self._write_size()
+        else:
+            self._size = None
+        with contextlib.suppress(OSError):
+            self._size_stamp = self._disk_stamp()
+
+    def _read_size(self) -> int | None:
+        """Return the saved number of entries of a disk index, or None if
+        its files changed after it was saved."""
+        try:
+            with open(f"{self._disk_files()[0]}.size") as f:
+                self._size_saved = True
+                saved = json.load(f)
+            if saved["files"] == self._disk_stamp():
+                return int(saved["size"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _discard_size(self) -> None:
+        """Remove the saved number of entries of a disk index before it is
+        changed.  Modification times are too coarse to always tell that
+        the files changed after it was saved."""
+        self._size_stamp = None
+        if self._size_saved:
+            self._size_saved = False
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(f"{self._disk_files()[0]}.size")
+
+    def reopen_if_changed(self) -> bool:
+        """Reopen a disk index if its files were replaced by
+        :meth:`rebuild` since it was opened.
+
+        Queries already running finish on the old files, and later queries
+        use the new ones.  Nothing changes while a rebuild is renaming the
+        files.
+
+        :return: True if the index was reopened.
+        """
+        if self.properties.storage != RT_Disk:
+            raise RTreeError("Only disk indexes can be reopened")
+        generation = self._disk_generation()
+        if generation is None or generation == self._generation:
+            return False
+        try:
+            handle = self._reopen()
+        except RTreeError:
+            return False
+        if self._disk_generation() != generation:
+            # Replaced again while opening, so the files may not match
+            handle.destroy()
+            return False
+        self.handle, old = handle, self.handle
+        self._generation = generation
+        self._size = self._read_size()
+        self._size_stamp = self._disk_stamp()
+        self._invalidate()
+        if old:
+            old.destroy()
+        return True
+
+    def _reopen(self) -> IndexHandle:
+        """Open a new handle on the files of a disk index."""
+        self.properties.overwrite = False
+        try:
+            self.properties.index_id
+        except RTreeError:
+            self.properties.index_id = 1
+        return IndexHandle(self.properties.handle)
+
+    def _swap_handle(self, writethrough: bool, buffering_capacity: int) -> None:
+        """Reopen a disk index with other buffer settings."""
+        self.handle.destroy()
+        self.properties.writethrough = writethrough
+        self.properties.buffering_capacity = buffering_capacity
+        self.handle = self._reopen()
+
+    @contextlib.contextmanager
+    def batch(self, buffering_capacity: int = 4096) -> Iterator[Index]:
+        """Group inserts and deletes so that they are written together.
+
+        Inside the ``with`` block, :meth:`insert` and :meth:`delete` only
+        check their coordinates and queue the change, and queries do not see
+        queued changes.  When the block ends, the changes are applied and
+        flushed once.  A disk index is reopened for this with
+        ``writethrough`` turned off and a buffer of at least
+        ``buffering_capacity`` pages, so that each page is written about
+        once however many changes touch it, and then reopened with its own
+        settings.  If the block raises an exception, the queued changes are
+        discarded and the index is left as it was.
+
+        Applying the changes is not atomic.  Their coordinates are checked
+        when they are queued, but their objects are only pickled when they
+        are applied.  If a change raises, for example because its object
+        cannot be pickled, the changes before it stay applied and the rest
+        are discarded.
+
+        :param buffering_capacity: The number of pages a disk index buffers
+            while the changes are applied.
+
+        ::
+
+            >>> from rtree import index
+            >>> idx = index.Index()
+            >>> with idx.batch():
+            ...     for i in range(10):
+            ...         idx.insert(i, (i, i, i + 1, i + 1))
+            ...     idx.count((0, 0, 10, 10))
+            0
+            >>> idx.count((0, 0, 10, 10))
+            10
+        """
+        if self._pending is not None:
+            raise RTreeError("Batches cannot be nested")
+        pending: list = []
+        self._pending = pending
+        try:
+            yield self
+        finally:
+            self._pending = None
+        if not pending:
+            return
+
+        disk = self.properties.storage == RT_Disk
+        if disk:
+            saved = (self.properties.writethrough, self.properties.buffering_capacity)
+            self._swap_handle(False, max(saved[1], buffering_capacity))
+        try:
+            for method, *args in pending:
+                method(*args)
+        finally:
+            if disk:
+                self._swap_handle(*saved)
+            else:
+                self.flush()
+
+    def _capture(self, method, *args):
+        """Return the context to make a change in, which records the change
+        while the index is being repacked."""
+        repack = self._repack
+        if repack is None:
+            return _NO_REPACK
+        return repack.capture(method, args)
+
+    def stats(self) -> dict[str, Any]:
+        """Return statistics of the leaves of the tree, computed from their
+        bounds with NumPy, for example to export as metrics.
+
+        ``leaves``
+            The number of leaves.
+        ``entries``
+            The number of entries in the leaves.
+        ``entries_min``, ``entries_mean``, ``entries_max``
+            The smallest, average and largest number of entries in a leaf.
+        ``fill``
+            ``entries_mean`` divided by the ``leaf_capacity`` property.
+        ``volume``
+            The total volume of the leaves.
+        ``overlap_volume``
+            The total volume of the pairwise intersections of the leaves.
+        ``overlap``
+            ``overlap_volume`` divided by ``volume``.
+        ``coverage``
+            ``volume`` divided by the volume of the bounds of the index.
+        ``dead_space``
+            The fraction of the bounds of the index that no leaf covers,
+            estimated as one minus ``volume - overlap_volume`` divided by
+            the volume of the bounds.  Overlaps of three or more leaves make
+            it an overestimate.
+
+        A freshly bulk-loaded tree of boxes has an overlap of about 0.01.
+        Volumes are products of the extents in all dimensions, so leaves
+        that are flat in a dimension have a volume of 0.
+
+        ::
+
+            >>> from rtree import index
+            >>> idx = index.Index()
+            >>> for i in range(100):
+            ...     idx.insert(i, (i, i, i + 1, i + 1))
+            >>> stats = idx.stats()
+            >>> stats["entries"], stats["leaves"] == len(idx.leaves())
+            (100, True)
+        """
+        import numpy as np
+
+        # Only the bounds are needed, not the objects of a container
+        _, boxes, offsets, _ = Index.leaves(self, as_arrays=True)
+        sizes = np.diff(offsets)
+        stats: dict[str, Any] = {
+            "leaves": 0,
+            "entries": 0,
+            "entries_min": 0,
+            "entries_mean": 0.0,
+            "entries_max": 0,
+            "fill": 0.0,
+            "volume": 0.0,
+            "overlap_volume": 0.0,
+            "overlap": 0.0,
+            "coverage": 0.0,
+            "dead_space": 0.0,
+        }
+        if not offsets[-1]:
+            # The leaf of an empty tree has infinite, inverted bounds
+            return stats
+        dimension = self.properties.dimension
+        mins = np.ascontiguousarray(boxes[:, :dimension])
+        maxs = np.ascontiguousarray(boxes[:, dimension:])
+
+        # Find the intersecting pairs of leaves with an index of the leaves
+        properties = Property(dimension=dimension)
+        pairs = Index((np.arange(len(boxes)), mins, maxs), properties=properties)
+        ids, counts = pairs.intersection_v(mins, maxs)
+        pairs.close()
+        rows = np.repeat(np.arange(len(boxes)), counts.astype(np.int64))
+        rows, ids = rows[rows < ids], ids[rows < ids]
+        gaps = np.minimum(maxs[rows], maxs[ids]) - np.maximum(mins[rows], mins[ids])
+        overlap = float(np.prod(np.maximum(gaps, 0.0), axis=1).sum())
+        volume = float(np.prod(maxs - mins, axis=1).sum())
+        bounds = float(np.prod(maxs.max(axis=0) - mins.min(axis=0)))
+
+        stats["leaves"] = len(boxes)
+        stats["entries"] = int(offsets[-1])
+        stats["entries_min"] = int(sizes.min())
+        stats["entries_max"] = int(sizes.max())
+        stats["entries_mean"] = float(sizes.mean())
+        stats["fill"] = stats["entries_mean"] / self.properties.leaf_capacity
+        stats["volume"] = volume
+        stats["overlap_volume"] = overlap
+        if volume:
+            stats["overlap"] = overlap / volume
+        if bounds:
+            stats["coverage"] = volume / bounds
+            covered = (volume - overlap) / bounds
+            stats["dead_space"] = min(max(1.0 - covered, 0.0), 1.0)
+        return stats
+
+    def quality(self) -> dict[str, Any]:
+        """Measure how well the leaves of the tree fit its entries.
+
+        Inserts and deletes over a long time let the leaves of a tree grow
+        and overlap more than those of a bulk-loaded tree of the same
+        entries, and queries visit more of them.  The measures returned are
+        the ``leaves``, ``fill``, ``overlap`` and ``coverage`` of
+        :meth:`stats`.
+        """
+        stats = self.stats()
+        return {key: stats[key] for key in ("leaves", "fill", "overlap", "coverage")}
+
+    def repack(self, executor: Executor | None = None) -> Future[None]:
+        """Bulk load the entries of the index into a new tree in the
+        background, and switch to it when it is complete.
+
+        The entries are copied with :meth:`to_bytes`.  Queries and changes
+        continue on the old tree while the new one is built, and changes
+        are recorded and made again on the new tree before the switch.
+        Only in-memory R-Trees can be repacked.
+
+        :param executor: The executor to build the new tree on.  By default,
+            a new thread is started.
+
+        :return: A future that is done when the new tree is in use.
+        """
+        if self.properties.storage != RT_Memory or self.properties.type != RT_RTree:
+            raise NotImplementedError("Only in-memory R-Trees can be repacked")
+        if self._repack is not None:
+            raise RTreeError("The index is already being repacked")
+        repack = _Repack()
+        with repack.lock:
+            self._repack = repack
+            snapshot = self.to_bytes()
+        if executor is not None:
+            return executor.submit(self._switch, repack, snapshot)
+
+        future: Future[None] = Future()
+
+        def run():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self._switch(repack, snapshot))
+                except BaseException as exc:
+                    future.set_exception(exc)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def _switch(self, repack: _Repack, snapshot: bytes) -> None:
+        try:
+            handle = self._load_snapshot(*self._read_snapshot(snapshot)[1:])
+        except BaseException:
+            with repack.lock:
+                self._repack = repack.log = None
+            raise
+        with repack.lock:
+            self._repack = None
+            self.handle = handle
+            # The changes were counted when they were first made
+            size = self._size
+            for method, args in repack.log or ():
+                method(*args)
+            self._size = size
+            repack.log = None
+
+    def maintain(
+        self,
+        min_fill: float = 0.5,
+        max_overlap: float = 0.1,
+        executor: Executor | None = None,
+    ) -> Future[None] | None:
+        """Repack the index in the background if its :meth:`quality` has
+        degraded.
+
+        :param min_fill: The lowest acceptable average leaf fill.
+
+        :param max_overlap: The highest acceptable leaf overlap.
+
+        :param executor: The executor to repack on, see :meth:`repack`.
+
+        :return: The future of the repack, or None if the index was not
+            repacked.
+        """
+        if self._repack is not None:
+            return None
+        quality = self.quality()
+        if quality["fill"] < min_fill or quality["overlap"] > max_overlap:
+            return self.repack(executor)
+        return None
+
+    def warmup(
+        self,
+        level: Literal["internal", "all"] = "internal",
+        max_bytes: int | None = None,
+    ) -> int:
+        """Load pages of the index ahead of queries, so that the first
+        queries after opening it do not wait for them.
+
+        With ``level="internal"``, the nodes near the root are loaded into
+        the buffer of libspatialindex, whose size is set by the
+        ``buffering_capacity`` property, by point queries spread evenly over
+        the bounds of the index.  With ``level="all"``, the data file of a
+        disk index is also read in file order, with read-ahead hints where
+        the platform supports them, so that every page is in the page cache
+        of the operating system, and every page of a custom storage is
+        loaded once.
+
+        :param level: ``"internal"`` or ``"all"``.
+
+        :param max_bytes: The maximum number of bytes of the data file to
+            read with ``level="all"``.
+
+        :return: The number of bytes read from the data file.
+        """
+        if level not in ("internal", "all"):
+            raise ValueError(f"unknown warmup level {level!r}")
+        read = 0
+        if level == "all":
+            if self.properties.storage == RT_Disk:
+                read = _read_ahead(self._disk_files()[1], max_bytes)
+            elif self.properties.storage == RT_Custom:
+                self._count(self.bounds)
+        if self.properties.type != RT_RTree:
+            return read
+
+        bounds = self.get_bounds(coordinate_interleaved=True)
+        dimension = self.properties.dimension
+        mins, maxs = bounds[:dimension], bounds[dimension:]
+        if not mins <= maxs:
+            return read
+        # About one query for each child of the root
+        cells = math.ceil(self.properties.index_capacity ** (1 / dimension))
+        axes = [
+            [low + (high - low) * (i + 0.5) / cells for i in range(cells)]
+            for low, high in zip(mins, maxs)
+        ]
+        for point in itertools.product(*axes):
+            self._count(point)
+        return read
+
+    def _split_coordinates(self, coordinates: Any) -> tuple[list, list]:
+        """Split a point or a box into lists of minima and maxima."""
+        dimension = self.properties.dimension
+        coordinates = list(coordinates)
+
+        # Point
+        if len(coordinates) == dimension:
+            return coordinates, coordinates
+        # Interleaved box
+        if self.interleaved:
+            return coordinates[:dimension], coordinates[dimension:]
+        # Non-interleaved box
+        return coordinates[::2], coordinates[1::2]
 
     def get_coordinate_pointers(
         self, coordinates: Sequence[float]
     ) -> tuple[float, float]:
         dimension = self.properties.dimension
-        coordinates = list(coordinates)
+        p, q = self._split_coordinates(coordinates)
 
         arr = ctypes.c_double * dimension
         mins = arr()
+        mins[:] = p
 
         # Point
-        if len(coordinates) == dimension:
-            mins[:] = coordinates
+        if p is q:
             maxs = mins
         # Bounding box
         else:
             maxs = arr()
-
-            # Interleaved box
-            if self.interleaved:
-                p = coordinates[:dimension]
-                q = coordinates[dimension:]
-            # Non-interleaved box
-            else:
-                p = coordinates[::2]
-                q = coordinates[1::2]
-
-            mins[:] = p
             maxs[:] = q
 
             if not p <= q:
@@ -403,7 +1390,31 @@ class Index:
         # return serialized to keep it alive for the pointer.
         return size, ctypes.cast(p, ctypes.POINTER(ctypes.c_uint8)), serialized
 
+    def _invalidate(self, coordinates: Any = None) -> None:
+        # Called on every modification so cached results are not reused.
+        if self.cache is not None:
+            if coordinates is None or self.properties.type == RT_TPRTree:
+                self.cache.invalidate()
+            else:
+                self.cache.invalidate(*self._split_coordinates(coordinates))
+
+    def _cached(self, kind, coordinates, num_results, objects, query):
+        # Answer a query from the cache, or run it and cache its result.
+        # Items are not cached as they are handed out for modification.
+        cache = self.cache
+        if cache is None or objects is True or self.properties.type == RT_TPRTree:
+            return query()
+        key = (kind, tuple(map(float, coordinates)), num_results, objects)
+        result = cache.get(key)
+        if result is None:
+            result = query()
+            if kind != "count":
+                result = list(result)
+            cache.put(key, result, *self._split_coordinates(coordinates))
+        return result if kind == "count" else iter(result)
+
     def set_result_limit(self, value):
+        self._invalidate()
         return core.rt.Index_SetResultSetOffset(self.handle, value)
 
     def get_result_limit(self):
@@ -412,6 +1423,7 @@ class Index:
     result_limit = property(get_result_limit, set_result_limit)
 
     def set_result_offset(self, value):
+        self._invalidate()
         return core.rt.Index_SetResultSetLimit(self.handle, value)
 
     def get_result_offset(self):
@@ -462,6 +1474,13 @@ class Index:
             ...            obj=42)  # doctest: +SKIP
 
         """
+        if self._pending is not None:
+            if self.properties.type != RT_TPRTree:
+                self.get_coordinate_pointers(coordinates)
+            self._pending.append((self.insert, id, coordinates, obj))
+            return
+        self._invalidate(coordinates)
+        self._discard_size()
         if self.properties.type == RT_TPRTree:
             # https://github.com/python/mypy/issues/6799
             return self._insertTP(id, *coordinates, obj=obj)  # type: ignore[misc]
@@ -472,9 +1491,11 @@ class Index:
         pyserialized = None
         if obj is not None:
             size, data, pyserialized = self._serialize(obj)
-        core.rt.Index_InsertData(
-            self.handle, id, p_mins, p_maxs, self.properties.dimension, data, size
-        )
+        with self._capture(Index.insert, self, id, coordinates, obj):
+            core.rt.Index_InsertData(
+                self.handle, id, p_mins, p_maxs, self.properties.dimension, data, size
+            )
+            self._track_size(1)
 
     add = insert
 
@@ -507,6 +1528,7 @@ class Index:
             data,
             size,
         )
+        self._track_size(1)
 
     def count(self, coordinates: Any) -> int:
         """Return number of objects that intersect the given coordinates.
@@ -552,6 +1574,11 @@ class Index:
         """
         if self.properties.type == RT_TPRTree:
             return self._countTP(*coordinates)
+        return self._cached(
+            "count", coordinates, None, False, lambda: self._count(coordinates)
+        )
+
+    def _count(self, coordinates: Any) -> int:
         p_mins, p_maxs = self.get_coordinate_pointers(coordinates)
 
         p_num_results = ctypes.c_uint64(0)
@@ -820,6 +1847,15 @@ class Index:
             return self._intersectionTP(  # type: ignore[misc]
                 *coordinates, objects=objects
             )
+        return self._cached(
+            "intersection",
+            coordinates,
+            None,
+            objects,
+            lambda: self._intersection(coordinates, objects),
+        )
+
+    def _intersection(self, coordinates, objects):
         if objects:
             return self._intersection_obj(coordinates, objects)
 
@@ -1019,6 +2055,15 @@ class Index:
             # https://github.com/python/mypy/issues/6799
             return self._nearestTP(*coordinates, objects=objects)  # type: ignore[misc]
 
+        return self._cached(
+            "nearest",
+            coordinates,
+            num_results,
+            objects,
+            lambda: self._nearest(coordinates, num_results, objects),
+        )
+
+    def _nearest(self, coordinates, num_results, objects):
         if objects:
             return self._nearest_obj(coordinates, num_results, objects)
         p_mins, p_maxs = self.get_coordinate_pointers(coordinates)
@@ -1100,6 +2145,133 @@ class Index:
 
                 ids.resize(2 * len(ids) + counts[offn], refcheck=False)
 
+    def intersection_chunks(
+        self, mins, maxs=None, *, max_bytes=64 * 2**20, prefetch=True
+    ):
+        """Streaming bulk intersection query with bounded memory use.
+
+        Unlike :meth:`intersection_v`, which holds every query box and every
+        result id in memory at once, this yields the results in chunks of
+        ``(query_offset, ids, counts)``.  ``query_offset`` is the position of
+        the first query of the chunk and ``ids``/``counts`` follow the layout
+        of :meth:`intersection_v` for the queries of the chunk.
+
+        :param mins: A NumPy array (or :class:`numpy.memmap`) of shape
+            `(n, d)` containing the minima to query.  If ``maxs`` is not
+            given, an iterable of points or boxes in the ordering given by
+            :attr:`interleaved` instead.
+
+        :param maxs: A NumPy array (or :class:`numpy.memmap`) of shape
+            `(n, d)` containing the maxima to query.
+
+        :param max_bytes: The memory budget in bytes for the query boxes and
+            result ids of the chunks held at any one time.  A single query
+            with more results than fit in the budget still gets a chunk of
+            its own.
+
+        :param prefetch: If True, the next chunk is computed on a background
+            thread while the current one is being consumed.  The index must
+            not be modified while iterating.
+
+        ::
+
+            >>> from rtree import index
+            >>> idx = index.Index()
+            >>> idx.insert(1, (0, 0, 1, 1))
+            >>> idx.insert(2, (2, 2, 3, 3))
+            >>> queries = [(0, 0, 1, 1), (0, 0, 3, 3), (5, 5, 6, 6)]
+            >>> for offset, ids, counts in idx.intersection_chunks(
+            ...     queries, max_bytes=512
+            ... ):
+            ...     print(offset, ids.tolist(), counts.tolist())
+            0 [1, 1, 2] [1, 2]
+            2 [] [0]
+        """
+        import numpy as np
+
+        # Split the budget between the chunk being consumed, the prefetched
+        # one and the one being computed, half for queries and half for ids.
+        budget = max_bytes // 6
+        d = self.properties.dimension
+        rows = max(1, budget // (16 * d + 8))
+        capacity = max(1, budget // 8)
+
+        if maxs is None:
+            batches = self._query_batches(mins, rows)
+        else:
+            if len(mins) != len(maxs):
+                raise ValueError("mins and maxs shapes not equal")
+            batches = (
+                (mins[i : i + rows], maxs[i : i + rows])
+                for i in range(0, len(mins), rows)
+            )
+        chunks = self._intersection_chunks(batches, capacity, np)
+        return _prefetch(chunks) if prefetch else chunks
+
+    def _query_batches(self, queries, rows):
+        import numpy as np
+
+        it = iter(queries)
+        while batch := list(itertools.islice(it, rows)):
+            pairs = [self._split_coordinates(coordinates) for coordinates in batch]
+            mins = np.array([p for p, _ in pairs], dtype=np.float64)
+            maxs = np.array([q for _, q in pairs], dtype=np.float64)
+            if (mins > maxs).any():
+                raise RTreeError(
+                    "Coordinates must not have minimums more than maximums"
+                )
+            yield mins, maxs
+
+    def _intersection_chunks(self, batches, capacity, np):
+        offset = 0
+        for mins, maxs in batches:
+            mins, maxs = self._prepare_v_arrays(mins, maxs)
+            n, d = mins.shape
+            d_i_stri = mins.strides[0] // mins.itemsize
+            d_j_stri = mins.strides[1] // mins.itemsize
+
+            offn = 0
+            while offn < n:
+                ids = np.empty(capacity, dtype=np.int64)
+                counts = np.empty(n - offn, dtype=np.uint64)
+                nr = ctypes.c_int64(0)
+                core.rt.Index_Intersects_id_v(
+                    self.handle,
+                    n - offn,
+                    d,
+                    capacity,
+                    d_i_stri,
+                    d_j_stri,
+                    mins[offn:].ctypes.data,
+                    maxs[offn:].ctypes.data,
+                    ids.ctypes.data,
+                    counts.ctypes.data,
+                    ctypes.byref(nr),
+                )
+                done = nr.value
+                if done == 0:
+                    # The next query alone overflows the budget, so query it
+                    # again with room for its results (left in counts[0]).
+                    ids = np.empty(int(counts[0]), dtype=np.int64)
+                    core.rt.Index_Intersects_id_v(
+                        self.handle,
+                        1,
+                        d,
+                        len(ids),
+                        d_i_stri,
+                        d_j_stri,
+                        mins[offn:].ctypes.data,
+                        maxs[offn:].ctypes.data,
+                        ids.ctypes.data,
+                        counts.ctypes.data,
+                        ctypes.byref(nr),
+                    )
+                    done = 1
+                counts = counts[:done]
+                yield offset + offn, ids[: int(counts.sum())], counts
+                offn += done
+            offset += n
+
     def nearest_v(
         self,
         mins,
@@ -1195,7 +2367,8 @@ class Index:
 
                 ids.resize(2 * len(ids) + counts[offn], refcheck=False)
 
-    def _prepare_v_arrays(self, mins, maxs):
+    @staticmethod
+    def _prepare_v_arrays(mins, maxs):
         import numpy as np
 
         # Ensure inputs are 2D float64 arrays
@@ -1315,12 +2488,25 @@ class Index:
             ...             (3.0, 5.0)))  # doctest: +SKIP
 
         """
+        if self._pending is not None:
+            if self.properties.type != RT_TPRTree:
+                self.get_coordinate_pointers(coordinates)
+            self._pending.append((self.delete, id, coordinates))
+            return
+        self._invalidate(coordinates)
+        self._discard_size()
         if self.properties.type == RT_TPRTree:
             return self._deleteTP(id, *coordinates)
         p_mins, p_maxs = self.get_coordinate_pointers(coordinates)
-        core.rt.Index_DeleteData(
-            self.handle, id, p_mins, p_maxs, self.properties.dimension
-        )
+        with self._capture(Index.delete, self, id, coordinates):
+            # The entry may not exist, so the entries in its box are counted
+            # to tell whether it was deleted
+            before = self._count(coordinates) if self._size is not None else 0
+            core.rt.Index_DeleteData(
+                self.handle, id, p_mins, p_maxs, self.properties.dimension
+            )
+            if before:
+                self._track_size(self._count(coordinates) - before)
 
     def _deleteTP(
         self,
@@ -1343,11 +2529,14 @@ class Index:
             t_end,
             self.properties.dimension,
         )
+        # Counted again when needed, as the entry may not have existed
+        self._size = None
 
     def valid(self) -> bool:
         return bool(core.rt.Index_IsValid(self.handle))
 
     def clearBuffer(self):
+        self._invalidate()
         return core.rt.Index_ClearBuffer(self.handle)
 
     @classmethod
@@ -1394,9 +2583,10 @@ class Index:
             )
         return interleaved
 
-    def _create_idx_from_stream(self, stream):
+    def _create_idx_from_stream(self, stream, raw=False):
         """This function is used to instantiate the index given an
-        iterable stream of data."""
+        iterable stream of data.  With ``raw`` the stream yields
+        ``(id, mins, maxs, serialized)`` entries instead."""
 
         stream_iter = iter(stream)
         dimension = self.properties.dimension
@@ -1406,6 +2596,8 @@ class Index:
         no_data = ctypes.cast(
             ctypes.pointer(ctypes.c_ubyte(0)), ctypes.POINTER(ctypes.c_ubyte)
         )
+        # keeps the data of the current entry alive until the next one
+        current = [None]
 
         def py_next_item(p_id, p_mins, p_maxs, p_dimension, p_data, p_length):
             """This function must fill pointers to individual entries that will
@@ -1414,7 +2606,10 @@ class Index:
             than 0, it is assumed that the stream of data is done."""
 
             try:
-                p_id[0], coordinates, obj = next(stream_iter)
+                if raw:
+                    p_id[0], mins[:], maxs[:], obj = next(stream_iter)
+                else:
+                    p_id[0], coordinates, obj = next(stream_iter)
             except StopIteration:
                 # we're done
                 return -1
@@ -1422,7 +2617,9 @@ class Index:
                 self._exception = exc
                 return -1
 
-            if self.interleaved:
+            if raw:
+                pass  # mins and maxs were filled above
+            elif self.interleaved:
                 mins[:] = coordinates[:dimension]
                 maxs[:] = coordinates[dimension:]
             else:
@@ -1434,11 +2631,16 @@ class Index:
 
             # set the dimension
             p_dimension[0] = dimension
-            if obj is None:
+            if obj is None or (raw and not len(obj)):
                 p_data[0] = no_data
                 p_length[0] = 0
             else:
-                p_length[0], data, _ = self._serialize(obj)
+                if raw:
+                    p_length[0] = len(obj)
+                    data = ctypes.create_string_buffer(bytes(obj), len(obj))
+                else:
+                    p_length[0], data, _ = self._serialize(obj)
+                current[0] = data
                 p_data[0] = ctypes.cast(data, ctypes.POINTER(ctypes.c_ubyte))
 
             return 0
@@ -1480,7 +2682,31 @@ class Index:
             maxbuf.ctypes.data,
         )
 
-    def leaves(self):
+    def leaves(self, as_arrays: bool = False):
+        """Return the leaves of the tree.
+
+        :param as_arrays: If True, return NumPy arrays instead of a list,
+            which is much faster for large indexes.
+
+        :return: A list of ``(id, child_ids, bounds)`` tuples, one for each
+            leaf, of the id of the leaf, the ids of its entries and its
+            bounds in interleaved order.  If ``as_arrays`` is True, a tuple
+            of arrays ``(ids, bounds, offsets, child_ids)`` instead, of the
+            leaf ids of shape `(n,)`, their bounds of shape `(n, 2 * d)` in
+            interleaved order, and the entry ids of all leaves of shape
+            `(sum(sizes),)`, where those of leaf ``i`` are at
+            ``child_ids[offsets[i]:offsets[i + 1]]``.
+
+        ::
+
+            >>> from rtree import index
+            >>> idx = index.Index()
+            >>> idx.insert(4, (0, 0, 1, 1))
+            >>> idx.insert(7, (2, 2, 3, 3))
+            >>> ids, bounds, offsets, child_ids = idx.leaves(as_arrays=True)
+            >>> bounds, offsets, child_ids
+            (array([[0., 0., 3., 3.]]), array([0, 2]), array([4, 7]))
+        """
         leaf_node_count = ctypes.c_uint32()
         p_leafsizes = ctypes.pointer(ctypes.c_uint32())
         p_leafids = ctypes.pointer(ctypes.c_int64())
@@ -1501,9 +2727,70 @@ class Index:
             ctypes.byref(dimension),
         )
 
+        try:
+            if as_arrays:
+                return self._leaf_arrays(
+                    leaf_node_count.value,
+                    dimension.value,
+                    p_leafsizes,
+                    p_leafids,
+                    pp_childids,
+                    pp_mins,
+                    pp_maxs,
+                )
+            return self._leaf_list(
+                leaf_node_count.value,
+                dimension,
+                p_leafsizes,
+                p_leafids,
+                pp_childids,
+                pp_mins,
+                pp_maxs,
+            )
+        finally:
+            # free the arrays of the leaves
+            for p in (p_leafsizes, p_leafids, pp_childids, pp_mins, pp_maxs):
+                core.rt.Index_Free(ctypes.cast(p, ctypes.POINTER(ctypes.c_void_p)))
+
+    @staticmethod
+    def _leaf_arrays(count, dimension, p_sizes, p_ids, pp_childids, pp_mins, pp_maxs):
+        import numpy as np
+
+        def as_array(p, ctype, dtype):
+            array = np.empty(count, dtype=dtype)
+            ctypes.memmove(array.ctypes.data, p, count * ctypes.sizeof(ctype))
+            return array
+
+        sizes = as_array(p_sizes, ctypes.c_uint32, np.uint32).astype(np.int64)
+        ids = as_array(p_ids, ctypes.c_int64, np.int64)
+        # The addresses of the child ids and bounds of every leaf
+        children = as_array(pp_childids, ctypes.c_void_p, np.uintp).tolist()
+        p_mins = as_array(pp_mins, ctypes.c_void_p, np.uintp).tolist()
+        p_maxs = as_array(pp_maxs, ctypes.c_void_p, np.uintp).tolist()
+
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        child_ids = np.empty(offsets[-1], dtype=np.int64)
+        bounds = np.empty((count, 2 * dimension), dtype=np.float64)
+        address = child_ids.ctypes.data
+        row = bounds.ctypes.data
+        width = 8 * dimension
+        for i, size in enumerate(sizes.tolist()):
+            ctypes.memmove(address, children[i], 8 * size)
+            ctypes.memmove(row, p_mins[i], width)
+            ctypes.memmove(row + width, p_maxs[i], width)
+            address += 8 * size
+            row += 2 * width
+            for p in (children[i], p_mins[i], p_maxs[i]):
+                core.rt.Index_Free(ctypes.cast(p, ctypes.POINTER(ctypes.c_void_p)))
+        return ids, bounds, offsets, child_ids
+
+    @staticmethod
+    def _leaf_list(
+        count, dimension, p_leafsizes, p_leafids, pp_childids, pp_mins, pp_maxs
+    ):
         output = []
 
-        count = leaf_node_count.value
         sizes = ctypes.cast(p_leafsizes, ctypes.POINTER(ctypes.c_uint32 * count))
         ids = ctypes.cast(p_leafids, ctypes.POINTER(ctypes.c_int64 * count))
         child = ctypes.cast(
@@ -1605,6 +2892,185 @@ class Item:
         return loads(data)
 
 
+class QueryCache:
+    """A least-recently-used cache of :class:`Index` query results.
+
+    Pass an instance as the ``cache`` argument of :class:`Index` to answer
+    repeated :meth:`~Index.intersection`, :meth:`~Index.nearest` and
+    :meth:`~Index.count` queries without traversing the tree again.
+    Results are keyed by the query kind, its coordinates, the number of
+    results and the ``objects`` mode.  Queries with ``objects=True`` are not
+    cached, and objects returned with ``objects="raw"`` are shared between
+    callers.  A cache must not be shared by several indexes.
+
+    Every :meth:`~Index.insert`, :meth:`~Index.delete` and
+    :meth:`~Index.clearBuffer` bumps the cache :attr:`generation`, which
+    invalidates all cached results.  With ``spatial=True`` a modification
+    only drops the intersection and count results whose query box overlaps
+    the modified entry (and all nearest-neighbor results).
+
+    ::
+
+        >>> from rtree import index
+        >>> cache = index.QueryCache(max_entries=100)
+        >>> idx = index.Index(cache=cache)
+        >>> idx.insert(1, (0, 0, 1, 1))
+        >>> list(idx.intersection((0, 0, 2, 2)))
+        [1]
+        >>> list(idx.intersection((0, 0, 2, 2)))
+        [1]
+        >>> cache.hits, cache.misses
+        (1, 1)
+        >>> idx.insert(2, (1, 1, 2, 2))
+        >>> list(idx.intersection((0, 0, 2, 2)))
+        [1, 2]
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int | None = None,
+        spatial: bool = False,
+    ) -> None:
+        """
+        :param max_entries: The maximum number of cached results.
+
+        :param max_bytes: An optional limit on the estimated memory used by
+            the cached results.
+
+        :param spatial: If True, modifications only invalidate the cached
+            results they can affect instead of the whole cache.
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries must be > 0")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.spatial = spatial
+        self.generation = 0
+        self.nbytes = 0
+        self._entries: OrderedDict[tuple, tuple[int, Any, int, int, list | None]]
+        self._entries = OrderedDict()
+        self._keys: dict[int, tuple] = {}
+        self._serial = 0
+        self._boxes: Index | None = None
+        self._nearest: set[tuple] = set()
+        self.reset_stats()
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "spatial": self.spatial,
+        }
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(**state)  # type: ignore[misc]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def reset_stats(self) -> None:
+        """Reset the hit, miss, eviction and invalidation counters."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups answered from the cache"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict[str, Any]:
+        """Return the cache counters as a dictionary."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "generation": self.generation,
+        }
+
+    def clear(self) -> None:
+        """Drop all cached results."""
+        self._entries.clear()
+        self._keys.clear()
+        self._nearest.clear()
+        self._boxes = None
+        self.nbytes = 0
+
+    def get(self, key: tuple) -> Any:
+        """Return the cached result for ``key``, or None."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != self.generation:
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: tuple, result: Any, mins: list, maxs: list) -> None:
+        """Cache ``result`` for ``key``, the query of the box given by
+        ``mins`` and ``maxs``."""
+        if key in self._entries:
+            self._remove(key)
+        nbytes = sys.getsizeof(result)
+        if isinstance(result, list):
+            nbytes += sum(map(sys.getsizeof, result))
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+
+        self._serial += 1
+        serial = self._serial
+        box = None
+        if self.spatial:
+            if key[0] == "nearest":
+                self._nearest.add(key)
+            else:
+                if self._boxes is None:
+                    self._boxes = Index(properties=Property(dimension=len(mins)))
+                box = list(mins) + list(maxs)
+                self._boxes.insert(serial, box)
+        self._entries[key] = (self.generation, result, nbytes, serial, box)
+        self._keys[serial] = key
+        self.nbytes += nbytes
+
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, mins: list | None = None, maxs: list | None = None) -> None:
+        """Invalidate cached results after a modification of the box given
+        by ``mins`` and ``maxs``, or of the whole index if not given."""
+        self.invalidations += 1
+        if not self.spatial or mins is None or maxs is None:
+            self.generation += 1
+            return
+        for key in list(self._nearest):
+            self._remove(key)
+        if self._boxes is not None:
+            box = list(mins) + list(maxs)
+            for serial in list(self._boxes.intersection(box)):
+                self._remove(self._keys[serial])
+
+    def _remove(self, key: tuple) -> None:
+        _, _, nbytes, serial, box = self._entries.pop(key)
+        del self._keys[serial]
+        self.nbytes -= nbytes
+        if key[0] == "nearest":
+            self._nearest.discard(key)
+        elif self._boxes is not None and box is not None:
+            self._boxes.delete(serial, box)
+
+
 class InvalidHandleException(Exception):
     """Handle has been destroyed and can no longer be used"""
 
@@ -2270,6 +3736,67 @@ class CustomStorage(ICustomStorage):
         raise NotImplementedError("You must override this method.")
 
 
+class ZeroCopyStorage(CustomStorage):
+    """A variant of :class:`CustomStorage` that hands pages to the storage
+    as memoryviews of the C buffers instead of Python strings.
+
+    Loading a page calls :meth:`pageLength`, allocates the buffer that is
+    passed to libspatialindex, and calls :meth:`loadByteArrayInto` with a
+    writable memoryview of it, so the storage writes the page straight into
+    its final place, like :meth:`io.RawIOBase.readinto`.  Storing a page
+    passes a read-only memoryview of the C data to :meth:`storeByteArray`.
+    The memoryviews are only valid during the call.
+
+    Derive from this class and override :meth:`pageLength`,
+    :meth:`loadByteArrayInto` and the remaining methods of
+    :class:`CustomStorage` except :meth:`loadByteArray`."""
+
+    def _loadByteArray(self, context, page, resultLen, resultData, returnError):
+        count = self.pageLength(page, returnError)
+        if returnError.contents.value != self.NoError:
+            return
+        buffer = self.allocateBuffer(count)
+        view = memoryview((ctypes.c_uint8 * count).from_address(buffer)).cast("B")
+        try:
+            self.loadByteArrayInto(page, view, returnError)
+        finally:
+            view.release()
+        if returnError.contents.value != self.NoError:
+            core.rt.SIDX_DeleteBuffer(buffer)
+            return
+        resultLen.contents.value = count
+        resultData[0] = ctypes.cast(buffer, ctypes.POINTER(ctypes.c_uint8))
+
+    def _storeByteArray(self, context, page, len, data, returnError):
+        array = ctypes.cast(data, ctypes.POINTER(ctypes.c_uint8 * len)).contents
+        view = memoryview(array).cast("B").toreadonly()
+        try:
+            newPageId = self.storeByteArray(page.contents.value, view, returnError)
+        finally:
+            view.release()
+        page.contents.value = newPageId
+
+    def loadByteArray(self, page, returnError):
+        """Return the data of a page as a string, for storages that wrap this
+        one."""
+        data = bytearray(self.pageLength(page, returnError))
+        if returnError.contents.value == self.NoError:
+            self.loadByteArrayInto(page, memoryview(data), returnError)
+        return bytes(data)
+
+    def pageLength(self, page, returnError):
+        """Must be overridden. Must return the length of the data of page."""
+        returnError.contents.value = self.IllegalStateError
+        raise NotImplementedError("You must override this method.")
+
+    def loadByteArrayInto(self, page, buffer, returnError):
+        """Must be overridden. Must write the data of page into the writable
+        memoryview buffer, which has the length returned by
+        :meth:`pageLength`."""
+        returnError.contents.value = self.IllegalStateError
+        raise NotImplementedError("You must override this method.")
+
+
 class RtreeContainer(Rtree):
     """An R-Tree, MVR-Tree, or TPR-Tree indexed container for python objects"""
 
@@ -2601,12 +4128,22 @@ class RtreeContainer(Rtree):
             self._objects[id(obj)] = (count, obj)
         return super().delete(id(obj), coordinates)
 
-    def leaves(self):
+    def leaves(self, as_arrays: bool = False):
+        """Return the leaves of the tree, with the objects of their entries
+        in place of the entry ids.  See :meth:`Index.leaves`.
+
+        :param as_arrays: If True, return NumPy arrays instead of a list,
+            with the objects in an array of dtype ``object``.
+        """
+        if as_arrays:
+            import numpy as np
+
+            ids, bounds, offsets, child_ids = super().leaves(as_arrays=True)
+            objects = np.empty(len(child_ids), dtype=object)
+            for i, child_id in enumerate(child_ids.tolist()):
+                objects[i] = self._objects[child_id][1]
+            return ids, bounds, offsets, objects
         return [
-            (
-                self._objects[id][1],
-                [self._objects[child_id][1] for child_id in child_ids],
-                bounds,
-            )
+            (id, [self._objects[child_id][1] for child_id in child_ids], bounds)
             for id, child_ids, bounds in super().leaves()
         ]
@@ -0,0 +1,564 @@
+"""
+A read-only, memory-mapped index stored as flat arrays.
+"""
+
+from __future__ import annotations
+
+import heapq
+import os
+import pickle
+import struct
+import sys
+from collections.abc import Iterator, Sequence
+from typing import Any
+
+from .exceptions import RTreeError
+from .index import Index
+from .parallel import _box_distance
+
+__all__ = ["PackedIndex", "SharedIndex"]
+
+# A packed file starts with this magic and a header of the format version,
+# the dimension, the node capacity, the number of node levels and the number
+# of entries.  The sizes of all levels, entries first, follow as int64.
+_MAGIC = b"RTREEPCK"
+_HEADER = struct.Struct("<8sIIIIQ")
+_VERSION = 1
+
+
+def _str_order(mins, maxs, capacity):
+    """Return the Sort-Tile-Recursive order of the given boxes, which puts
+    boxes that are close to each other in the same runs of ``capacity``."""
+    import numpy as np
+
+    centers = (mins + maxs) / 2
+    dimension = centers.shape[1]
+    order = np.empty(len(centers), dtype=np.int64)
+
+    def tile(rows, axis, out):
+        if axis == dimension - 1 or len(rows) <= capacity:
+            out[:] = rows[np.argsort(centers[rows, axis], kind="stable")]
+            return
+        nodes = -(-len(rows) // capacity)
+        slices = int(np.ceil(nodes ** (1 / (dimension - axis))))
+        size = -(-nodes // slices) * capacity
+        rows = rows[np.argsort(centers[rows, axis], kind="stable")]
+        for start in range(0, len(rows), size):
+            tile(rows[start : start + size], axis + 1, out[start : start + size])
+
+    tile(np.arange(len(centers)), 0, order)
+    return order
+
+
+class PackedIndex:
+    """A read-only R-tree packed into flat arrays in a single file.
+
+    The tree is written once by :meth:`write` or :meth:`from_index`: entries
+    are ordered with Sort-Tile-Recursive packing and grouped into full nodes
+    of ``node_capacity`` children, level by level up to a single root.  The
+    node bounds, the offsets of every node's children in the level below,
+    the entry ids and the serialized objects are stored as contiguous arrays.
+
+    Opening the file maps it with :func:`numpy.memmap` instead of reading it,
+    so startup is near-instant and processes on the same machine share the
+    pages of the operating system's file cache.  Queries traverse the tree
+    one level at a time with vectorized box tests.
+
+    ::
+
+        >>> import os, tempfile
+        >>> import numpy as np
+        >>> from rtree.packed import PackedIndex
+        >>> filename = os.path.join(tempfile.mkdtemp(), "packed.rtp")
+        >>> mins = np.array([[0.0, 0.0], [5.0, 5.0]])
+        >>> packed = PackedIndex.write(filename, [1, 2], mins, mins + 1,
+        ...                            objects=["a", "b"])
+        >>> list(packed.intersection((0, 0, 2, 2)))
+        [1]
+        >>> list(packed.nearest((6, 6), 1, objects="raw"))
+        ['b']
+        >>> packed.close()
+    """
+
+    def __init__(self, filename: str, interleaved: bool = True) -> None:
+        """
+        :param filename: The file written by :meth:`write`.
+
+        :param interleaved: The coordinate ordering of queries, see
+            :attr:`rtree.index.Index.interleaved`.
+        """
+        import numpy as np
+
+        self.filename = filename
+        self.interleaved = interleaved
+        self._open(np.memmap(filename, dtype=np.uint8, mode="r"), f"'{filename}'")
+
+    def _open(self, data, source):
+        # Set up array views of the packed data of the tree
+        import numpy as np
+
+        try:
+            magic, version, dimension, capacity, levels, count = _HEADER.unpack(
+                data[: _HEADER.size].tobytes()
+            )
+        except struct.error:
+            raise RTreeError(f"{source} is not a packed index")
+        if magic != _MAGIC:
+            raise RTreeError(f"{source} is not a packed index")
+        if version != _VERSION:
+            raise RTreeError(f"Unsupported packed index version {version}")
+        self.dimension = dimension
+        self.node_capacity = capacity
+
+        offset = _HEADER.size
+
+        def take(dtype, size, shape=None):
+            nonlocal offset
+            nbytes = np.dtype(dtype).itemsize * size
+            array = data[offset : offset + nbytes].view(dtype)
+            offset += nbytes
+            return array if shape is None else array.reshape(shape)
+
+        sizes = take("<i8", levels + 1).tolist()
+        self._ids = take("<i8", count)
+        self._ranges = take("<i8", 2 * count, (count, 2))
+        self._mins = [take("<f8", n * dimension, (n, dimension)) for n in sizes]
+        self._maxs = [take("<f8", n * dimension, (n, dimension)) for n in sizes]
+        self._children = [None] + [take("<i8", 2 * n, (n, 2)) for n in sizes[1:]]
+        self._payloads = data[offset:]
+        self._data = data
+
+    @classmethod
+    def write(
+        cls,
+        filename: str,
+        ids: Sequence[int],
+        mins: Any,
+        maxs: Any,
+        *,
+        objects: Sequence[object] | None = None,
+        node_capacity: int = 32,
+    ) -> PackedIndex:
+        """Pack entries into a file and open it.
+
+        :param filename: The file to write.
+
+        :param ids: A sequence of entry ids.
+
+        :param mins: An array of the entries' minimum coordinates, of shape
+            ``(n, d)``.
+
+        :param maxs: An array of the entries' maximum coordinates.
+
+        :param objects: An optional sequence of objects to store with the
+            entries.  They are pickled with :meth:`dumps`.
+
+        :param node_capacity: The number of children of each node.
+        """
+        payloads = None
+        if objects is not None:
+            payloads = [b"" if obj is None else cls.dumps(obj) for obj in objects]
+        cls._write(filename, ids, mins, maxs, payloads, node_capacity)
+        return cls(filename)
+
+    @classmethod
+    def from_index(
+        cls, filename: str, index: Index, *, node_capacity: int = 32
+    ) -> PackedIndex:
+        """Pack the entries and stored objects of an :class:`~rtree.index.Index`
+        into a file and open it with the same coordinate ordering.
+
+        :param filename: The file to write.
+
+        :param index: The index to export.
+
+        :param node_capacity: The number of children of each node.
+        """
+        ids, mins, maxs, payloads = cls._index_entries(index)
+        cls._write(filename, ids, mins, maxs, payloads, node_capacity)
+        return cls(filename, interleaved=index.interleaved)
+
+    @staticmethod
+    def _index_entries(index):
+        _, ids, mins, maxs, offsets, payloads = index._read_snapshot(index.to_bytes())
+        return ids, mins, maxs, (payloads, offsets) if offsets[-1] else None
+
+    @classmethod
+    def _write(cls, filename, ids, mins, maxs, payloads, capacity):
+        with open(filename, "wb") as f:
+            for chunk in cls._pack(ids, mins, maxs, payloads, capacity):
+                f.write(chunk)
+
+    @staticmethod
+    def _pack(ids, mins, maxs, payloads, capacity):
+        """Return the packed tree of the given entries as a list of chunks."""
+        import numpy as np
+
+        ids = np.asarray(ids, dtype=np.int64)
+        mins = np.atleast_2d(np.asarray(mins, dtype=np.float64))
+        maxs = np.atleast_2d(np.asarray(maxs, dtype=np.float64))
+        if mins.shape != maxs.shape:
+            raise ValueError("mins and maxs shapes not equal")
+        if len(ids) != len(mins):
+            raise ValueError("index and point counts different")
+        if not len(ids):
+            raise ValueError("cannot pack an empty index")
+        if (mins > maxs).any():
+            raise RTreeError("Coordinates must not have minimums more than maximums")
+        if capacity < 2:
+            raise ValueError("node_capacity must be >= 2")
+
+        if payloads is None:
+            blob, offsets = b"", np.zeros(len(ids) + 1, dtype=np.int64)
+        elif isinstance(payloads, tuple):
+            blob, offsets = payloads
+        else:
+            offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+            np.cumsum([len(p) for p in payloads], out=offsets[1:])
+            blob = b"".join(payloads)
+        if len(offsets) != len(ids) + 1:
+            raise ValueError("index and object counts different")
+
+        # Order the entries, then build each level from the level below,
+        # reordering the nodes below so that siblings are contiguous.  Each
+        # node keeps the range of its children in the level below.
+        order = _str_order(mins, maxs, capacity)
+        ids, mins, maxs = ids[order], mins[order], maxs[order]
+        ranges = np.stack([offsets[:-1][order], offsets[1:][order]], axis=1)
+        levels_mins, levels_maxs, children = [mins], [maxs], [ranges]
+        while len(levels_mins) == 1 or len(levels_mins[-1]) > 1:
+            below_mins, below_maxs = levels_mins[-1], levels_maxs[-1]
+            if len(levels_mins) > 1:
+                order = _str_order(below_mins, below_maxs, capacity)
+                levels_mins[-1] = below_mins = below_mins[order]
+                levels_maxs[-1] = below_maxs = below_maxs[order]
+                children[-1] = children[-1][order]
+            starts = np.arange(0, len(below_mins), capacity)
+            levels_mins.append(np.minimum.reduceat(below_mins, starts))
+            levels_maxs.append(np.maximum.reduceat(below_maxs, starts))
+            children.append(
+                np.stack([starts, np.append(starts[1:], len(below_mins))], axis=1)
+            )
+
+        # Entries keep the range of their stored object in the payload data.
+        ranges = children.pop(0)
+        header = _HEADER.pack(
+            _MAGIC, _VERSION, mins.shape[1], capacity, len(children), len(ids)
+        )
+        sizes = np.array([len(m) for m in levels_mins], dtype="<i8")
+        arrays = [sizes, ids, ranges] + levels_mins + levels_maxs + children
+        return (
+            [header]
+            + [
+                array.astype(array.dtype.newbyteorder("<")).tobytes()
+                for array in arrays
+            ]
+            + [blob]
+        )
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __repr__(self) -> str:
+        name = type(self).__name__
+        return f"rtree.packed.{name}(bounds={self.bounds}, size={len(self)})"
+
+    def __enter__(self) -> PackedIndex:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Unmap the file."""
+        self._data = self._payloads = None
+        self._ids = self._ranges = None
+        self._mins = self._maxs = self._children = []
+
+    @staticmethod
+    def dumps(obj: object) -> bytes:
+        return pickle.dumps(obj)
+
+    @staticmethod
+    def loads(string: bytes) -> object:
+        return pickle.loads(string)
+
+    @property
+    def bounds(self) -> list[Any]:
+        """The bounding box of all entries, in the query coordinate ordering"""
+        bounds = self._mins[-1][0].tolist() + self._maxs[-1][0].tolist()
+        return bounds if self.interleaved else Index.deinterleave(bounds)
+
+    def _split(self, coordinates):
+        import numpy as np
+
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        dimension = self.dimension
+        if coordinates.shape == (dimension,):
+            return coordinates, coordinates
+        if coordinates.shape != (2 * dimension,):
+            raise RTreeError(
+                f"Coordinates must have {dimension} or {2 * dimension} values"
+            )
+        if self.interleaved:
+            mins, maxs = coordinates[:dimension], coordinates[dimension:]
+        else:
+            mins, maxs = coordinates[::2], coordinates[1::2]
+        if (mins > maxs).any():
+            raise RTreeError("Coordinates must not have minimums more than maximums")
+        return mins, maxs
+
+    def _objects(self, rows):
+        for start, end in self._ranges[rows].tolist():
+            yield (
+                self.loads(self._payloads[start:end].tobytes()) if end > start else None
+            )
+
+    def _traverse(self, qmins, qmaxs):
+        """Return the query rows and entry rows of all intersecting pairs,
+        grouped by query."""
+        import numpy as np
+
+        rows = np.arange(len(qmins))
+        top = len(self._mins) - 1
+        keep = ((qmins <= self._maxs[top][0]) & (qmaxs >= self._mins[top][0])).all(1)
+        rows = rows[keep]
+        nodes = np.zeros(len(rows), dtype=np.int64)
+        for level in range(top, 0, -1):
+            # Expand every node to its children and keep the intersecting ones
+            starts, ends = self._children[level][nodes].T
+            counts = ends - starts
+            rows = np.repeat(rows, counts)
+            first = np.cumsum(counts) - counts
+            nodes = np.arange(counts.sum()) + np.repeat(starts - first, counts)
+            keep = (
+                (qmins[rows] <= self._maxs[level - 1][nodes])
+                & (qmaxs[rows] >= self._mins[level - 1][nodes])
+            ).all(1)
+            rows, nodes = rows[keep], nodes[keep]
+        return rows, nodes
+
+    def intersection(self, coordinates: Any, objects: bool | str = False) -> Iterator:
+        """Return the ids, or with ``objects="raw"`` the stored objects, of
+        the entries that intersect the given coordinates.  See
+        :meth:`rtree.index.Index.intersection`.
+
+        :param coordinates: A point or bounding box in the ordering given by
+            :attr:`interleaved`.
+
+        :param objects: If ``"raw"``, return the stored objects instead of
+            the ids.
+        """
+        mins, maxs = self._split(coordinates)
+        _, rows = self._traverse(mins[None], maxs[None])
+        return self._results(rows, objects)
+
+    def count(self, coordinates: Any) -> int:
+        """Return the number of entries that intersect the given coordinates.
+
+        :param coordinates: A point or bounding box in the ordering given by
+            :attr:`interleaved`.
+        """
+        mins, maxs = self._split(coordinates)
+        return len(self._traverse(mins[None], maxs[None])[1])
+
+    def _results(self, rows, objects):
+        if objects == "raw":
+            return self._objects(rows)
+        if objects:
+            raise NotImplementedError("PackedIndex only returns raw objects")
+        return iter(self._ids[rows].tolist())
+
+    def intersection_v(self, mins: Any, maxs: Any):
+        """Bulk intersection query, see
+        :meth:`rtree.index.Index.intersection_v`.
+
+        :param mins: A NumPy array of shape `(n, d)` containing the minimum
+            values to query.
+
+        :param maxs: A NumPy array of shape `(n, d)` containing the maximum
+            values to query.
+
+        :returns: A tuple of the ids of all results, and the number of
+            results of each query.
+        """
+        import numpy as np
+
+        mins, maxs = Index._prepare_v_arrays(mins, maxs)
+        if mins.shape[1] != self.dimension:
+            raise RTreeError(f"Coordinates must have {self.dimension} dimensions")
+        rows, nodes = self._traverse(mins, maxs)
+        counts = np.bincount(rows, minlength=len(mins)).astype(np.uint64)
+        return self._ids[nodes].copy(), counts
+
+    def nearest(
+        self, coordinates: Any, num_results: int = 1, objects: bool | str = False
+    ) -> Iterator:
+        """Return the ids, or with ``objects="raw"`` the stored objects, of
+        the ``num_results`` nearest entries to the given coordinates, nearest
+        first.  Entries at the same distance as the last one are returned
+        too.  See :meth:`rtree.index.Index.nearest`.
+
+        :param coordinates: A point or bounding box in the ordering given by
+            :attr:`interleaved`.
+
+        :param num_results: The number of results to return.
+
+        :param objects: If ``"raw"``, return the stored objects instead of
+            the ids.
+        """
+        import numpy as np
+
+        if num_results < 1:
+            raise ValueError("num_results must be >= 1")
+        qmins, qmaxs = self._split(coordinates)
+        top = len(self._mins) - 1
+        heap = [(0.0, top, 0)]
+        rows: list[int] = []
+        distance = np.inf
+        while heap:
+            dist, level, node = heapq.heappop(heap)
+            if dist > distance:
+                break
+            if level == 0:
+                rows.append(node)
+                if len(rows) == num_results:
+                    distance = dist
+                continue
+            start, end = self._children[level][node].tolist()
+            dists = _box_distance(
+                qmins,
+                qmaxs,
+                self._mins[level - 1][start:end],
+                self._maxs[level - 1][start:end],
+            )
+            for child, d in enumerate(dists.tolist(), start):
+                if d <= distance:
+                    heapq.heappush(heap, (d, level - 1, child))
+        return self._results(np.array(rows, dtype=np.int64), objects)
+
+
+def _shared_memory(name, size=0):
+    """Create or attach to a shared memory segment that is not unlinked by
+    the :mod:`multiprocessing` resource tracker when a process exits, as a
+    worker attaching to an index must not remove it."""
+    from multiprocessing import resource_tracker, shared_memory
+
+    create = bool(size)
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, create, size, track=False)
+    shm = shared_memory.SharedMemory(name, create, size)
+    if os.name == "posix":
+        resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+    return shm
+
+
+class SharedIndex(PackedIndex):
+    """A :class:`PackedIndex` published in :mod:`multiprocessing.shared_memory`.
+
+    :meth:`publish` packs an index into a named shared memory segment, and
+    other processes on the same machine attach to it by name without copying
+    it.  A :class:`SharedIndex` pickles as its name, so it can be passed to
+    the workers of a :class:`multiprocessing.pool.Pool` directly.
+
+    The publishing process owns the segment and must :meth:`unlink` it when
+    it is no longer needed, which leaving a ``with`` block of the published
+    index does.
+
+    ::
+
+        >>> from rtree import index
+        >>> from rtree.packed import SharedIndex
+        >>> idx = index.Index()
+        >>> idx.insert(1, (0, 0, 1, 1))
+        >>> with SharedIndex.publish(idx) as shared:
+        ...     attached = SharedIndex(shared.name)
+        ...     print(list(attached.intersection((0, 0, 2, 2))))
+        ...     attached.close()
+        [1]
+    """
+
+    #: The name of the shared memory segment
+    name: str
+
+    def __init__(self, name: str, interleaved: bool = True) -> None:
+        """Attach to a published index.
+
+        :param name: The :attr:`name` of the published index.
+
+        :param interleaved: The coordinate ordering of queries, see
+            :attr:`rtree.index.Index.interleaved`.
+        """
+        self._attach(_shared_memory(name), interleaved, owner=False)
+
+    def _attach(self, shm, interleaved, owner):
+        import numpy as np
+
+        self._shm = shm
+        self._owner = owner
+        self.name = shm.name
+        self.filename = None
+        self.interleaved = interleaved
+        self._open(np.frombuffer(shm.buf, dtype=np.uint8), f"'{shm.name}'")
+
+    @classmethod
+    def publish(
+        cls, index: Index, *, name: str | None = None, node_capacity: int = 32
+    ) -> SharedIndex:
+        """Pack the entries and stored objects of an :class:`~rtree.index.Index`
+        into a new shared memory segment.
+
+        :param index: The index to publish.
+
+        :param name: The name of the segment.  A unique name is chosen if not
+            given.
+
+        :param node_capacity: The number of children of each node.
+        """
+        ids, mins, maxs, payloads = cls._index_entries(index)
+        chunks = cls._pack(ids, mins, maxs, payloads, node_capacity)
+        shm = _shared_memory(name, sum(len(chunk) for chunk in chunks))
+        offset = 0
+        for chunk in chunks:
+            shm.buf[offset : offset + len(chunk)] = chunk
+            offset += len(chunk)
+
+        shared = cls.__new__(cls)
+        shared._attach(shm, index.interleaved, owner=True)
+        return shared
+
+    def __reduce__(self):
+        return type(self), (self.name, self.interleaved)
+
+    def __del__(self) -> None:
+        # The array views must go before the segment can be closed
+        if getattr(self, "_shm", None) is not None:
+            self.close()
+
+    def __enter__(self) -> SharedIndex:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+        if self._owner:
+            self.unlink()
+
+    def close(self) -> None:
+        """Detach from the shared memory segment."""
+        if self._shm is not None:
+            super().close()
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self) -> None:
+        """Remove the shared memory segment once all processes have detached
+        from it."""
+        from multiprocessing import resource_tracker
+
+        shm = self._shm or _shared_memory(self.name)
+        if sys.version_info < (3, 13) and os.name == "posix":
+            # Balance the unregistration done by unlink
+            resource_tracker.register(shm._name, "shared_memory")
+        shm.unlink()
+        if shm is not self._shm:
+            shm.close()
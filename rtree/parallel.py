@@ -0,0 +1,642 @@
+"""
+Spatially partitioned indexes that spread work across several cores.
+"""
+
+from __future__ import annotations
+
+import copy
+import multiprocessing
+import os
+from collections.abc import Iterator, Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any
+
+from .index import Index, Property
+
+__all__ = ["ShardedIndex", "PartitionedIndex"]
+
+
+def _prepare_entries(ids, mins, maxs):
+    """Validate bulk-load input and return it as contiguous arrays."""
+    import numpy as np
+
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    mins = np.ascontiguousarray(np.atleast_2d(mins), dtype=np.float64)
+    maxs = np.ascontiguousarray(np.atleast_2d(maxs), dtype=np.float64)
+    if mins.shape != maxs.shape:
+        raise ValueError("mins and maxs shapes not equal")
+    if len(ids) != len(mins):
+        raise ValueError("index and point counts different")
+    if not len(ids):
+        raise ValueError("cannot partition an empty index")
+    return ids, mins, maxs
+
+
+def _kd_partition(mins, maxs, parts):
+    """Split the rows of ``mins``/``maxs`` into at most ``parts`` groups of
+    near-equal size by recursive median cuts of the box centers along the
+    widest axis.  Returns a list of non-empty row index arrays."""
+    import numpy as np
+
+    centers = (mins + maxs) / 2
+    groups = []
+
+    def split(rows, parts):
+        if parts == 1 or len(rows) <= 1:
+            groups.append(rows)
+            return
+        c = centers[rows]
+        axis = np.argmax(c.max(axis=0) - c.min(axis=0))
+        left = parts // 2
+        k = len(rows) * left // parts
+        order = np.argpartition(c[:, axis], k)
+        split(rows[order[:k]], left)
+        split(rows[order[k:]], parts - left)
+
+    split(np.arange(len(mins)), parts)
+    return [rows for rows in groups if len(rows)]
+
+
+def _box_distance(qmins, qmaxs, mins, maxs):
+    """Euclidean minimum distance between corresponding rows of two sets of
+    boxes, which is the metric libspatialindex uses for ``k``-nearest
+    queries."""
+    import numpy as np
+
+    gap = np.maximum(0.0, np.maximum(mins - qmaxs, qmins - maxs))
+    return np.sqrt((gap * gap).sum(axis=-1))
+
+
+def _overlaps(qmins, qmaxs, mins, maxs):
+    """Return an ``(n, s)`` boolean matrix telling which of the ``n`` query
+    boxes intersect which of the ``s`` boxes."""
+    return (
+        (qmins[:, None, :] <= maxs[None, :, :])
+        & (qmaxs[:, None, :] >= mins[None, :, :])
+    ).all(axis=-1)
+
+
+def _merge_csr(n, parts):
+    """Merge per-shard ``(rows, ids, counts)`` results for a batch of ``n``
+    queries into a single ``(ids, counts)`` pair in query order."""
+    import numpy as np
+
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.zeros(n, dtype=np.uint64)
+    qrow = np.concatenate(
+        [np.repeat(rows, counts.astype(np.int64)) for rows, _, counts in parts]
+    )
+    ids = np.concatenate([ids for _, ids, _ in parts])
+    order = np.argsort(qrow, kind="stable")
+    counts = np.bincount(qrow, minlength=n).astype(np.uint64)
+    return ids[order], counts
+
+
+def _merge_nearest(n, parts, num_results, strict):
+    """Merge per-shard ``(rows, ids, counts, dists)`` ``k``-nearest results,
+    keeping the closest ``num_results`` entries of each query (and any
+    entries tied with the furthest of them unless ``strict``).  Returns
+    ``(ids, counts, max_dists)``."""
+    import numpy as np
+
+    if not parts:
+        return (
+            np.empty(0, dtype=np.int64),
+            np.zeros(n, dtype=np.uint64),
+            np.zeros(n),
+        )
+    qrow = np.concatenate([np.repeat(p[0], p[2].astype(np.int64)) for p in parts])
+    ids = np.concatenate([p[1] for p in parts])
+    dists = np.concatenate([p[3] for p in parts])
+
+    order = np.lexsort((dists, qrow))
+    qrow, ids, dists = qrow[order], ids[order], dists[order]
+
+    counts = np.bincount(qrow, minlength=n)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.arange(len(qrow)) - starts[qrow]
+    if strict:
+        keep = rank < num_results
+    else:
+        kth = np.full(n, np.inf)
+        full = counts >= num_results
+        kth[full] = dists[starts[full] + num_results - 1]
+        keep = dists <= kth[qrow]
+
+    qrow, ids, dists = qrow[keep], ids[keep], dists[keep]
+    counts = np.bincount(qrow, minlength=n)
+    max_dists = np.zeros(n)
+    found = counts > 0
+    max_dists[found] = dists[np.cumsum(counts)[found] - 1]
+    return ids, counts.astype(np.uint64), max_dists
+
+
+class _Partition:
+    """One spatial partition: an index plus the table of its entries' ids
+    and bounds, which is needed to rank ``k``-nearest results across
+    partitions."""
+
+    def __init__(self, index: Index, ids=None, mins=None, maxs=None) -> None:
+        self.index = index
+        self._entries = None
+        if ids is not None:
+            self._set_entries(ids, mins, maxs)
+
+    def _set_entries(self, ids, mins, maxs):
+        import numpy as np
+
+        order = np.argsort(ids, kind="stable")
+        self._entries = (ids[order], mins[order], maxs[order])
+
+    @property
+    def entries(self):
+        # Partitions opened from existing indexes scan themselves once.
+        if self._entries is None:
+            import numpy as np
+
+            d = self.index.properties.dimension
+            items = list(self.index.intersection(self.index.bounds, objects=True))
+            ids = np.array([item.id for item in items], dtype=np.int64)
+            bounds = np.array([item.bounds for item in items], dtype=np.float64)
+            bounds = bounds.reshape(len(items), d, 2)
+            self._set_entries(ids, bounds[:, :, 0], bounds[:, :, 1])
+        return self._entries
+
+
+def _intersection(part, mins, maxs):
+    return part.index.intersection_v(mins, maxs)
+
+
+def _count(part, mins, maxs):
+    return part.index.intersection_v(mins, maxs)[1]
+
+
+def _nearest(part, mins, maxs, num_results, max_dists, strict):
+    import numpy as np
+
+    ids, counts = part.index.nearest_v(
+        mins, maxs, num_results=num_results, max_dists=max_dists, strict=strict
+    )
+    entry_ids, entry_mins, entry_maxs = part.entries
+    q = np.repeat(np.arange(len(counts)), counts.astype(np.int64))
+    rows = np.searchsorted(entry_ids, ids)
+    dists = _box_distance(mins[q], maxs[q], entry_mins[rows], entry_maxs[rows])
+    return ids, counts, dists
+
+
+class _Partitioned:
+    """Query routing shared by the partitioned index types.  Subclasses set
+    :attr:`partition_mins` and :attr:`partition_maxs` and implement
+    :meth:`_scatter`."""
+
+    partition_mins: Any
+    partition_maxs: Any
+
+    def _scatter(self, fn, mask, mins, maxs, *args):
+        """Run ``fn(partition, mins, maxs, *args)`` for the query rows
+        selected by the ``(n, partitions)`` boolean ``mask`` and return the
+        results as ``(rows, result)`` pairs."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _select(mask, mins, maxs, args):
+        import numpy as np
+
+        for s in range(mask.shape[1]):
+            rows = np.flatnonzero(mask[:, s])
+            if len(rows):
+                extra = [a[rows] if isinstance(a, np.ndarray) else a for a in args]
+                yield s, rows, (mins[rows], maxs[rows], *extra)
+
+    def intersection_v(self, mins, maxs):
+        """Bulk intersection query, see
+        :meth:`rtree.index.Index.intersection_v`."""
+        mins, maxs = Index._prepare_v_arrays(mins, maxs)
+        mask = _overlaps(mins, maxs, self.partition_mins, self.partition_maxs)
+        parts = self._scatter(_intersection, mask, mins, maxs)
+        return _merge_csr(len(mins), [(rows, *res) for rows, res in parts])
+
+    def count_v(self, mins, maxs):
+        """Bulk count query.  Returns a 1D NumPy array with the number of
+        entries intersecting each of the provided bounding boxes.
+
+        :param mins: A NumPy array of shape `(n, d)` containing the
+            minima to query.
+
+        :param maxs: A NumPy array of shape `(n, d)` containing the
+            maxima to query.
+        """
+        import numpy as np
+
+        mins, maxs = Index._prepare_v_arrays(mins, maxs)
+        mask = _overlaps(mins, maxs, self.partition_mins, self.partition_maxs)
+        counts = np.zeros(len(mins), dtype=np.uint64)
+        for rows, res in self._scatter(_count, mask, mins, maxs):
+            counts[rows] += res
+        return counts
+
+    def nearest_v(
+        self,
+        mins,
+        maxs,
+        *,
+        num_results=1,
+        max_dists=None,
+        strict=False,
+        return_max_dists=False,
+    ):
+        """Bulk ``k``-nearest query, see :meth:`rtree.index.Index.nearest_v`.
+
+        Each query is first sent to its closest partition.  Only partitions
+        that may hold an entry closer than the ``k``-th neighbor found there
+        are queried afterwards, and the candidates are merged by distance.
+        """
+        import numpy as np
+
+        mins, maxs = Index._prepare_v_arrays(mins, maxs)
+        n = len(mins)
+        if max_dists is not None:
+            bound = np.array(np.atleast_1d(max_dists), dtype=np.float64)
+            if bound.ndim != 1:
+                raise ValueError("max_dists must have 1 dimension")
+            if len(bound) != n:
+                raise ValueError(f"max_dists must have length {n}")
+        else:
+            bound = np.full(n, np.inf)
+
+        part_dists = _box_distance(
+            mins[:, None, :],
+            maxs[:, None, :],
+            self.partition_mins[None, :, :],
+            self.partition_maxs[None, :, :],
+        )
+        primary = np.argmin(part_dists, axis=1)
+        first = primary[:, None] == np.arange(part_dists.shape[1])[None, :]
+
+        results = self._scatter(_nearest, first, mins, maxs, num_results, bound, strict)
+        parts = [(rows, *res) for rows, res in results]
+
+        # Tighten each query's search radius to its k-th distance so far
+        _, counts, kth = _merge_nearest(n, parts, num_results, strict)
+        full = counts >= num_results
+        bound[full] = np.minimum(bound[full], kth[full])
+
+        rest = ~first & (part_dists <= bound[:, None])
+        results = self._scatter(_nearest, rest, mins, maxs, num_results, bound, strict)
+        parts += [(rows, *res) for rows, res in results]
+
+        ids, counts, dists = _merge_nearest(n, parts, num_results, strict)
+        if return_max_dists:
+            return ids, counts, dists
+        return ids, counts
+
+
+# Per-process state of a shard worker.  Each worker process owns exactly
+# one shard, built by _init_shard when the process starts.
+_shard: _Partition | None = None
+
+
+def _init_shard(ids, mins, maxs, properties):
+    global _shard
+    _shard = _Partition(
+        Index((ids, mins, maxs), properties=properties), ids, mins, maxs
+    )
+
+
+def _shard_size():
+    return len(_shard.entries[0])
+
+
+def _run_on_shard(fn, *args):
+    return fn(_shard, *args)
+
+
+class ShardedIndex(_Partitioned):
+    """An R-Tree partitioned across a pool of worker processes.
+
+    The bulk-load input is split into ``shards`` spatially compact
+    partitions with a k-d split of the box centers.  Each partition is
+    bulk-loaded into an in-memory :class:`~rtree.index.Index` owned by its
+    own worker process, so batch queries scale with the number of cores
+    instead of being bound to the one running the interpreter.
+
+    Batch queries are scattered only to the shards whose bounds can hold a
+    result and the per-shard results are gathered back into the same
+    ``(ids, counts)`` layout returned by :meth:`rtree.index.Index.intersection_v`
+    and :meth:`rtree.index.Index.nearest_v`.
+
+    .. note::
+        Entry ids are expected to be unique, and results for a single query
+        are ordered by shard rather than by the traversal of one tree.
+
+    ::
+
+        >>> import numpy as np
+        >>> from rtree.parallel import ShardedIndex
+        >>> mins = np.array([[0.0, 0.0], [5.0, 5.0], [10.0, 10.0]])
+        >>> with ShardedIndex(np.arange(3), mins, mins + 1, shards=2) as idx:
+        ...     ids, counts = idx.intersection_v([[0.5, 0.5]], [[5.5, 5.5]])
+        >>> sorted(ids.tolist()), counts.tolist()
+        ([0, 1], [2])
+    """
+
+    def __init__(
+        self,
+        ids,
+        mins,
+        maxs,
+        *,
+        shards: int | None = None,
+        properties: Property | None = None,
+        mp_context: Any = None,
+    ) -> None:
+        """Partitions the input and starts one worker process per shard.
+
+        :param ids: A NumPy array of shape `(n,)` of entry ids.
+
+        :param mins: A NumPy array of shape `(n, d)` of entry minima.
+
+        :param maxs: A NumPy array of shape `(n, d)` of entry maxima.
+
+        :param shards: The number of shards (and worker processes) to create.
+            Defaults to :func:`os.cpu_count`.  Fewer shards are created if
+            there are fewer entries.
+
+        :param properties: An :class:`~rtree.index.Property` object used for
+            every shard.  Its dimension is set from the input arrays.
+
+        :param mp_context: An optional :mod:`multiprocessing` context used to
+            start the workers.  Defaults to the ``"forkserver"`` start method
+            where available and ``"spawn"`` otherwise, as forking a process
+            that already runs other shards' threads is unsafe.
+        """
+        import numpy as np
+
+        ids, mins, maxs = _prepare_entries(ids, mins, maxs)
+
+        self.properties = properties if properties is not None else Property()
+        self.properties.dimension = mins.shape[1]
+
+        if mp_context is None:
+            methods = multiprocessing.get_all_start_methods()
+            method = "forkserver" if "forkserver" in methods else "spawn"
+            mp_context = multiprocessing.get_context(method)
+
+        groups = _kd_partition(mins, maxs, shards or os.cpu_count() or 1)
+        self.partition_mins = np.array([mins[rows].min(axis=0) for rows in groups])
+        self.partition_maxs = np.array([maxs[rows].max(axis=0) for rows in groups])
+
+        self._executors = []
+        try:
+            for rows in groups:
+                self._executors.append(
+                    ProcessPoolExecutor(
+                        max_workers=1,
+                        mp_context=mp_context,
+                        initializer=_init_shard,
+                        initargs=(ids[rows], mins[rows], maxs[rows], self.properties),
+                    )
+                )
+            # Wait for every shard to be built so failures surface here.
+            futures = [e.submit(_shard_size) for e in self._executors]
+            self.shard_sizes = [f.result() for f in futures]
+        except BaseException:
+            self.close()
+            raise
+
+    def __len__(self) -> int:
+        return sum(self.shard_sizes)
+
+    def __repr__(self) -> str:
+        return f"rtree.parallel.ShardedIndex(shards={self.shards}, size={len(self)})"
+
+    def __enter__(self) -> ShardedIndex:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    @property
+    def shards(self) -> int:
+        """The number of shards"""
+        return len(self.shard_sizes)
+
+    def close(self) -> None:
+        """Shut down the worker processes.  Renders the index inaccessible."""
+        for executor in self._executors:
+            executor.shutdown(cancel_futures=True)
+        self._executors = []
+
+    def _scatter(self, fn, mask, mins, maxs, *args):
+        if not self._executors:
+            raise RuntimeError("index is closed")
+        pending = [
+            (rows, self._executors[s].submit(_run_on_shard, fn, *task))
+            for s, rows, task in self._select(mask, mins, maxs, args)
+        ]
+        return [(rows, future.result()) for rows, future in pending]
+
+
+def _build_partition(basename, ids, mins, maxs, properties):
+    # Disk partitions are written and closed here so that they can be built
+    # in another process and reopened by the caller.
+    if basename is None:
+        return Index((ids, mins, maxs), properties=properties)
+    Index(basename, (ids, mins, maxs), properties=properties).close()
+    return None
+
+
+class PartitionedIndex(_Partitioned):
+    """A set of spatially disjoint sub-indexes queried as a single index.
+
+    :meth:`build` sorts the bulk-load input into spatial partitions and
+    bulk-loads one sub-index per partition on a thread or process pool, so
+    building a very large index is no longer limited to a single core.
+    Queries are routed only to the partitions whose bounds can hold a
+    result.
+
+    ::
+
+        >>> import numpy as np
+        >>> from rtree.parallel import PartitionedIndex
+        >>> mins = np.array([[0.0, 0.0], [5.0, 5.0], [10.0, 10.0]])
+        >>> idx = PartitionedIndex.build(np.arange(3), mins, mins + 1, partitions=2)
+        >>> len(idx.indexes)
+        2
+        >>> ids, counts = idx.intersection_v([[0.5, 0.5]], [[5.5, 5.5]])
+        >>> sorted(ids.tolist()), counts.tolist()
+        ([0, 1], [2])
+        >>> sorted(idx.intersection((0.5, 0.5, 5.5, 5.5)))
+        [0, 1]
+    """
+
+    def __init__(
+        self, indexes: Sequence[Index], *, executor: Executor | None = None
+    ) -> None:
+        """Routes queries over existing indexes, for example partitions
+        written to disk by an earlier :meth:`build`.
+
+        :param indexes: The sub-indexes.  They must share a dimension and
+            should cover (mostly) disjoint parts of space.
+
+        :param executor: An optional :class:`concurrent.futures.ThreadPoolExecutor`
+            used to query several partitions concurrently.  libspatialindex
+            calls release the GIL, so this scales batch queries over cores.
+        """
+        import numpy as np
+
+        if not indexes:
+            raise ValueError("at least one index is required")
+        dimensions = {idx.properties.dimension for idx in indexes}
+        if len(dimensions) != 1:
+            raise ValueError("indexes must have the same dimension")
+        (d,) = dimensions
+
+        self._partitions = [_Partition(idx) for idx in indexes]
+        bounds = np.array(
+            [idx.get_bounds(coordinate_interleaved=True) for idx in self.indexes],
+            dtype=np.float64,
+        )
+        self.partition_mins = np.ascontiguousarray(bounds[:, :d])
+        self.partition_maxs = np.ascontiguousarray(bounds[:, d:])
+        self.executor = executor
+
+    @classmethod
+    def build(
+        cls,
+        ids,
+        mins,
+        maxs,
+        *,
+        partitions: int | None = None,
+        basename: str | None = None,
+        properties: Property | None = None,
+        executor: Executor | None = None,
+    ) -> PartitionedIndex:
+        """Bulk-loads the input into spatially partitioned sub-indexes.
+
+        :param ids: A NumPy array of shape `(n,)` of entry ids.
+
+        :param mins: A NumPy array of shape `(n, d)` of entry minima.
+
+        :param maxs: A NumPy array of shape `(n, d)` of entry maxima.
+
+        :param partitions: The number of partitions.  Defaults to
+            :func:`os.cpu_count`.
+
+        :param basename: If given, partition ``i`` is written to the disk
+            index ``f"{basename}_{i}"`` instead of being kept in memory.
+
+        :param properties: An :class:`~rtree.index.Property` object used for
+            every partition.  Its dimension is set from the input arrays.
+
+        :param executor: The executor the partitions are built on.  Defaults
+            to a :class:`~concurrent.futures.ThreadPoolExecutor` with one
+            worker per partition.  A
+            :class:`~concurrent.futures.ProcessPoolExecutor` may only be used
+            together with ``basename``, as in-memory indexes cannot be sent
+            back from another process.
+        """
+
+        ids, mins, maxs = _prepare_entries(ids, mins, maxs)
+        if isinstance(executor, ProcessPoolExecutor) and basename is None:
+            raise ValueError("building in other processes requires a basename")
+
+        properties = copy.deepcopy(properties) if properties is not None else Property()
+        properties.dimension = mins.shape[1]
+
+        groups = _kd_partition(mins, maxs, partitions or os.cpu_count() or 1)
+        names = [
+            None if basename is None else f"{basename}_{i}" for i in range(len(groups))
+        ]
+
+        own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=len(groups))
+        try:
+            futures = [
+                executor.submit(
+                    _build_partition,
+                    name,
+                    ids[rows],
+                    mins[rows],
+                    maxs[rows],
+                    copy.deepcopy(properties),
+                )
+                for name, rows in zip(names, groups)
+            ]
+            built = [future.result() for future in futures]
+        finally:
+            if own_executor:
+                executor.shutdown()
+
+        if basename is not None:
+            built = [
+                Index(name, properties=copy.deepcopy(properties)) for name in names
+            ]
+        partitioned = cls(built)
+        if basename is None:
+            # Keep the entry tables of in-memory partitions for kNN merging.
+            for part, rows in zip(partitioned._partitions, groups):
+                part._set_entries(ids[rows], mins[rows], maxs[rows])
+        return partitioned
+
+    @property
+    def indexes(self) -> list[Index]:
+        """The sub-indexes, one per partition"""
+        return [part.index for part in self._partitions]
+
+    def __len__(self) -> int:
+        return sum(len(idx) for idx in self.indexes)
+
+    def __repr__(self) -> str:
+        return (
+            f"rtree.parallel.PartitionedIndex(partitions={len(self._partitions)}, "
+            f"size={len(self)})"
+        )
+
+    def close(self) -> None:
+        """Close all sub-indexes.  Renders the index inaccessible."""
+        for idx in self.indexes:
+            idx.close()
+
+    def flush(self) -> None:
+        """Force a flush of all sub-indexes to storage."""
+        for idx in self.indexes:
+            idx.flush()
+
+    def _scatter(self, fn, mask, mins, maxs, *args):
+        tasks = list(self._select(mask, mins, maxs, args))
+        if self.executor is None or len(tasks) < 2:
+            return [(rows, fn(self._partitions[s], *task)) for s, rows, task in tasks]
+        pending = [
+            (rows, self.executor.submit(fn, self._partitions[s], *task))
+            for s, rows, task in tasks
+        ]
+        return [(rows, future.result()) for rows, future in pending]
+
+    def _route(self, coordinates):
+        # Return the query box as (1, d) arrays and the partitions it overlaps.
+        import numpy as np
+
+        d = self.partition_mins.shape[1]
+        coords = np.asarray(coordinates, dtype=np.float64)
+        if len(coords) == d:
+            mins = maxs = coords[None, :]
+        else:
+            mins, maxs = coords[None, :d], coords[None, d:]
+        mask = _overlaps(mins, maxs, self.partition_mins, self.partition_maxs)[0]
+        return [self._partitions[s].index for s in np.flatnonzero(mask)]
+
+    def intersection(self, coordinates: Any) -> Iterator[int]:
+        """Return the ids of entries intersecting the given coordinates,
+        see :meth:`rtree.index.Index.intersection`.  Coordinates must be in
+        interleaved order."""
+        for idx in self._route(coordinates):
+            yield from idx.intersection(coordinates)
+
+    def count(self, coordinates: Any) -> int:
+        """Return the number of entries intersecting the given coordinates,
+        see :meth:`rtree.index.Index.count`.  Coordinates must be in
+        interleaved order."""
+        return sum(idx.count(coordinates) for idx in self._route(coordinates))
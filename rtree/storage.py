@@ -0,0 +1,773 @@
+"""
+Composable :class:`~rtree.index.CustomStorage` backends.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import sqlite3
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any
+
+from .exceptions import RTreeError
+from .index import CustomStorage, ZeroCopyStorage
+
+__all__ = [
+    "CachedStorage",
+    "CompressedStorage",
+    "IOStatsStorage",
+    "MmapStorage",
+    "SQLiteStorage",
+]
+
+# An MmapStorage file starts with this magic and a header of the format
+# version, the offset and number of entries of the page directory, and the
+# end of the used part of the file.
+_MMAP_MAGIC = b"RTREEMMP"
+_MMAP_HEADER = struct.Struct("<8sIxxxxQQQ")
+_MMAP_VERSION = 1
+
+
+def _capacity(length: int) -> int:
+    """Return the size of the power-of-two region holding ``length`` bytes."""
+    return 1 << max(length - 1, 63).bit_length()
+
+
+class CachedStorage(CustomStorage):
+    """A least-recently-used page cache in front of another
+    :class:`~rtree.index.CustomStorage`.
+
+    Every page load that misses libspatialindex's own buffer calls back into
+    Python and the ``inner`` storage.  This storage keeps recently used pages
+    up to a budget of ``max_bytes``, so that repeated loads of hot pages are
+    answered without calling ``inner``.  Updates of existing pages are kept
+    as dirty pages and written to ``inner`` in page order on :meth:`flush`,
+    when they are evicted, or when the storage is destroyed.  New pages are
+    written through at once, as ``inner`` assigns their page ids.
+
+    ::
+
+        >>> from rtree import index
+        >>> from rtree.storage import CachedStorage
+        >>> class DictStorage(index.CustomStorage):
+        ...     def __init__(self):
+        ...         self.pages = {}
+        ...     def create(self, returnError): pass
+        ...     def destroy(self, returnError): pass
+        ...     def flush(self, returnError): pass
+        ...     def loadByteArray(self, page, returnError):
+        ...         return self.pages[page]
+        ...     def storeByteArray(self, page, data, returnError):
+        ...         if page == self.NewPage:
+        ...             page = len(self.pages)
+        ...         self.pages[page] = data
+        ...         return page
+        ...     def deleteByteArray(self, page, returnError):
+        ...         del self.pages[page]
+        >>> storage = CachedStorage(DictStorage(), max_bytes=2**20)
+        >>> idx = index.Index(storage)
+        >>> idx.insert(1, (0, 0, 1, 1))
+        >>> idx.count((0, 0, 1, 1))
+        1
+        >>> storage.stats()["misses"]
+        0
+    """
+
+    def __init__(self, inner: CustomStorage, max_bytes: int = 16 * 2**20) -> None:
+        """
+        :param inner: The storage that holds the pages.
+
+        :param max_bytes: The maximum size of the cached pages.
+        """
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be > 0")
+        self.inner = inner
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._pages: OrderedDict[int, bytes] = OrderedDict()
+        self._dirty: set[int] = set()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset the hit, miss, eviction and write-back counters."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of page loads answered from the cache"""
+        loads = self.hits + self.misses
+        return self.hits / loads if loads else 0.0
+
+    def stats(self) -> dict[str, Any]:
+        """Return the cache counters as a dictionary."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "writebacks": self.writebacks,
+            "pages": len(self._pages),
+            "dirty": len(self._dirty),
+            "bytes": self.nbytes,
+        }
+
+    def _cache(self, page, data, returnError):
+        old = self._pages.pop(page, None)
+        if old is not None:
+            self.nbytes -= len(old)
+        self._pages[page] = data
+        self.nbytes += len(data)
+        while self.nbytes > self.max_bytes and len(self._pages) > 1:
+            evicted, data = self._pages.popitem(last=False)
+            self.nbytes -= len(data)
+            self.evictions += 1
+            if evicted in self._dirty:
+                self._write_back(evicted, data, returnError)
+
+    def _write_back(self, page, data, returnError):
+        self._dirty.discard(page)
+        self.writebacks += 1
+        self.inner.storeByteArray(page, data, returnError)
+
+    def _write_dirty(self, returnError):
+        for page in sorted(self._dirty):
+            self._write_back(page, self._pages[page], returnError)
+            if returnError.contents.value != self.NoError:
+                return
+
+    def create(self, returnError):
+        self.inner.create(returnError)
+
+    def destroy(self, returnError):
+        self._write_dirty(returnError)
+        if returnError.contents.value == self.NoError:
+            self.inner.destroy(returnError)
+
+    def flush(self, returnError):
+        self._write_dirty(returnError)
+        if returnError.contents.value == self.NoError:
+            self.inner.flush(returnError)
+
+    def loadByteArray(self, page, returnError):
+        data = self._pages.get(page)
+        if data is not None:
+            self.hits += 1
+            self._pages.move_to_end(page)
+            return data
+        self.misses += 1
+        data = self.inner.loadByteArray(page, returnError)
+        if returnError.contents.value == self.NoError:
+            self._cache(page, data, returnError)
+        return data
+
+    def storeByteArray(self, page, data, returnError):
+        if page == self.NewPage:
+            page = self.inner.storeByteArray(page, data, returnError)
+        else:
+            self._dirty.add(page)
+        if returnError.contents.value == self.NoError:
+            self._cache(page, data, returnError)
+        return page
+
+    def deleteByteArray(self, page, returnError):
+        data = self._pages.pop(page, None)
+        if data is not None:
+            self.nbytes -= len(data)
+        self._dirty.discard(page)
+        self.inner.deleteByteArray(page, returnError)
+
+    def clear(self) -> None:
+        """Drop the cached pages and clear the inner storage."""
+        self._pages.clear()
+        self._dirty.clear()
+        self.nbytes = 0
+        self.inner.clear()
+
+    @property
+    def hasData(self):
+        return self.inner.hasData
+
+
+class CompressedStorage(CustomStorage):
+    """A storage that compresses pages before they reach another
+    :class:`~rtree.index.CustomStorage`.
+
+    Pages are compressed by ``codec`` when stored and decompressed when
+    loaded.  The codec may be any object with ``compress`` and
+    ``decompress`` functions, such as the :mod:`zlib`, :mod:`bz2` or
+    :mod:`lzma` modules.  Pages that do not shrink are stored as they are.
+    :attr:`ratio` reports how much smaller the stored pages are.
+
+    ::
+
+        >>> from rtree import index
+        >>> from rtree.storage import CompressedStorage, SQLiteStorage
+        >>> storage = CompressedStorage(SQLiteStorage(":memory:"))
+        >>> idx = index.Index(storage)
+        >>> for i in range(100):
+        ...     idx.insert(i, (i, i, i + 1, i + 1), obj={"name": "a" * 100})
+        >>> idx.close()
+        >>> storage.ratio > 2
+        True
+        >>> storage.inner.close()
+    """
+
+    # Stored pages start with a byte telling whether they are compressed
+    _RAW = b"\x00"
+    _COMPRESSED = b"\x01"
+
+    def __init__(self, inner: CustomStorage, codec: Any = zlib) -> None:
+        """
+        :param inner: The storage that holds the compressed pages.
+
+        :param codec: The compression to use.  Defaults to :mod:`zlib`.
+        """
+        self.inner = inner
+        self.codec = codec
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset the counts of stored bytes."""
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    @property
+    def ratio(self) -> float:
+        """The size of the pages stored since the counts were reset, divided
+        by their compressed size"""
+        return self.raw_bytes / self.stored_bytes if self.stored_bytes else 1.0
+
+    def stats(self) -> dict[str, Any]:
+        """Return the byte counts and compression ratio as a dictionary."""
+        return {
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes,
+            "ratio": self.ratio,
+        }
+
+    def create(self, returnError):
+        self.inner.create(returnError)
+
+    def destroy(self, returnError):
+        self.inner.destroy(returnError)
+
+    def flush(self, returnError):
+        self.inner.flush(returnError)
+
+    def loadByteArray(self, page, returnError):
+        data = self.inner.loadByteArray(page, returnError)
+        if returnError.contents.value != self.NoError:
+            return data
+        if data[:1] == self._COMPRESSED:
+            return self.codec.decompress(data[1:])
+        return data[1:]
+
+    def storeByteArray(self, page, data, returnError):
+        compressed = self.codec.compress(data)
+        if len(compressed) < len(data):
+            stored = self._COMPRESSED + compressed
+        else:
+            stored = self._RAW + data
+        self.raw_bytes += len(data)
+        self.stored_bytes += len(stored)
+        return self.inner.storeByteArray(page, stored, returnError)
+
+    def deleteByteArray(self, page, returnError):
+        self.inner.deleteByteArray(page, returnError)
+
+    def clear(self) -> None:
+        """Clear the inner storage."""
+        self.inner.clear()
+
+    @property
+    def hasData(self):
+        return self.inner.hasData
+
+
+class IOStatsStorage(CustomStorage):
+    """A storage that counts the page I/O of an index on another
+    :class:`~rtree.index.CustomStorage`.
+
+    The number of pages loaded, stored and deleted, the bytes read and
+    written, and the time spent in the ``inner`` storage are counted, so
+    that they can be read with :meth:`stats` and reset with
+    :meth:`reset_stats` around any query.  Pages served from the buffer of
+    libspatialindex never reach the storage and are not counted, which makes
+    the counts a measure of how well the ``pagesize``, ``leaf_capacity`` and
+    ``buffering_capacity`` properties suit a workload.
+
+    libspatialindex does not report the page I/O of indexes it stores on
+    disk itself.  Their I/O can be measured by storing the index in an
+    :class:`MmapStorage` wrapped by this storage instead.
+
+    ::
+
+        >>> from rtree import index
+        >>> from rtree.storage import IOStatsStorage, SQLiteStorage
+        >>> storage = IOStatsStorage(SQLiteStorage(":memory:"))
+        >>> idx = index.Index(storage)
+        >>> idx.insert(1, (0, 0, 1, 1))
+        >>> storage.reset_stats()
+        >>> idx.count((0, 0, 1, 1))
+        1
+        >>> storage.stats()["loads"]
+        0
+        >>> idx.close()
+        >>> storage.inner.close()
+    """
+
+    def __init__(self, inner: CustomStorage) -> None:
+        """
+        :param inner: The storage that holds the pages.
+        """
+        self.inner = inner
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset the I/O counts."""
+        self.loads = 0
+        self.stores = 0
+        self.deletes = 0
+        self.flushes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.seconds = 0.0
+
+    def stats(self) -> dict[str, Any]:
+        """Return the I/O counts as a dictionary."""
+        return {
+            "loads": self.loads,
+            "stores": self.stores,
+            "deletes": self.deletes,
+            "flushes": self.flushes,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "seconds": self.seconds,
+        }
+
+    def create(self, returnError):
+        self.inner.create(returnError)
+
+    def destroy(self, returnError):
+        self.inner.destroy(returnError)
+
+    def flush(self, returnError):
+        start = time.perf_counter()
+        self.inner.flush(returnError)
+        self.seconds += time.perf_counter() - start
+        self.flushes += 1
+
+    def loadByteArray(self, page, returnError):
+        start = time.perf_counter()
+        data = self.inner.loadByteArray(page, returnError)
+        self.seconds += time.perf_counter() - start
+        self.loads += 1
+        self.bytes_read += len(data)
+        return data
+
+    def storeByteArray(self, page, data, returnError):
+        start = time.perf_counter()
+        page = self.inner.storeByteArray(page, data, returnError)
+        self.seconds += time.perf_counter() - start
+        self.stores += 1
+        self.bytes_written += len(data)
+        return page
+
+    def deleteByteArray(self, page, returnError):
+        start = time.perf_counter()
+        self.inner.deleteByteArray(page, returnError)
+        self.seconds += time.perf_counter() - start
+        self.deletes += 1
+
+    def clear(self) -> None:
+        """Clear the inner storage."""
+        self.inner.clear()
+
+    @property
+    def hasData(self):
+        return self.inner.hasData
+
+
+class MmapStorage(ZeroCopyStorage):
+    """A :class:`~rtree.index.CustomStorage` that keeps pages in a single
+    memory-mapped file.
+
+    Pages are stored in power-of-two sized regions of the file, and the file
+    grows as needed.  Pages that grow beyond their region move to a larger
+    one, and the regions and ids of deleted pages are reused.  As a
+    :class:`~rtree.index.ZeroCopyStorage`, page contents are copied directly
+    between the mapping and the buffers of libspatialindex.
+
+    The page directory is written to the file on :meth:`flush`, which
+    libspatialindex also calls when the index is closed, so that the index
+    can be reopened from the file.
+
+    ::
+
+        >>> import os, tempfile
+        >>> from rtree import index
+        >>> from rtree.storage import MmapStorage
+        >>> filename = os.path.join(tempfile.mkdtemp(), "pages.rtm")
+        >>> storage = MmapStorage(filename)
+        >>> idx = index.Index(storage)
+        >>> idx.insert(1, (0, 0, 1, 1))
+        >>> idx.close()
+        >>> storage.close()
+        >>> storage = MmapStorage(filename)
+        >>> storage.hasData
+        True
+        >>> index.Index(storage).count((0, 0, 1, 1))
+        1
+        >>> storage.close()
+    """
+
+    def __init__(self, filename: str, initial_size: int = 2**20) -> None:
+        """
+        :param filename: The file holding the pages.  It is created if it
+            does not exist.
+
+        :param initial_size: The initial size of a new file in bytes.
+        """
+        self.filename = filename
+        exists = os.path.exists(filename) and os.path.getsize(filename) > 0
+        self._file = open(filename, "r+b" if exists else "w+b")
+        if not exists:
+            self._file.truncate(max(initial_size, _MMAP_HEADER.size))
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        if not exists:
+            self._reset()
+            return
+        try:
+            self._read_directory()
+        except Exception:
+            self._mmap.close()
+            self._file.close()
+            raise
+
+    def _reset(self) -> None:
+        # Page directory: offset, length and capacity of every page id.
+        # Deleted pages keep their region with a length of -1.
+        self._pages: list[list[int]] = []
+        self._free_ids: list[int] = []
+        self._free_regions: dict[int, list[int]] = {}
+        self._directory = (0, 0)
+        self._end = _MMAP_HEADER.size
+
+    def _read_directory(self):
+        magic, version, offset, count, end = _MMAP_HEADER.unpack_from(self._mmap)
+        if magic != _MMAP_MAGIC:
+            raise RTreeError(f"'{self.filename}' is not a page storage file")
+        if version != _MMAP_VERSION:
+            raise RTreeError(f"Unsupported page storage version {version}")
+        self._reset()
+        self._end = end
+        self._directory = (offset, 24 * count)
+        entries = struct.unpack_from(f"<{3 * count}q", self._mmap, offset)
+        for page in range(count):
+            entry = list(entries[3 * page : 3 * page + 3])
+            self._pages.append(entry)
+            if entry[1] < 0:
+                self._free_ids.append(page)
+        self._free_ids.reverse()
+
+        # Free regions are not saved, and are the gaps between the regions
+        # of the pages and the directory
+        used = [(entry[0], entry[2]) for entry in self._pages if entry[2]]
+        if count:
+            used.append((offset, _capacity(24 * count)))
+        position = _MMAP_HEADER.size
+        for start, capacity in sorted(used):
+            self._release_gap(position, start)
+            position = max(position, start + capacity)
+        self._release_gap(position, end)
+
+    def _write_directory(self):
+        data = b"".join(struct.pack("<3q", *entry) for entry in self._pages)
+        # The header points to the old directory until the new one is
+        # written, so the old region is only released afterwards
+        offset = self._allocate(len(data)) if data else 0
+        self._mmap[offset : offset + len(data)] = data
+        previous = self._directory
+        self._directory = (offset, len(data))
+        _MMAP_HEADER.pack_into(
+            self._mmap,
+            0,
+            _MMAP_MAGIC,
+            _MMAP_VERSION,
+            offset,
+            len(self._pages),
+            self._end,
+        )
+        self._mmap.flush()
+        self._release(*previous)
+
+    def _allocate(self, length):
+        capacity = _capacity(length)
+        free = self._free_regions.get(capacity)
+        if free:
+            return free.pop()
+        offset = self._end
+        self._end += capacity
+        if self._end > len(self._mmap):
+            # Grow the file by doubling and map it again
+            self._mmap.close()
+            self._file.truncate(
+                max(self._end, 2 * os.fstat(self._file.fileno()).st_size)
+            )
+            self._mmap = mmap.mmap(self._file.fileno(), 0)
+        return offset
+
+    def _release(self, offset, length):
+        if length:
+            self._free_regions.setdefault(_capacity(length), []).append(offset)
+
+    def _release_gap(self, start, end):
+        # Gaps are made of released regions, so they split into regions of
+        # at least the smallest capacity
+        while end - start >= _capacity(1):
+            capacity = 1 << ((end - start).bit_length() - 1)
+            self._free_regions.setdefault(capacity, []).append(start)
+            start += capacity
+
+    def _store(self, page, length):
+        """Return the offset to write a page of the given length to and
+        update the directory, allocating a page id for a new page."""
+        if page == self.NewPage:
+            if self._free_ids:
+                page = self._free_ids.pop()
+                entry = self._pages[page]
+            else:
+                page = len(self._pages)
+                entry = [0, -1, 0]
+                self._pages.append(entry)
+        elif 0 <= page < len(self._pages) and self._pages[page][1] >= 0:
+            entry = self._pages[page]
+        else:
+            return page, None
+        if length > entry[2]:
+            self._release(entry[0], entry[2])
+            entry[0] = self._allocate(length)
+            entry[2] = _capacity(length)
+        entry[1] = length
+        return page, entry[0]
+
+    def _entry(self, page):
+        if 0 <= page < len(self._pages) and self._pages[page][1] >= 0:
+            return self._pages[page]
+        return None
+
+    def create(self, returnError):
+        pass
+
+    def destroy(self, returnError):
+        self.flush(returnError)
+
+    def flush(self, returnError=None):
+        """Write the page directory and flush the mapping to the file."""
+        if not self._mmap.closed:
+            self._write_directory()
+
+    def pageLength(self, page, returnError):
+        entry = self._entry(page)
+        if entry is None:
+            returnError.contents.value = self.InvalidPageError
+            return 0
+        return entry[1]
+
+    def loadByteArrayInto(self, page, buffer, returnError):
+        offset = self._pages[page][0]
+        with memoryview(self._mmap) as pages:
+            buffer[:] = pages[offset : offset + len(buffer)]
+
+    def loadByteArray(self, page, returnError):
+        entry = self._entry(page)
+        if entry is None:
+            returnError.contents.value = self.InvalidPageError
+            return b""
+        offset, length, _ = entry
+        return self._mmap[offset : offset + length]
+
+    def storeByteArray(self, page, data, returnError):
+        page, offset = self._store(page, len(data))
+        if offset is None:
+            returnError.contents.value = self.InvalidPageError
+            return 0
+        self._mmap[offset : offset + len(data)] = data
+        return page
+
+    def deleteByteArray(self, page, returnError):
+        entry = self._entry(page)
+        if entry is None:
+            returnError.contents.value = self.InvalidPageError
+            return
+        entry[1] = -1
+        self._free_ids.append(page)
+
+    def clear(self) -> None:
+        """Drop all pages."""
+        self._reset()
+        self._write_directory()
+
+    def __enter__(self) -> MmapStorage:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Write the page directory and close the file."""
+        if not self._mmap.closed:
+            self._write_directory()
+            self._mmap.close()
+            self._file.close()
+
+    @property
+    def hasData(self):
+        return any(entry[1] >= 0 for entry in self._pages)
+
+
+class SQLiteStorage(CustomStorage):
+    """A :class:`~rtree.index.CustomStorage` that keeps pages in a table of
+    an SQLite database.
+
+    Pages are rows of ``table``, keyed by the ``name`` of the index and the
+    page id, so that several indexes can live in one database next to the
+    application's own tables.  Page writes are grouped into a single
+    transaction that is committed on :meth:`flush`, which libspatialindex
+    also calls when the index is closed, so that loading an index does not
+    pay a commit per page.  Databases opened by this storage use write-ahead
+    logging.
+
+    ::
+
+        >>> from rtree import index
+        >>> from rtree.storage import SQLiteStorage
+        >>> storage = SQLiteStorage(":memory:", name="roads")
+        >>> idx = index.Index(storage)
+        >>> idx.insert(1, (0, 0, 1, 1))
+        >>> idx.count((0, 0, 1, 1))
+        1
+        >>> idx.close()
+        >>> storage.hasData
+        True
+        >>> storage.close()
+    """
+
+    def __init__(
+        self,
+        database: str | sqlite3.Connection,
+        name: str = "default",
+        table: str = "rtree_pages",
+    ) -> None:
+        """
+        :param database: The filename of the database, or an open
+            :class:`sqlite3.Connection` that stays owned by the caller.  The
+            current transaction of the connection is committed whenever the
+            index flushes.
+
+        :param name: The name of the index, which keeps its pages apart from
+            those of other indexes in the same table.
+
+        :param table: The name of the table of pages.  It is created if it
+            does not exist.
+        """
+        if not table.isidentifier():
+            raise ValueError(f"invalid table name {table!r}")
+        self.name = name
+        self.table = table
+        self._owned = not isinstance(database, sqlite3.Connection)
+        if isinstance(database, sqlite3.Connection):
+            self.connection = database
+        else:
+            # Queries may run on other threads, such as those of AsyncIndex
+            self.connection = sqlite3.connect(database, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(name TEXT NOT NULL, page INTEGER NOT NULL, data BLOB NOT NULL, "
+            "PRIMARY KEY (name, page))"
+        )
+        if self._owned:
+            self.connection.commit()
+        self._load = f"SELECT data FROM {table} WHERE name = ? AND page = ?"
+        self._update = f"UPDATE {table} SET data = ? WHERE name = ? AND page = ?"
+        self._insert = f"INSERT INTO {table} (name, page, data) VALUES (?, ?, ?)"
+        self._delete = f"DELETE FROM {table} WHERE name = ? AND page = ?"
+        (last,) = self.connection.execute(
+            f"SELECT MAX(page) FROM {table} WHERE name = ?", (name,)
+        ).fetchone()
+        self._next_page = 0 if last is None else last + 1
+
+    def _begin(self):
+        if not self.connection.in_transaction:
+            self.connection.execute("BEGIN")
+
+    def create(self, returnError):
+        pass
+
+    def destroy(self, returnError):
+        self.flush(returnError)
+
+    def flush(self, returnError=None):
+        """Commit the pages written since the last flush."""
+        self.connection.commit()
+
+    def loadByteArray(self, page, returnError):
+        row = self.connection.execute(self._load, (self.name, page)).fetchone()
+        if row is None:
+            returnError.contents.value = self.InvalidPageError
+            return b""
+        return row[0]
+
+    def storeByteArray(self, page, data, returnError):
+        self._begin()
+        if page == self.NewPage:
+            page = self._next_page
+            self._next_page += 1
+            self.connection.execute(self._insert, (self.name, page, data))
+        elif not self.connection.execute(
+            self._update, (data, self.name, page)
+        ).rowcount:
+            returnError.contents.value = self.InvalidPageError
+        return page
+
+    def deleteByteArray(self, page, returnError):
+        self._begin()
+        if not self.connection.execute(self._delete, (self.name, page)).rowcount:
+            returnError.contents.value = self.InvalidPageError
+
+    def clear(self) -> None:
+        """Delete all pages of this index."""
+        self.connection.execute(
+            f"DELETE FROM {self.table} WHERE name = ?", (self.name,)
+        )
+        self.connection.commit()
+        self._next_page = 0
+
+    def close(self) -> None:
+        """Commit pending writes, and close the database if it was opened by
+        this storage."""
+        self.connection.commit()
+        if self._owned:
+            self.connection.close()
+
+    def __enter__(self) -> SQLiteStorage:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    @property
+    def hasData(self):
+        row = self.connection.execute(
+            f"SELECT 1 FROM {self.table} WHERE name = ? LIMIT 1", (self.name,)
+        ).fetchone()
+        return row is not None
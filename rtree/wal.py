@@ -0,0 +1,259 @@
+"""
+Durable in-memory indexes backed by a write-ahead log.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import os
+import struct
+import zlib
+from typing import Any
+
+from . import core
+from .exceptions import RTreeError
+from .index import Index, Property, RT_RTree
+
+__all__ = ["DurableIndex"]
+
+# A checkpoint file starts with this magic and the sequence number of the
+# last logged change it contains, followed by an index snapshot.
+_CHECKPOINT_MAGIC = b"RTREECKP"
+_CHECKPOINT_HEADER = struct.Struct("<8sQ")
+
+# Every log record starts with the CRC-32 and size of the rest of the
+# record, which holds the sequence number, the kind of change and the entry
+# id, followed by the minimum and maximum coordinates and the stored data.
+_RECORD_PREFIX = struct.Struct("<II")
+_RECORD_HEADER = struct.Struct("<QBq")
+_INSERT = 1
+_DELETE = 2
+
+
+class DurableIndex(Index):
+    """An in-memory :class:`~rtree.index.Index` whose changes survive a
+    crash.
+
+    Every :meth:`insert` and :meth:`delete` is appended to a log once it is
+    applied.  Log records are written and synced to disk in groups of
+    ``commit_every`` changes, or when :meth:`commit` is called, so a crash
+    loses at most the changes since the last commit.  When the log
+    grows beyond ``checkpoint_bytes``, a snapshot of the index written by
+    :meth:`~rtree.index.Index.to_bytes` replaces the previous checkpoint and
+    the log starts over.  Opening the index again bulk loads the checkpoint
+    and replays the changes logged after it, so recovery time is bounded by
+    the checkpoint size and ``checkpoint_bytes``.
+
+    Queries run at the speed of any in-memory index.  Only R-Trees are
+    supported.
+
+    ::
+
+        >>> import tempfile
+        >>> from rtree.wal import DurableIndex
+        >>> directory = tempfile.mkdtemp()
+        >>> with DurableIndex(directory) as idx:
+        ...     idx.insert(1, (0, 0, 1, 1), obj="a")
+        >>> with DurableIndex(directory) as idx:
+        ...     list(idx.intersection((0, 0, 1, 1), objects="raw"))
+        ['a']
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        commit_every: int = 256,
+        checkpoint_bytes: int = 64 * 2**20,
+        **kwargs: Any,
+    ) -> None:
+        """
+        :param directory: The directory of the checkpoint and log files.  It
+            is created if it does not exist.
+
+        :param commit_every: The number of changes written and synced to
+            disk together.
+
+        :param checkpoint_bytes: The size of the log that triggers a
+            checkpoint.
+
+        :param kwargs: Keyword arguments for :class:`~rtree.index.Index`,
+            such as ``properties`` or ``interleaved``.  The properties and
+            ordering of a checkpoint are used unless given.
+        """
+        if commit_every < 1:
+            raise ValueError("commit_every must be >= 1")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.commit_every = commit_every
+        self.checkpoint_bytes = checkpoint_bytes
+        self._checkpoint_file = os.path.join(directory, "checkpoint")
+        self._log_file = os.path.join(directory, "log")
+        self._records: list[bytes] = []
+        self._lsn = 0
+
+        arrays = None
+        if os.path.exists(self._checkpoint_file):
+            with open(self._checkpoint_file, "rb") as f:
+                data = f.read()
+            magic, self._lsn = _CHECKPOINT_HEADER.unpack_from(data)
+            if magic != _CHECKPOINT_MAGIC:
+                raise RTreeError(f"'{self._checkpoint_file}' is not a checkpoint")
+            meta, *arrays = self._read_snapshot(
+                memoryview(data)[_CHECKPOINT_HEADER.size :]
+            )
+            if "properties" not in kwargs:
+                kwargs["properties"] = Property()
+                kwargs["properties"].initialize_from_dict(meta["properties"])
+            kwargs.setdefault("interleaved", meta["interleaved"])
+        super().__init__(**kwargs)
+        if self.properties.type != RT_RTree:
+            raise NotImplementedError("Write-ahead logs only support R-Trees")
+        if arrays is not None and len(arrays[0]):
+            self.handle.destroy()
+            self.handle = self._load_snapshot(*arrays)
+
+        self._replay()
+        # Counted when first needed, as replayed deletes may not have found
+        # their entries
+        self._size = None
+        self._log = open(self._log_file, "ab")
+
+    def _replay(self) -> None:
+        """Apply the changes logged after the checkpoint, and cut off a
+        record that was only partly written."""
+        if not os.path.exists(self._log_file):
+            return
+        with open(self._log_file, "rb") as f:
+            data = f.read()
+        dimension = self.properties.dimension
+        size = 8 * dimension
+        doubles = ctypes.c_double * dimension
+        start = 0
+        while start + _RECORD_PREFIX.size <= len(data):
+            crc, length = _RECORD_PREFIX.unpack_from(data, start)
+            body = start + _RECORD_PREFIX.size
+            end = body + length
+            if end > len(data) or zlib.crc32(data[body:end]) != crc:
+                break
+            lsn, kind, id = _RECORD_HEADER.unpack_from(data, body)
+            if lsn > self._lsn:
+                offset = body + _RECORD_HEADER.size
+                mins = doubles.from_buffer_copy(data, offset)
+                maxs = doubles.from_buffer_copy(data, offset + size)
+                if kind == _INSERT:
+                    self._insert_data(id, mins, maxs, data[offset + 2 * size : end])
+                else:
+                    core.rt.Index_DeleteData(self.handle, id, mins, maxs, dimension)
+                self._lsn = lsn
+            start = end
+        if start < len(data):
+            with open(self._log_file, "r+b") as f:
+                f.truncate(start)
+
+    def _insert_data(self, id, p_mins, p_maxs, data):
+        core.rt.Index_InsertData(
+            self.handle,
+            id,
+            p_mins,
+            p_maxs,
+            self.properties.dimension,
+            ctypes.cast(ctypes.c_char_p(data), ctypes.POINTER(ctypes.c_uint8)),
+            len(data),
+        )
+
+    def _append(self, kind, id, p_mins, p_maxs, data=b""):
+        self._lsn += 1
+        body = b"".join(
+            [
+                _RECORD_HEADER.pack(self._lsn, kind, id),
+                bytes(p_mins),
+                bytes(p_maxs),
+                data,
+            ]
+        )
+        self._records.append(_RECORD_PREFIX.pack(zlib.crc32(body), len(body)) + body)
+        # Only committed once the change is in the index, which a
+        # checkpoint started by the commit must include.
+        if len(self._records) >= self.commit_every:
+            self.commit()
+
+    def insert(self, id: int, coordinates: Any, obj: object = None) -> None:
+        """Log and insert an entry.  See :meth:`rtree.index.Index.insert`."""
+        if self._pending is not None:
+            return super().insert(id, coordinates, obj)
+        p_mins, p_maxs = self.get_coordinate_pointers(coordinates)
+        data = b"" if obj is None else self.dumps(obj)
+        self._invalidate(coordinates)
+        with self._capture(Index.insert, self, id, coordinates, obj):
+            self._insert_data(id, p_mins, p_maxs, data)
+            self._track_size(1)
+        self._append(_INSERT, id, p_mins, p_maxs, data)
+
+    add = insert
+
+    def delete(self, id: int, coordinates: Any) -> None:
+        """Log and delete an entry.  See :meth:`rtree.index.Index.delete`."""
+        if self._pending is not None:
+            return super().delete(id, coordinates)
+        p_mins, p_maxs = self.get_coordinate_pointers(coordinates)
+        super().delete(id, coordinates)
+        self._append(_DELETE, id, p_mins, p_maxs)
+
+    def commit(self) -> None:
+        """Write the logged changes and sync them to disk, and take a
+        checkpoint if the log has grown beyond ``checkpoint_bytes``."""
+        self._write()
+        if self._log.tell() > self.checkpoint_bytes:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Replace the checkpoint by a snapshot of the index and empty the
+        log."""
+        self._write()
+        temporary = self._checkpoint_file + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(_CHECKPOINT_HEADER.pack(_CHECKPOINT_MAGIC, self._lsn))
+            f.write(self.to_bytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._checkpoint_file)
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        # A crash before this point replays the log, skipping the changes
+        # that are already in the checkpoint.
+        self._log.truncate(0)
+        self._log.seek(0)
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+    def _write(self) -> None:
+        if self._records:
+            self._log.write(b"".join(self._records))
+            self._records.clear()
+            self._log.flush()
+            os.fsync(self._log.fileno())
+
+    def close(self) -> None:
+        """Commit the logged changes and close the log and the index."""
+        if not self._log.closed:
+            self._write()
+            self._log.close()
+        super().close()
+
+    def __reduce__(self):
+        # A copy reopened from the directory would write to the same log
+        raise RTreeError(
+            "DurableIndex cannot be pickled, reopen it from its directory "
+            "once it is closed"
+        )
+
+    def __enter__(self) -> DurableIndex:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
@@ -1,5 +1,8 @@
 """Common test functions."""
 
+from __future__ import annotations
+
+import numpy as np
 import pytest
 
 from rtree.core import rt
@@ -8,3 +11,24 @@ sidx_version_string = rt.SIDX_Version().decode()
 sidx_version = tuple(map(int, sidx_version_string.split(".", maxsplit=3)[:3]))
 
 skip_sidx_lt_210 = pytest.mark.skipif(sidx_version < (2, 1, 0), reason="SIDX < 2.1.0")
+
+
+def boxes_fixture(n: int, dimension: int = 2):
+    """Return a module fixture of ``n`` random boxes as ``(ids, mins, maxs)``
+    arrays."""
+
+    @pytest.fixture(scope="module")
+    def boxes() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rng = np.random.default_rng(0)
+        mins = rng.random((n, dimension)) * 100
+        maxs = mins + rng.random((n, dimension))
+        return np.arange(len(mins)), mins, maxs
+
+    return boxes
+
+
+def split_csr(ids, counts):
+    """Split the ids of query results in CSR form into a sorted list for
+    each query."""
+    offsets = np.concatenate(([0], np.cumsum(counts.astype(np.int64))))
+    return [sorted(ids[a:b].tolist()) for a, b in zip(offsets[:-1], offsets[1:])]
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from rtree import index
+from rtree.aio import AsyncIndex
+from rtree.exceptions import RTreeError
+
+from .common import skip_sidx_lt_210
+
+
+@pytest.fixture
+def boxes15() -> np.ndarray:
+    return np.genfromtxt("boxes_15x15.data")
+
+
+@pytest.fixture
+def idx(boxes15) -> index.Index:
+    idx = index.Index()
+    for i, coords in enumerate(boxes15):
+        idx.add(i, coords)
+    return idx
+
+
+@skip_sidx_lt_210
+def test_batched_queries(idx, boxes15) -> None:
+    async def main():
+        async with AsyncIndex(idx, max_batch=8, max_delay=0.01) as aidx:
+            boxes = [tuple(b) for b in boxes15[:20]]
+            return await asyncio.gather(
+                *(aidx.intersection(b) for b in boxes),
+                *(aidx.nearest(b[:2], 3) for b in boxes),
+            )
+
+    results = asyncio.run(main())
+    for i, coords in enumerate(boxes15[:20]):
+        assert results[i] == list(idx.intersection(coords))
+        assert sorted(results[20 + i]) == sorted(idx.nearest(coords[:2], 3))
+
+
+@skip_sidx_lt_210
+def test_uninterleaved(boxes15) -> None:
+    idx = index.Index(interleaved=False)
+    idx.insert(1, (0, 1, 0, 1))
+
+    async def main():
+        async with AsyncIndex(idx) as aidx:
+            return await aidx.intersection((0.5, 2, 0.5, 2))
+
+    assert asyncio.run(main()) == [1]
+
+
+@skip_sidx_lt_210
+def test_errors(idx) -> None:
+    async def main():
+        async with AsyncIndex(idx) as aidx:
+            await aidx.intersection((1, 1, 0, 0))
+
+    with pytest.raises(RTreeError, match="minimums more than maximums"):
+        asyncio.run(main())
+
+    with pytest.raises(ValueError, match="max_batch"):
+        AsyncIndex(idx, max_batch=0)
+
+
+@skip_sidx_lt_210
+def test_close_with_waiting_queries(idx, boxes15) -> None:
+    async def main():
+        async with AsyncIndex(idx, max_delay=10) as aidx:
+            query = asyncio.ensure_future(aidx.intersection(tuple(boxes15[0])))
+            await asyncio.sleep(0)
+        result = await asyncio.wait_for(query, 5)
+        with pytest.raises(RTreeError, match="closed"):
+            await aidx.intersection(tuple(boxes15[0]))
+        return result
+
+    assert asyncio.run(main()) == list(idx.intersection(boxes15[0]))
+
+    # Without a running loop, waiting queries fail
+    loop = asyncio.new_event_loop()
+    aidx = AsyncIndex(idx, max_delay=10)
+    query = loop.create_task(aidx.intersection(tuple(boxes15[0])))
+    loop.run_until_complete(asyncio.sleep(0))
+    aidx.close()
+    with pytest.raises(RTreeError, match="closed"):
+        loop.run_until_complete(query)
+    loop.close()
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import pytest
+
+from rtree import index
+from rtree.catalog import IndexCatalog
+from rtree.exceptions import RTreeError
+from rtree.storage import SQLiteStorage
+
+from .test_storage import CountingStorage, fill
+
+
+def test_many_indexes() -> None:
+    storage = CountingStorage()
+    with IndexCatalog(storage) as catalog:
+        for layer in range(50):
+            idx = catalog.create(f"layer{layer}")
+            for i in range(layer + 1):
+                idx.insert(1000 * layer + i, (i, i, i + 1, i + 1))
+        assert len(catalog) == 50
+        assert "layer7" in catalog
+
+    with IndexCatalog(storage, max_bytes=2**16) as catalog:
+        for layer in (0, 17, 49):
+            idx = catalog[f"layer{layer}"]
+            assert len(idx) == layer + 1
+            assert list(idx.intersection((0.5, 0.5, 0.5, 0.5))) == [1000 * layer]
+        assert catalog["layer17"] is catalog.open("layer17")
+        assert catalog.stats()["misses"] > 0
+
+
+def test_open_kwargs() -> None:
+    with SQLiteStorage(":memory:") as storage:
+        catalog = IndexCatalog(storage)
+        properties = index.Property()
+        properties.dimension = 3
+        fill(catalog.create("points"))
+        catalog.create("volumes", properties=properties, interleaved=False)
+        catalog["volumes"].insert(1, (0, 1, 0, 1, 0, 1))
+        catalog.close()
+
+        catalog = IndexCatalog(storage)
+        assert catalog["points"].count((0, 0, 101, 101)) == 2000
+        volumes = catalog.open("volumes", interleaved=False)
+        assert volumes.properties.dimension == 3
+        assert list(volumes.intersection((0, 2, 0, 2, 0, 2))) == [1]
+        catalog.close()
+
+
+def test_errors() -> None:
+    storage = CountingStorage()
+    with IndexCatalog(storage) as catalog:
+        catalog.create("roads")
+        with pytest.raises(ValueError, match="already exists"):
+            catalog.create("roads")
+        with pytest.raises(KeyError):
+            catalog["rivers"]
+
+    storage = CountingStorage()
+    fill(index.Index(storage))
+    with pytest.raises(RTreeError, match="does not hold an index catalog"):
+        IndexCatalog(storage)
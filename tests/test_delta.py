@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from rtree import index
+from rtree.delta import DeltaIndex
+
+from .common import boxes_fixture, skip_sidx_lt_210
+
+boxes = boxes_fixture(2000)
+
+
+def update(idx, reference: index.Index, boxes) -> None:
+    # Delete every third base entry and insert moved copies of them
+    ids, mins, maxs = boxes
+    for i in range(0, len(ids), 3):
+        idx.delete(ids[i], (*mins[i], *maxs[i]))
+        reference.delete(ids[i], (*mins[i], *maxs[i]))
+        moved = (*(mins[i] + 0.5), *(maxs[i] + 0.5))
+        idx.insert(ids[i] + 10000, moved)
+        reference.insert(ids[i] + 10000, moved)
+
+
+def check(idx, reference: index.Index) -> None:
+    assert len(idx) == len(reference)
+    for query in [(0, 0, 10, 10), (20, 30, 60, 40), (0, 0, 101, 101)]:
+        assert sorted(idx.intersection(query)) == sorted(reference.intersection(query))
+        assert idx.count(query) == reference.count(query)
+    for point in [(0, 0), (50, 50), (99, 1)]:
+        assert idx.nearest(point, 5) == list(reference.nearest(point, 5))[:5]
+
+
+@skip_sidx_lt_210
+def test_updates(boxes) -> None:
+    reference = index.Index(boxes)
+    with DeltaIndex(*boxes, max_delta=100) as idx:
+        update(idx, reference, boxes)
+        assert idx.delta_size < 100
+        check(idx, reference)
+        idx.compact()
+        assert idx.delta_size == 0
+        check(idx, reference)
+
+
+@skip_sidx_lt_210
+def test_background_compaction(boxes) -> None:
+    reference = index.Index(boxes)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with DeltaIndex(*boxes, max_delta=50, executor=executor) as idx:
+            update(idx, reference, boxes)
+            future = idx.compact()
+            if future is not None:
+                future.result()
+            check(idx, reference)
+
+            # Updates made while a compaction runs are kept
+            idx.max_delta = 1000
+            idx.insert(30000, (3, 3, 4, 4))
+            reference.insert(30000, (3, 3, 4, 4))
+            future = idx.compact()
+            assert future is not None
+            idx.delete(10000, (0, 0, 0, 0))
+            reference.delete(10000, (*(boxes[1][0] + 0.5), *(boxes[2][0] + 0.5)))
+            idx.insert(20000, (1, 1, 2, 2))
+            reference.insert(20000, (1, 1, 2, 2))
+            future.result()
+            check(idx, reference)
+
+
+def test_empty() -> None:
+    with DeltaIndex(max_delta=2) as idx:
+        idx.insert(1, (0, 0, 1, 1))
+        assert idx.nearest((5, 5)) == [1]
+        idx.insert(2, (4, 4))
+        assert idx.delta_size == 0
+        assert sorted(idx.intersection((0, 0, 5, 5))) == [1, 2]
+        assert len(idx) == 2
+
+    with pytest.raises(ValueError, match="max_delta"):
+        DeltaIndex(max_delta=0)
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 import ctypes
+import os
 import pickle
 import sys
 import tempfile
+import threading
 import unittest
 from collections.abc import Iterator
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import cast
 
 import numpy as np
 import pytest
@@ -58,6 +62,26 @@ class IndexCount(unittest.TestCase):
         with pytest.deprecated_call():
             self.assertEqual(self.idx.get_size(), len(self.boxes15))
 
+    def test_len_tracked(self) -> None:
+        n = len(self.boxes15)
+        self.idx.insert(1000, (0, 0, 1, 1))
+        self.idx.insert(1000, (0, 0, 1, 1))
+        self.assertEqual(self.idx._size, n + 2)
+        # Deleting entries that do not exist changes nothing
+        self.idx.delete(1000, (0, 0, 2, 2))
+        self.idx.delete(1001, (0, 0, 1, 1))
+        self.idx.delete(1000, (-10, -10, -9, -9))
+        self.assertEqual(self.idx._size, n + 2)
+        self.assertEqual(len(self.idx), n + 2)
+        self.idx.delete(1000, (0, 0, 1, 1))
+        self.assertEqual(len(self.idx), n + 1)
+        self.assertEqual(self.idx._size, n + 1)
+
+        restored = index.Index.from_bytes(self.idx.to_bytes())
+        self.assertEqual(restored._size, n + 1)
+        stream = ((i, coords, None) for i, coords in enumerate(self.boxes15))
+        self.assertEqual(len(index.Index(stream)), n)
+
 
 class IndexBounds(unittest.TestCase):
     def test_invalid_specifications(self) -> None:
@@ -155,7 +179,6 @@ class IndexProperties(IndexTestCase):
 
 class TestPickling(unittest.TestCase):
     # https://github.com/Toblerity/rtree/issues/87
-    @pytest.mark.xfail
     def test_index(self) -> None:
         idx = rtree.index.Index()
         idx.insert(0, [0, 1, 2, 3], 4)
@@ -171,6 +194,41 @@ class TestPickling(unittest.TestCase):
         self.assertEqual(a.bounds, b.bounds)
         self.assertEqual(a.object, b.object)
 
+    def test_to_bytes(self) -> None:
+        idx = rtree.index.Index(properties=rtree.index.Property(leaf_capacity=20))
+        for i in range(100):
+            idx.insert(i, (i, i, i + 2.5, i + 1), obj={"i": i} if i % 2 else None)
+        restored = rtree.index.Index.from_bytes(idx.to_bytes())
+        self.assertEqual(restored.properties.leaf_capacity, 20)
+        self.assertEqual(len(restored), 100)
+        self.assertEqual(
+            sorted(
+                (i.id, i.bbox, i.object)
+                for i in restored.intersection(restored.bounds, objects=True)
+            ),
+            sorted(
+                (i.id, i.bbox, i.object)
+                for i in idx.intersection(idx.bounds, objects=True)
+            ),
+        )
+
+    def test_to_bytes_no_objects(self) -> None:
+        idx = rtree.index.Index(interleaved=False)
+        idx.insert(1, (0, 2, 1, 3))
+        idx.insert(2, (4, 5, 4, 5))
+        restored = rtree.index.Index.from_bytes(idx.to_bytes())
+        self.assertFalse(restored.interleaved)
+        self.assertEqual(restored.bounds, idx.bounds)
+        self.assertEqual(list(restored.intersection((0, 2, 1, 3))), [1])
+
+        empty = rtree.index.Index.from_bytes(rtree.index.Index().to_bytes())
+        self.assertEqual(len(empty), 0)
+
+        with pytest.raises(RTreeError, match="not an index snapshot"):
+            rtree.index.Index.from_bytes(b"0" * 32)
+        with pytest.raises(RTreeError, match="truncated"):
+            rtree.index.Index.from_bytes(idx.to_bytes()[:-1])
+
     def test_property(self) -> None:
         p = rtree.index.Property()
         unpickled = pickle.loads(pickle.dumps(p))
@@ -234,6 +292,19 @@ class IndexContainer(IndexTestCase):
         # Test iter method
         assert objects[12] in set(container)
 
+        # Leaves
+        leaves = container.leaves()
+        assert {id(obj) for _, objs, _ in leaves for obj in objs} == set(
+            map(id, objects[5:])
+        )
+        ids, bounds, offsets, leaf_objects = container.leaves(as_arrays=True)
+        assert ids.tolist() == [leaf[0] for leaf in leaves]
+        assert bounds.tolist() == [leaf[2] for leaf in leaves]
+        assert [
+            list(leaf_objects[start:end])
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ] == [leaf[1] for leaf in leaves]
+
 
 class IndexIntersection(IndexTestCase):
     def test_intersection(self) -> None:
@@ -290,6 +361,41 @@ class IndexIntersection(IndexTestCase):
         with pytest.raises(ValueError, match="shapes not equal"):
             self.idx.intersection_v([0], [10, 12])
 
+    @skip_sidx_lt_210
+    def test_intersection_chunks(self) -> None:
+        rng = np.random.default_rng(0)
+        mins = rng.random((500, 2)) * 100
+        maxs = mins + 20
+        ids, counts = self.idx.intersection_v(mins, maxs)
+
+        for prefetch in (True, False):
+            chunks = list(
+                self.idx.intersection_chunks(
+                    mins, maxs, max_bytes=4096, prefetch=prefetch
+                )
+            )
+            assert len(chunks) > 1
+            assert [offset for offset, _, _ in chunks] == np.cumsum(
+                [0] + [len(c) for _, _, c in chunks[:-1]]
+            ).tolist()
+            assert np.concatenate([i for _, i, _ in chunks]).tolist() == ids.tolist()
+            assert np.concatenate([c for _, _, c in chunks]).tolist() == counts.tolist()
+
+        # a single query with more results than the budget allows
+        chunks = list(self.idx.intersection_chunks(mins[:3], maxs[:3], max_bytes=60))
+        assert [offset for offset, _, _ in chunks] == [0, 1, 2]
+        assert np.concatenate([i for _, i, _ in chunks]).tolist() == (
+            self.idx.intersection_v(mins[:3], maxs[:3])[0].tolist()
+        )
+
+        # an iterator of boxes
+        boxes = (np.concatenate([p, q]) for p, q in zip(mins, maxs))
+        chunks = list(self.idx.intersection_chunks(boxes, max_bytes=4096))
+        assert np.concatenate([i for _, i, _ in chunks]).tolist() == ids.tolist()
+
+        with pytest.raises(RTreeError, match="minimums more than maximums"):
+            list(self.idx.intersection_chunks([(1, 1, 0, 0)]))
+
 
 class TestIndexIntersectionUnion:
     @pytest.fixture(scope="class")
@@ -638,6 +744,14 @@ class IndexSerialization(unittest.TestCase):
             for L, E in zip(leaves, expected)
         )
 
+        ids, bounds, offsets, child_ids = idx.leaves(as_arrays=True)
+        self.assertEqual(ids.tolist(), [leaf[0] for leaf in leaves])
+        self.assertEqual(bounds.tolist(), [leaf[2] for leaf in leaves])
+        self.assertEqual(
+            [child_ids[a:b].tolist() for a, b in zip(offsets[:-1], offsets[1:])],
+            [leaf[1] for leaf in leaves],
+        )
+
         hits2 = sorted(list(idx.intersection((0, 60, 0, 60), objects=True)))
         self.assertEqual(len(hits2), 10)
         self.assertEqual(hits2[0].object, 42)
@@ -651,6 +765,186 @@ class IndexSerialization(unittest.TestCase):
         idx = index.Index(tname, overwrite=True)
         assert isinstance(idx, index.Index)
 
+    def test_rebuild(self) -> None:
+        """Disk indexes are rebuilt and reopened between queries"""
+        tname = tempfile.mktemp()
+        idx = index.Index(tname, self.boxes15_stream())
+        idx.flush()
+        assert not idx.reopen_if_changed()
+        # Files written by the index itself were not rebuilt
+        for name in idx._disk_files():
+            os.utime(name, ns=(0, 0))
+        assert not idx.reopen_if_changed()
+
+        n = len(self.boxes15)
+        stream = ((i + n, coords, None) for i, coords in enumerate(self.boxes15))
+        index.Index.rebuild(tname, stream)
+        assert sorted(idx.intersection((0, 0, 60, 60))) == [
+            0, 4, 16, 27, 35, 40, 47, 50, 76, 80
+        ]  # fmt: skip
+        assert idx.reopen_if_changed()
+        assert not idx.reopen_if_changed()
+        hits = sorted(idx.intersection((0, 0, 60, 60)))
+        assert hits == [i + n for i in [0, 4, 16, 27, 35, 40, 47, 50, 76, 80]]
+        leftovers = os.listdir(os.path.dirname(tname))
+        assert not [name for name in leftovers if ".rebuild" in name]
+        idx.close()
+
+        # The properties given are not changed
+        p = index.Property()
+        p.leaf_capacity = 50
+        before = p.as_dict()
+        index.Index.rebuild(tname, [(1, (0, 0, 1, 1), None)], properties=p)
+        assert p.as_dict() == before
+        idx = index.Index(tname)
+        assert len(idx) == 1
+        idx.close()
+
+    def test_len_saved(self) -> None:
+        """The number of entries of a disk index is kept with its files"""
+        tname = tempfile.mktemp()
+        n = len(self.boxes15)
+        idx = index.Index(tname, self.boxes15_stream())
+        assert len(idx) == n
+        idx.flush()
+        assert os.path.exists(tname + ".idx.size")
+        idx.insert(1000, (0, 0, 1, 1))
+        assert not os.path.exists(tname + ".idx.size")
+        idx.close()
+
+        idx = index.Index(tname)
+        assert idx._size == n + 1
+        idx.close()
+
+        # Not used once the files changed
+        os.utime(tname + ".dat", ns=(0, 0))
+        idx = index.Index(tname)
+        assert idx._size is None
+        assert len(idx) == n + 1
+        idx.close()
+
+        index.Index.rebuild(tname, [(1, (0, 0, 1, 1), None)])
+        idx = index.Index(tname)
+        assert len(idx) == 1
+        idx.close()
+
+    def test_len_saved_by_others(self) -> None:
+        """Only counts of the files as they are now are saved"""
+        tname = tempfile.mktemp()
+        n = len(self.boxes15)
+        writer = index.Index(tname, self.boxes15_stream())
+        writer.close()
+
+        # Files replaced by a rebuild
+        reader = index.Index(tname)
+        assert len(reader) == n
+        index.Index.rebuild(tname, [(i, (0, 0, 1, 1), None) for i in range(3)])
+        reader.close()
+        idx = index.Index(tname)
+        assert len(idx) == 3
+        idx.close()
+
+        # Files changed by another writer
+        reader = index.Index(tname)
+        assert len(reader) == 3
+        for name in reader._disk_files():
+            os.utime(name, ns=(0, 0))
+        reader.close()
+        idx = index.Index(tname)
+        assert idx._size is None
+        idx.close()
+
+    def test_rebuild_threads(self) -> None:
+        """Rebuilds of the same index from several threads do not collide"""
+        tname = tempfile.mktemp()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [
+                executor.submit(index.Index.rebuild, tname, self.boxes15_stream())
+                for _ in range(8)
+            ]
+            for future in futures:
+                future.result()
+        idx = index.Index(tname)
+        assert len(idx) == len(self.boxes15)
+        idx.close()
+        leftovers = os.listdir(os.path.dirname(tname))
+        assert not [name for name in leftovers if ".rebuild" in name]
+
+    def test_rebuild_in_progress(self) -> None:
+        """Reopening waits until both files of a rebuild are in place"""
+        tname = tempfile.mktemp()
+        idx = index.Index(tname, self.boxes15_stream())
+        idx.flush()
+        index.Index.rebuild(tname, [(1, (0, 0, 1, 1), None)])
+        os.utime(tname + ".dat")
+        assert not idx.reopen_if_changed()
+        assert len(idx) == len(self.boxes15)
+        os.utime(tname + ".dat", ns=(0, os.stat(tname + ".idx").st_mtime_ns))
+        assert idx.reopen_if_changed()
+        assert len(idx) == 1
+        idx.close()
+
+        with pytest.raises(RTreeError, match="Only disk indexes"):
+            index.Index().reopen_if_changed()
+
+    def test_warmup(self) -> None:
+        """Disk indexes read their data file ahead of queries"""
+        tname = tempfile.mktemp()
+        idx = index.Index(tname, self.boxes15_stream())
+        idx.close()
+
+        idx = index.Index(tname)
+        assert idx.warmup() == 0
+        assert idx.warmup("all") == os.path.getsize(tname + ".dat")
+        assert idx.warmup("all", max_bytes=100) == 100
+        assert idx.count((0, 0, 60, 60)) == 10
+        with pytest.raises(ValueError, match="unknown warmup level"):
+            idx.warmup("leaves")  # type: ignore[arg-type]
+        idx.close()
+
+    def test_batch(self) -> None:
+        """Batched changes of disk indexes are written once, or not at all"""
+        tname = tempfile.mktemp()
+        p = index.Property()
+        p.writethrough = True
+        p.buffering_capacity = 10
+        idx = index.Index(tname, properties=p)
+        with idx.batch(buffering_capacity=1000):
+            for i, coords in enumerate(self.boxes15):
+                idx.insert(i, coords)
+            idx.delete(0, self.boxes15[0])
+            assert idx.count((0, 0, 60, 60)) == 0
+        assert idx.count((0, 0, 60, 60)) == 9
+        assert idx.properties.writethrough
+        assert idx.properties.buffering_capacity == 10
+
+        with pytest.raises(ZeroDivisionError):
+            with idx.batch():
+                idx.delete(4, self.boxes15[4])
+                1 / 0
+        assert idx.count((0, 0, 60, 60)) == 9
+
+        with idx.batch():
+            with pytest.raises(RTreeError, match="minimums more than maximums"):
+                idx.insert(1000, (1, 1, 0, 0))
+            with pytest.raises(RTreeError, match="cannot be nested"):
+                with idx.batch():
+                    pass
+        idx.close()
+
+        idx = index.Index(tname)
+        assert len(idx) == len(self.boxes15) - 1
+        idx.close()
+
+        # Changes before one that fails to apply stay applied
+        idx = index.Index()
+        with pytest.raises(TypeError, match="pickle"):
+            with idx.batch():
+                idx.insert(1, (0, 0, 1, 1))
+                idx.insert(2, (0, 0, 1, 1), obj=threading.Lock())
+                idx.insert(3, (0, 0, 1, 1))
+        assert list(idx.intersection((0, 0, 1, 1))) == [1]
+
 
 class IndexNearest(IndexTestCase):
     def test_nearest_basic(self) -> None:
@@ -751,6 +1045,143 @@ class IndexNearest(IndexTestCase):
         self.assertEqual(hits, [(0, {"a": 42}), (1, {"a": 42})])
 
 
+class DeferredExecutor(Executor):
+    """Runs a submitted call only when asked to"""
+
+    def submit(self, fn, /, *args, **kwargs):  # type: ignore[override]
+        self.call = (fn, args, kwargs)
+        self.future: Future = Future()
+        return self.future
+
+    def run(self) -> None:
+        fn, args, kwargs = self.call
+        self.future.set_result(fn(*args, **kwargs))
+
+
+@skip_sidx_lt_210
+class TestIndexRepack:
+    @staticmethod
+    def churned() -> index.Index:
+        rng = np.random.default_rng(0)
+        mins = rng.random((5000, 2)) * 100
+        idx = index.Index()
+        for i, p in enumerate(mins):
+            idx.insert(i, (*p, *(p + 1)), obj=i)
+        for i, p in enumerate(mins[::2]):
+            idx.delete(2 * i, (*p, *(p + 1)))
+        return idx
+
+    def test_stats(self) -> None:
+        idx = self.churned()
+        stats = idx.stats()
+        sizes = [len(children) for _, children, _ in idx.leaves()]
+        assert stats["leaves"] == len(sizes)
+        assert stats["entries"] == len(idx) == 2500
+        assert stats["entries_min"] == min(sizes)
+        assert stats["entries_max"] == max(sizes)
+        assert stats["fill"] == pytest.approx(
+            np.mean(sizes) / idx.properties.leaf_capacity
+        )
+        assert 0 < stats["overlap_volume"] < stats["volume"]
+        assert 0 <= stats["dead_space"] < 1
+        assert stats["coverage"] > 1 - stats["dead_space"]
+
+        # Leaves of the unit squares at 0 and 1 and of the box between them
+        properties = index.Property(
+            leaf_capacity=4, index_capacity=4, near_minimum_overlap_factor=2
+        )
+        idx = index.Index(properties=properties)
+        boxes = [(0, 0, 1, 1)] * 3 + [(0.5, 0.5, 2, 2)] * 2 + [(1, 1, 2, 2)] * 3
+        for i, box in enumerate(boxes):
+            idx.insert(i, box)
+        stats = idx.stats()
+        assert (stats["leaves"], stats["entries_min"], stats["entries_max"]) == (
+            3,
+            2,
+            3,
+        )
+        assert stats["volume"] == 4.25
+        assert stats["overlap_volume"] == 1.25
+        assert stats["dead_space"] == 0.25
+
+        assert index.Index().stats()["entries"] == 0
+
+    def test_quality(self) -> None:
+        idx = self.churned()
+        quality = idx.quality()
+        assert quality["leaves"] == len(idx.leaves())
+        assert 0 < quality["fill"] <= 1
+        assert index.Index().quality()["leaves"] == 0
+
+        idx.repack().result()
+        assert idx.quality()["overlap"] < quality["overlap"]
+        assert len(idx) == 2500
+        assert list(idx.intersection(idx.bounds, objects="raw"))[:1] != [None]
+
+    def test_changes_during_repack(self) -> None:
+        idx = self.churned()
+        executor = DeferredExecutor()
+        future = idx.repack(executor)
+        with pytest.raises(RTreeError, match="already being repacked"):
+            idx.repack(executor)
+        idx.insert(10000, (200, 200, 201, 201), obj="new")
+        idx.delete(1, idx.leaves()[0][2])
+        hits = list(idx.intersection(idx.bounds))
+        executor.run()
+        assert future.done()
+        assert sorted(idx.intersection(idx.bounds)) == sorted(hits)
+        assert list(idx.nearest((200, 200), 1, objects="raw")) == ["new"]
+        assert idx._repack is None
+
+    def test_maintain(self) -> None:
+        idx = self.churned()
+        assert idx.maintain(min_fill=0, max_overlap=1) is None
+        future = idx.maintain(min_fill=1)
+        assert future is not None
+        assert idx.maintain(min_fill=1) is None
+        future.result()
+
+        with pytest.raises(NotImplementedError):
+            index.Index(tempfile.mktemp()).repack()
+
+
+class IndexScan(IndexTestCase):
+    def test_scan(self) -> None:
+        for i, coords in enumerate(self.boxes15[:10]):
+            self.idx.insert(100 + i, coords, obj=i)
+        chunks = list(self.idx.scan(chunk_size=32))
+        self.assertEqual([len(ids) for ids, _ in chunks], [32, 32, 32, 14])
+        ids = np.concatenate([ids for ids, _ in chunks])
+        bounds = np.concatenate([bounds for _, bounds in chunks])
+        self.assertEqual(
+            sorted(zip(ids.tolist(), map(tuple, bounds.tolist()))),
+            sorted(
+                (item.id, tuple(item.bbox))
+                for item in self.idx.intersection(self.idx.bounds, objects=True)
+            ),
+        )
+
+        # The entries of each leaf are next to each other
+        _, _, offsets, child_ids = self.idx.leaves(as_arrays=True)
+        leaf = np.empty(len(ids), dtype=np.int64)
+        leaf[child_ids] = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        self.assertEqual(np.count_nonzero(np.diff(leaf[ids])) + 1, len(offsets) - 1)
+
+        ids, bounds, offsets, data = self.idx.to_arrays(payloads=True)
+        self.assertEqual(len(ids), 110)
+        sizes = dict(zip(ids.tolist(), np.diff(offsets).tolist()))
+        self.assertEqual(sizes[5], 0)
+        i = ids.tolist().index(105)
+        self.assertEqual(self.idx.loads(data[offsets[i] : offsets[i + 1]]), 5)
+
+    def test_scan_empty(self) -> None:
+        idx = index.Index(properties=index.Property(dimension=3))
+        self.assertEqual(list(idx.scan()), [])
+        ids, bounds = idx.to_arrays()
+        self.assertEqual((ids.shape, bounds.shape), ((0,), (0, 6)))
+        self.assertRaises(ValueError, idx.scan, chunk_size=0)
+
+
 class IndexDelete(IndexTestCase):
     def test_deletion(self) -> None:
         """Test we can delete data from the index"""
@@ -765,6 +1196,58 @@ class IndexDelete(IndexTestCase):
         self.assertEqual(hits, [])
 
 
+class IndexQueryCache(IndexTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = index.QueryCache(max_entries=4)
+        self.idx.cache = self.cache
+
+    def test_hits(self) -> None:
+        box = (0, 0, 60, 60)
+        expected = list(self.idx.intersection(box))
+        self.assertEqual(list(self.idx.intersection(box)), expected)
+        self.assertEqual(self.idx.count(box), len(expected))
+        self.assertEqual(self.idx.count(box), len(expected))
+        nearest = list(self.idx.nearest((1, 1), 3))
+        self.assertEqual(list(self.idx.nearest((1, 1), 3)), nearest)
+        self.assertEqual((self.cache.hits, self.cache.misses), (3, 3))
+        self.assertEqual(self.cache.hit_rate, 0.5)
+
+        # Items are not cached
+        list(self.idx.intersection(box, objects=True))
+        self.assertEqual(self.cache.stats()["entries"], 3)
+
+    def test_invalidation(self) -> None:
+        box = (0, 0, 60, 60)
+        count = self.idx.count(box)
+        self.idx.insert(100, (1, 1, 2, 2))
+        self.assertEqual(self.idx.count(box), count + 1)
+        self.idx.delete(100, (1, 1, 2, 2))
+        self.assertEqual(self.idx.count(box), count)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.invalidations, 2)
+
+    def test_spatial(self) -> None:
+        self.idx.cache = cache = index.QueryCache(spatial=True)
+        list(self.idx.intersection((0, 0, 10, 10)))
+        list(self.idx.intersection((80, 80, 90, 90)))
+        list(self.idx.nearest((1, 1), 3))
+        self.idx.insert(100, (1, 1, 2, 2))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(list(self.idx.intersection((0, 0, 10, 10)))[-1], 100)
+        list(self.idx.intersection((80, 80, 90, 90)))
+        self.assertEqual(cache.hits, 1)
+
+    def test_eviction(self) -> None:
+        for i in range(6):
+            self.idx.count((i, i, i + 1, i + 1))
+        self.assertEqual(len(self.cache), 4)
+        self.assertEqual(self.cache.evictions, 2)
+
+        cache = pickle.loads(pickle.dumps(self.cache))
+        self.assertEqual((len(cache), cache.max_entries), (0, 4))
+
+
 class Index3d(IndexTestCase):
     """Test we make and query a 3D index"""
 
@@ -906,6 +1389,46 @@ class DictStorage(index.CustomStorage):
     """ Returns true if we contains some data """
 
 
+class ViewStorage(index.ZeroCopyStorage):
+    """A dictionary storage that receives and fills memoryviews"""
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def create(self, returnError):
+        pass
+
+    def destroy(self, returnError):
+        pass
+
+    def flush(self, returnError):
+        pass
+
+    def clear(self) -> None:
+        self.dict: dict = {}
+
+    def pageLength(self, page, returnError):
+        try:
+            return len(self.dict[page])
+        except KeyError:
+            returnError.contents.value = self.InvalidPageError
+
+    def loadByteArrayInto(self, page, buffer, returnError):
+        buffer[:] = self.dict[page]
+
+    def storeByteArray(self, page, data, returnError):
+        assert isinstance(data, memoryview) and data.readonly
+        if page == self.NewPage:
+            page = len(self.dict)
+        self.dict[page] = bytes(data)
+        return page
+
+    def deleteByteArray(self, page, returnError):
+        del self.dict[page]
+
+    hasData = property(lambda self: bool(self.dict))
+
+
 class IndexCustomStorage(unittest.TestCase):
     def test_custom_storage(self) -> None:
         """Custom index storage works as expected"""
@@ -964,3 +1487,25 @@ class IndexCustomStorage(unittest.TestCase):
         r2 = index.Index(storage, overwrite=False)
         count = r2.count((0, 0, 10, 10))
         self.assertEqual(count, 1)
+
+    def test_zero_copy_storage(self) -> None:
+        """Storages can fill and receive the C buffers directly"""
+        settings = index.Property()
+        settings.writethrough = True
+        settings.buffering_capacity = 1
+
+        storage = ViewStorage()
+        r1 = index.Index(storage, properties=settings)
+        for i, coords in enumerate(np.genfromtxt("boxes_15x15.data")):
+            r1.add(i, coords, obj=i)
+        hits = sorted(
+            cast(Iterator[int], r1.intersection((0, 0, 60, 60), objects="raw"))
+        )
+        del r1
+        self.assertTrue(storage.hasData)
+
+        r2 = index.Index(storage, overwrite=False)
+        r2_hits = cast(Iterator[int], r2.intersection((0, 0, 60, 60), objects="raw"))
+        self.assertEqual(sorted(r2_hits), hits)
+        error = ctypes.pointer(ctypes.c_int(0))
+        self.assertEqual(storage.loadByteArray(0, error), storage.dict[0])
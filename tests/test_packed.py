@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from operator import methodcaller
+
+import numpy as np
+import pytest
+
+from rtree import index
+from rtree.exceptions import RTreeError
+from rtree.packed import PackedIndex, SharedIndex
+
+from .common import boxes_fixture, skip_sidx_lt_210, split_csr
+
+boxes = boxes_fixture(3000, 3)
+
+
+@skip_sidx_lt_210
+class TestPackedIndex:
+    def test_intersection(self, boxes) -> None:
+        ref = index.Index(boxes, properties=index.Property(dimension=3))
+        packed = PackedIndex.write("boxes.rtp", *boxes, node_capacity=8)
+        assert len(packed) == len(ref)
+        assert packed.bounds == ref.bounds
+
+        rng = np.random.default_rng(1)
+        mins = rng.random((100, 3)) * 100
+        maxs = mins + 10
+        expected = ref.intersection_v(mins, maxs)
+        ids, counts = packed.intersection_v(mins, maxs)
+        assert counts.tolist() == expected[1].tolist()
+        assert split_csr(ids, counts) == split_csr(*expected)
+
+        box = tuple(mins[0]) + tuple(maxs[0])
+        assert sorted(packed.intersection(box)) == sorted(ref.intersection(box))
+        assert packed.count(box) == ref.count(box)
+        assert list(packed.intersection((-5, -5, -5, -1, -1, -1))) == []
+
+    def test_nearest(self, boxes) -> None:
+        ref = index.Index(boxes, properties=index.Property(dimension=3))
+        packed = PackedIndex.write("boxes.rtp", *boxes)
+        rng = np.random.default_rng(2)
+        for point in rng.random((50, 3)) * 100:
+            assert list(packed.nearest(point, 4)) == list(ref.nearest(point, 4))
+
+        # Equidistant entries are all returned
+        grid = PackedIndex.write(
+            "grid.rtp", [1, 2, 3], [[0, 1], [1, 0], [2, 2]], [[0, 1], [1, 0], [2, 2]]
+        )
+        assert sorted(grid.nearest((0, 0), 1)) == [1, 2]
+        with pytest.raises(ValueError, match="num_results"):
+            grid.nearest((0, 0), 0)
+
+    def test_objects(self) -> None:
+        idx = index.Index(interleaved=False)
+        idx.insert(1, (0, 1, 0, 1), obj={"a": 1})
+        idx.insert(2, (5, 6, 5, 6))
+        with PackedIndex.from_index("objects.rtp", idx) as packed:
+            assert not packed.interleaved
+            assert packed.bounds == idx.bounds
+            assert list(packed.intersection((0, 6, 0, 6), objects="raw")) == [
+                {"a": 1},
+                None,
+            ]
+            assert list(packed.nearest((6, 6), 1)) == [2]
+            with pytest.raises(NotImplementedError):
+                packed.intersection((0, 6, 0, 6), objects=True)
+
+        reopened = PackedIndex("objects.rtp", interleaved=False)
+        assert list(reopened.nearest((0, 0), 1, objects="raw")) == [{"a": 1}]
+
+    def test_errors(self, boxes) -> None:
+        ids, mins, maxs = boxes
+        with pytest.raises(ValueError, match="shapes not equal"):
+            PackedIndex.write("bad.rtp", ids, mins, maxs[:, :2])
+        with pytest.raises(ValueError, match="empty index"):
+            PackedIndex.write("bad.rtp", ids[:0], mins[:0], maxs[:0])
+        with pytest.raises(RTreeError, match="minimums more than maximums"):
+            PackedIndex.write("bad.rtp", ids, maxs, mins)
+
+        with open("bad.rtp", "wb") as f:
+            f.write(b"not a packed index")
+        with pytest.raises(RTreeError, match="not a packed index"):
+            PackedIndex("bad.rtp")
+
+        packed = PackedIndex.write("boxes.rtp", ids, mins, maxs)
+        with pytest.raises(RTreeError, match="3 or 6 values"):
+            packed.intersection((0, 0, 1, 1))
+
+
+@skip_sidx_lt_210
+class TestSharedIndex:
+    def test_publish(self, boxes) -> None:
+        ref = index.Index(boxes, properties=index.Property(dimension=3))
+        with SharedIndex.publish(ref) as shared:
+            attached = pickle.loads(pickle.dumps(shared))
+            assert attached.name == shared.name
+            assert len(attached) == len(ref)
+            box = (10, 10, 10, 30, 30, 30)
+            assert sorted(attached.intersection(box)) == sorted(ref.intersection(box))
+            assert list(attached.nearest((5, 5, 5), 3)) == list(
+                ref.nearest((5, 5, 5), 3)
+            )
+            attached.close()
+
+    def test_workers(self, boxes) -> None:
+        ref = index.Index(boxes, properties=index.Property(dimension=3))
+        box = (0, 0, 0, 50, 50, 50)
+        context = multiprocessing.get_context("spawn")
+        with SharedIndex.publish(ref) as shared:
+            with ProcessPoolExecutor(2, mp_context=context) as executor:
+                counts = executor.map(methodcaller("count", box), [shared] * 4)
+                assert list(counts) == [ref.count(box)] * 4
+
+    def test_unlink(self) -> None:
+        idx = index.Index()
+        idx.insert(1, (0, 0, 1, 1))
+        shared = SharedIndex.publish(idx)
+        shared.close()
+        shared.unlink()
+        with pytest.raises(FileNotFoundError):
+            SharedIndex(shared.name)
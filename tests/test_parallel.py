@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from rtree import index
+from rtree.parallel import PartitionedIndex, ShardedIndex
+
+from .common import boxes_fixture, skip_sidx_lt_210, split_csr
+
+boxes = boxes_fixture(2000)
+
+
+@skip_sidx_lt_210
+class TestShardedIndex:
+    @pytest.fixture(scope="class")
+    @classmethod
+    def sharded(cls, boxes):
+        with ShardedIndex(*boxes, shards=3) as idx:
+            yield idx
+
+    def test_partitions(self, boxes, sharded) -> None:
+        assert sharded.shards == 3
+        assert len(sharded) == len(boxes[0])
+        assert sharded.partition_mins.shape == sharded.partition_maxs.shape == (3, 2)
+
+    def test_intersection_v(self, boxes, sharded) -> None:
+        ref = index.Index(boxes)
+        rng = np.random.default_rng(1)
+        mins = rng.random((50, 2)) * 100
+        maxs = mins + 10
+        expected = ref.intersection_v(mins, maxs)
+        ids, counts = sharded.intersection_v(mins, maxs)
+        assert counts.tolist() == expected[1].tolist()
+        assert split_csr(ids, counts) == split_csr(*expected)
+        assert sharded.count_v(mins, maxs).tolist() == expected[1].tolist()
+
+    @pytest.mark.parametrize("strict", [False, True])
+    def test_nearest_v(self, boxes, sharded, strict) -> None:
+        ref = index.Index(boxes)
+        rng = np.random.default_rng(2)
+        points = rng.random((50, 2)) * 100
+        expected = ref.nearest_v(
+            points, points, num_results=4, strict=strict, return_max_dists=True
+        )
+        ids, counts, dists = sharded.nearest_v(
+            points, points, num_results=4, strict=strict, return_max_dists=True
+        )
+        assert counts.tolist() == expected[1].tolist()
+        assert split_csr(ids, counts) == split_csr(*expected[:2])
+        assert np.allclose(dists, expected[2])
+
+    def test_errors(self, boxes) -> None:
+        ids, mins, maxs = boxes
+        with pytest.raises(ValueError, match="shapes not equal"):
+            ShardedIndex(ids, mins, maxs[:, :1])
+        with pytest.raises(ValueError, match="empty index"):
+            ShardedIndex(ids[:0], mins[:0], maxs[:0])
+
+    def test_closed(self, boxes) -> None:
+        idx = ShardedIndex(*boxes, shards=2)
+        idx.close()
+        with pytest.raises(RuntimeError, match="closed"):
+            idx.intersection_v([[0, 0]], [[1, 1]])
+
+
+@skip_sidx_lt_210
+class TestPartitionedIndex:
+    def check_queries(self, boxes, idx) -> None:
+        ref = index.Index(boxes)
+        rng = np.random.default_rng(3)
+        mins = rng.random((50, 2)) * 100
+        maxs = mins + 10
+        expected = ref.intersection_v(mins, maxs)
+        ids, counts = idx.intersection_v(mins, maxs)
+        assert split_csr(ids, counts) == split_csr(*expected)
+        assert idx.count_v(mins, maxs).tolist() == expected[1].tolist()
+        assert sorted(idx.intersection((0, 0, 20, 20))) == sorted(
+            ref.intersection((0, 0, 20, 20))
+        )
+        assert idx.count((0, 0, 20, 20)) == ref.count((0, 0, 20, 20))
+
+        expected = ref.nearest_v(mins, mins, num_results=3)
+        ids, counts = idx.nearest_v(mins, mins, num_results=3)
+        assert split_csr(ids, counts) == split_csr(*expected)
+
+    def test_build_memory(self, boxes) -> None:
+        with ThreadPoolExecutor(2) as executor:
+            idx = PartitionedIndex.build(*boxes, partitions=4, executor=executor)
+        assert len(idx.indexes) == 4
+        assert len(idx) == len(boxes[0])
+        self.check_queries(boxes, idx)
+
+    def test_build_disk(self, boxes) -> None:
+        with ProcessPoolExecutor(2) as executor:
+            idx = PartitionedIndex.build(
+                *boxes, partitions=3, basename="parts", executor=executor
+            )
+        self.check_queries(boxes, idx)
+        idx.close()
+
+        # Reopened partitions recover their entries for kNN merging lazily
+        reopened = PartitionedIndex([index.Index(f"parts_{i}") for i in range(3)])
+        assert len(reopened) == len(boxes[0])
+        with ThreadPoolExecutor(2) as executor:
+            reopened.executor = executor
+            self.check_queries(boxes, reopened)
+
+    def test_errors(self, boxes) -> None:
+        with pytest.raises(ValueError, match="requires a basename"):
+            with ProcessPoolExecutor(1) as executor:
+                PartitionedIndex.build(*boxes, executor=executor)
+        with pytest.raises(ValueError, match="at least one"):
+            PartitionedIndex([])
@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import ctypes
+import lzma
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+from rtree import index
+from rtree.exceptions import RTreeError
+from rtree.storage import (
+    CachedStorage,
+    CompressedStorage,
+    IOStatsStorage,
+    MmapStorage,
+    SQLiteStorage,
+)
+
+from .test_index import DictStorage
+
+
+class CountingStorage(DictStorage):
+    """A dictionary storage that counts the calls into it"""
+
+    def clear(self) -> None:
+        super().clear()
+        self.loads = 0
+        self.stores = 0
+
+    def flush(self, returnError):
+        pass
+
+    def loadByteArray(self, page, returnError):
+        self.loads += 1
+        return super().loadByteArray(page, returnError)
+
+    def storeByteArray(self, page, data, returnError):
+        self.stores += 1
+        return super().storeByteArray(page, data, returnError)
+
+
+def fill(idx: index.Index, n: int = 2000) -> None:
+    rng = np.random.default_rng(0)
+    for i, mins in enumerate(rng.random((n, 2)) * 100):
+        idx.insert(i, (*mins, *(mins + 1)))
+
+
+def unbuffered() -> index.Property:
+    # Send every page access to the storage
+    properties = index.Property()
+    properties.buffering_capacity = 1
+    properties.writethrough = True
+    return properties
+
+
+class TestCachedStorage:
+    def test_hits(self) -> None:
+        inner = CountingStorage()
+        storage = CachedStorage(inner)
+        idx = index.Index(storage, properties=unbuffered())
+        fill(idx)
+        for _ in range(10):
+            assert idx.count((0, 0, 50, 50)) > 0
+        assert inner.loads == storage.misses == 0
+        assert storage.hits > 0
+        assert storage.hit_rate == 1.0
+
+    def test_write_back(self) -> None:
+        inner = CountingStorage()
+        storage = CachedStorage(inner)
+        idx = index.Index(storage, properties=unbuffered())
+        fill(idx)
+        # Only new pages were written through
+        assert inner.stores == len(inner.dict)
+        assert storage.stats()["dirty"] > 0
+        idx.flush()
+        assert storage.stats()["dirty"] == 0
+        assert inner.dict == dict(storage._pages)
+
+    def test_eviction(self) -> None:
+        inner = CountingStorage()
+        storage = CachedStorage(inner, max_bytes=8192)
+        idx = index.Index(storage, properties=unbuffered())
+        fill(idx)
+        assert storage.nbytes <= 8192
+        assert storage.evictions > 0
+        assert storage.writebacks > 0
+        assert inner.loads == storage.misses > 0
+        idx.flush()
+        del idx
+
+        # The inner storage holds the whole index
+        reopened = index.Index(storage.inner, overwrite=False)
+        assert reopened.count((0, 0, 101, 101)) == 2000
+
+    def test_clear(self) -> None:
+        storage = CachedStorage(CountingStorage())
+        assert not storage.hasData
+        fill(index.Index(storage), 10)
+        assert storage.hasData
+        storage.clear()
+        assert not storage.hasData
+        assert storage.stats()["pages"] == 0
+
+        with pytest.raises(ValueError, match="max_bytes"):
+            CachedStorage(CountingStorage(), max_bytes=0)
+
+
+class TestMmapStorage:
+    def test_reopen(self) -> None:
+        storage = MmapStorage("pages.rtm", initial_size=4096)
+        assert not storage.hasData
+        idx = index.Index(storage, properties=unbuffered())
+        fill(idx)
+        idx.insert(5000, (1, 1, 2, 2), obj={"a": 1})
+        assert os.path.getsize("pages.rtm") > 4096
+        idx.close()
+        storage.close()
+
+        storage = MmapStorage("pages.rtm")
+        assert storage.hasData
+        idx = index.Index(storage)
+        assert idx.count((0, 0, 101, 101)) == 2001
+        assert list(idx.intersection((1.5, 1.5, 1.5, 1.5), objects="raw")) == [{"a": 1}]
+        idx.close()
+        storage.close()
+
+    def test_directory(self) -> None:
+        with MmapStorage("pages.rtm") as storage:
+            idx = index.Index(storage, properties=unbuffered())
+            fill(idx, 10)
+            storage.flush()
+            offset, length = storage._directory
+            # The directory in use is not overwritten by the next one
+            storage.flush()
+            assert storage._directory[0] != offset
+            assert storage._directory[1] == length
+            storage.flush()
+            assert storage._directory[0] == offset
+            idx.close()
+
+    def test_reopen_reuse(self) -> None:
+        with MmapStorage("pages.rtm") as storage:
+            idx = index.Index(storage, properties=unbuffered())
+            fill(idx)
+            idx.close()
+        ends = []
+        for _ in range(20):
+            # Regions freed before the file was closed are reused
+            with MmapStorage("pages.rtm") as storage:
+                idx = index.Index(storage, properties=unbuffered())
+                idx.insert(5000, (0, 0, 1, 1))
+                idx.delete(5000, (0, 0, 1, 1))
+                idx.close()
+                ends.append(storage._end)
+        assert len(set(ends)) == 1
+        with MmapStorage("pages.rtm") as storage:
+            idx = index.Index(storage)
+            assert idx.count((0, 0, 101, 101)) == 2000
+            idx.close()
+
+    def test_page_reuse(self) -> None:
+        with MmapStorage("pages.rtm") as storage:
+            self.check_page_reuse(storage)
+
+    def check_page_reuse(self, storage: MmapStorage) -> None:
+        idx = index.Index(storage, properties=unbuffered())
+        rng = np.random.default_rng(0)
+        boxes = rng.random((500, 2)) * 100
+        for _ in range(3):
+            for i, mins in enumerate(boxes):
+                idx.insert(i, (*mins, *(mins + 1)))
+            for i, mins in enumerate(boxes):
+                idx.delete(i, (*mins, *(mins + 1)))
+            size = storage._end
+        # Deleted pages and regions are recycled, so the file stops growing
+        for i, mins in enumerate(boxes):
+            idx.insert(i, (*mins, *(mins + 1)))
+        assert storage._end == size
+        assert idx.count((0, 0, 101, 101)) == 500
+
+    def test_cached(self) -> None:
+        pages = MmapStorage("pages.rtm")
+        storage = CachedStorage(pages, max_bytes=4096)
+        idx = index.Index(storage, properties=unbuffered())
+        fill(idx)
+        idx.close()
+        pages.close()
+
+        with MmapStorage("pages.rtm") as inner:
+            idx = index.Index(inner)
+            assert idx.count((0, 0, 101, 101)) == 2000
+            idx.close()
+
+    def test_errors(self) -> None:
+        with open("pages.rtm", "wb") as f:
+            f.write(b"not pages" * 10)
+        with pytest.raises(RTreeError, match="not a page storage file"):
+            MmapStorage("pages.rtm")
+
+
+class TestSQLiteStorage:
+    def test_reopen(self) -> None:
+        with SQLiteStorage("pages.db") as storage:
+            assert not storage.hasData
+            idx = index.Index(storage)
+            fill(idx)
+            # Writes are grouped in one transaction until the index flushes
+            assert storage.connection.in_transaction
+            idx.close()
+            assert not storage.connection.in_transaction
+
+        with SQLiteStorage("pages.db") as storage:
+            assert storage.hasData
+            idx = index.Index(storage)
+            assert idx.count((0, 0, 101, 101)) == 2000
+            idx.insert(2000, (0, 0, 1, 1))
+            assert idx.count((0, 0, 101, 101)) == 2001
+            idx.close()
+
+    def test_several_indexes(self) -> None:
+        connection = sqlite3.connect("app.db")
+        connection.execute("CREATE TABLE roads (id INTEGER PRIMARY KEY)")
+        first = SQLiteStorage(connection, name="first")
+        second = SQLiteStorage(connection, name="second")
+        a = index.Index(first)
+        fill(a, 10)
+        b = index.Index(second)
+        fill(b, 20)
+        a.close()
+        b.close()
+        first.close()
+        second.close()
+
+        # The connection stays open for the application
+        connection.execute("INSERT INTO roads VALUES (1)")
+        a = index.Index(SQLiteStorage(connection, name="first"))
+        b = index.Index(SQLiteStorage(connection, name="second"))
+        assert a.count((0, 0, 101, 101)) == 10
+        assert b.count((0, 0, 101, 101)) == 20
+        a.close()
+        b.close()
+        connection.close()
+
+    def test_errors(self) -> None:
+        with pytest.raises(ValueError, match="invalid table name"):
+            SQLiteStorage(":memory:", table="pages; DROP TABLE x")
+
+
+class TestCompressedStorage:
+    def test_roundtrip(self) -> None:
+        inner = CountingStorage()
+        storage = CompressedStorage(inner)
+        idx = index.Index(storage, properties=unbuffered())
+        for i in range(500):
+            idx.insert(i, (i, i, i + 1, i + 1), obj={"name": f"feature {i}"})
+        assert storage.ratio > 1.5
+        assert storage.stats()["stored_bytes"] < storage.stats()["raw_bytes"]
+        assert sum(map(len, inner.dict.values())) < storage.raw_bytes
+        idx.close()
+
+        idx = index.Index(CompressedStorage(inner))
+        assert list(idx.intersection((10.5, 10.5, 10.5, 10.5), objects="raw")) == [
+            {"name": "feature 10"}
+        ]
+
+    def test_codec(self) -> None:
+        with MmapStorage("pages.rtm") as inner:
+            compressed = CompressedStorage(inner, codec=lzma)
+            idx = index.Index(CachedStorage(compressed))
+            fill(idx)
+            idx.close()
+            assert compressed.ratio > 1
+
+        with MmapStorage("pages.rtm") as inner:
+            idx = index.Index(CompressedStorage(inner, codec=lzma))
+            assert idx.count((0, 0, 101, 101)) == 2000
+            idx.close()
+
+    def test_incompressible(self) -> None:
+        inner = CountingStorage()
+        storage = CompressedStorage(inner)
+        error = ctypes.pointer(ctypes.c_int(0))
+        data = os.urandom(100)
+        page = storage.storeByteArray(storage.NewPage, data, error)
+        assert len(inner.dict[page]) == 101
+        assert storage.loadByteArray(page, error) == data
+
+
+class TestIOStatsStorage:
+    def test_counts(self) -> None:
+        inner = CountingStorage()
+        storage = IOStatsStorage(inner)
+        idx = index.Index(storage, properties=unbuffered())
+        fill(idx)
+        assert storage.stores == inner.stores
+        assert storage.bytes_written > 0
+
+        storage.reset_stats()
+        assert idx.count((0, 0, 50, 50)) > 0
+        stats = storage.stats()
+        assert stats["loads"] > 0
+        assert stats["bytes_read"] > 0
+        assert stats["stores"] == stats["deletes"] == 0
+        assert stats["seconds"] > 0
+
+        idx.delete(0, idx.get_bounds())
+        idx.flush()
+        assert storage.stats()["flushes"] == 1
+
+    def test_buffering(self) -> None:
+        # A larger buffer answers repeated queries without reaching storage
+        with MmapStorage("pages.rtm") as inner:
+            storage = IOStatsStorage(inner)
+            idx = index.Index(storage)
+            fill(idx)
+            idx.close()
+            storage.reset_stats()
+
+            properties = index.Property()
+            properties.buffering_capacity = 1000
+            idx = index.Index(storage, properties=properties)
+            for _ in range(5):
+                assert idx.count((0, 0, 101, 101)) == 2000
+            loads = storage.loads
+            assert loads > 0
+            for _ in range(5):
+                idx.count((0, 0, 101, 101))
+            assert storage.loads == loads
+            idx.close()
+
+
+def test_warmup() -> None:
+    inner = CountingStorage()
+    properties = index.Property()
+    properties.buffering_capacity = 1000
+    idx = index.Index(inner, properties=properties)
+    fill(idx, 20000)
+    idx.close()
+
+    idx = index.Index(inner)
+    inner.loads = 0
+    idx.warmup("all")
+    assert inner.loads >= len(inner.dict) - 1
+
+    idx = index.Index(inner, properties=properties)
+    inner.loads = 0
+    idx.count((50, 50, 50, 50))
+    cold = inner.loads
+
+    idx = index.Index(inner, properties=properties)
+    inner.loads = 0
+    idx.warmup()
+    loaded = inner.loads
+    assert 0 < loaded < len(inner.dict) / 2
+    # The nodes above the leaves are buffered
+    idx.count((50, 50, 50, 50))
+    assert inner.loads - loaded < cold
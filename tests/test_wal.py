@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from rtree import index
+from rtree.exceptions import RTreeError
+from rtree.wal import DurableIndex
+
+
+def boxes(n: int) -> np.ndarray:
+    mins = np.random.default_rng(0).random((n, 2)) * 100
+    return np.hstack([mins, mins + 1])
+
+
+def test_recovery(tmp_path) -> None:
+    directory = str(tmp_path / "wal")
+    with DurableIndex(directory, commit_every=64) as idx:
+        for i, box in enumerate(boxes(1000)):
+            idx.insert(i, box, obj={"i": i})
+        with idx.batch():
+            for i, box in enumerate(boxes(100)):
+                idx.delete(i, box)
+
+    with DurableIndex(directory) as idx:
+        assert len(idx) == 900
+        hits = idx.intersection(tuple(boxes(101)[100]), objects="raw")
+        assert {"i": 100} in list(hits)
+
+
+def test_crash(tmp_path) -> None:
+    directory = str(tmp_path / "wal")
+    idx = DurableIndex(directory, commit_every=10)
+    for i, box in enumerate(boxes(25)):
+        idx.insert(i, box)
+    # Lose the changes that were not committed
+    idx._log.close()
+    with open(os.path.join(directory, "log"), "ab") as f:
+        f.write(b"\x01\x02\x03 torn record")
+
+    with DurableIndex(directory, commit_every=10) as idx:
+        assert len(idx) == 20
+        idx.insert(20, boxes(21)[20])
+        idx.commit()
+    with DurableIndex(directory) as idx:
+        assert len(idx) == 21
+
+
+def test_checkpoint(tmp_path) -> None:
+    directory = str(tmp_path / "wal")
+    log = os.path.join(directory, "log")
+    with DurableIndex(directory, commit_every=100, checkpoint_bytes=2**14) as idx:
+        for i, box in enumerate(boxes(1000)):
+            idx.insert(i, box)
+        assert os.path.exists(os.path.join(directory, "checkpoint"))
+        assert os.path.getsize(log) <= 2**14
+
+        # A crash after the checkpoint is written but before the log is
+        # emptied does not apply the logged changes twice.
+        idx.delete(0, boxes(1)[0])
+        idx.commit()
+        with open(log, "rb") as f:
+            tail = f.read()
+        idx.checkpoint()
+    with open(log, "wb") as f:
+        f.write(tail)
+
+    with DurableIndex(directory) as idx:
+        assert len(idx) == 999
+
+
+def test_properties(tmp_path) -> None:
+    directory = str(tmp_path / "wal")
+    properties = index.Property(dimension=3)
+    with DurableIndex(
+        directory, checkpoint_bytes=0, properties=properties, interleaved=False
+    ) as idx:
+        idx.insert(1, (0, 1, 0, 1, 0, 1))
+        idx.commit()
+
+    with DurableIndex(directory) as idx:
+        assert idx.properties.dimension == 3
+        assert not idx.interleaved
+        assert list(idx.intersection((0, 2, 0, 2, 0, 2))) == [1]
+
+    with pytest.raises(ValueError, match="commit_every"):
+        DurableIndex(directory, commit_every=0)
+
+
+def test_checkpoint_on_change(tmp_path) -> None:
+    directory = str(tmp_path / "wal")
+    with DurableIndex(directory, commit_every=1, checkpoint_bytes=2000) as idx:
+        for i, box in enumerate(boxes(200)):
+            idx.insert(i, box)
+        for i, box in enumerate(boxes(50)):
+            idx.delete(i, box)
+        # Nothing is pending, so this does not start a checkpoint
+        checkpoint = os.stat(os.path.join(directory, "checkpoint"))
+        idx.commit()
+        assert os.stat(os.path.join(directory, "checkpoint")) == checkpoint
+
+    with DurableIndex(directory) as idx:
+        assert len(idx) == 150
+        assert sorted(idx.intersection((-1, -1, 102, 102))) == list(range(50, 200))
+
+
+def test_pickle(tmp_path) -> None:
+    with DurableIndex(str(tmp_path / "wal")) as idx:
+        idx.insert(1, (0, 0, 1, 1))
+        with pytest.raises(RTreeError, match="cannot be pickled"):
+            pickle.dumps(idx)